@@ -1,15 +1,18 @@
 import logging, os, sys
-from tkinter import *
-from tkinter import messagebox
 
 from dotenv import load_dotenv
 
-from poltergust.controllers.ghostinfos_controller import PoltergustController
-from poltergust.models.ct_storage import MK8CTStorage
-from poltergust.views.main_view import PoltergustMainView
+from poltergust import cli
+from poltergust.benchmark import FIRST_WINDOW, PARSED_GHOST, is_benchmarking, record_startup_event
 
 
 if __name__ == '__main__':
+    # Worker processes of frozen (PyInstaller) executables must not rerun the application.
+    # multiprocessing is only needed by some commands, so it is not imported otherwise
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+
     # Load environment variables
     load_dotenv(".env")
 
@@ -30,6 +33,15 @@ if __name__ == '__main__':
         **logging_config
     )
 
+    # Headless commands never initialise the UI
+    if len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS:
+        sys.exit(cli.main(sys.argv[1:]))
+
+    from tkinter import Tk, messagebox
+
+    from poltergust.controllers.ghostinfos_controller import PoltergustController
+    from poltergust.views.main_view import PoltergustMainView
+
     # Pass unhandled exceptions to logger
     def on_unhandled_exception_base(exctype, exc, tb):
         logging.error("An unhandled exception occurred.", exc_info=(exctype, exc, tb))
@@ -57,11 +69,22 @@ if __name__ == '__main__':
     # Create and display the UI
     view = PoltergustMainView(root)
     controller = PoltergustController(view)
+    if is_benchmarking():
+        root.update()
+        record_startup_event(FIRST_WINDOW)
 
     # Immediately open file if passed in
     if len(sys.argv) == 2:
         # Replace \ by / path separators (for Windows)
         controller.open_ghostfile(sys.argv[1].replace("\\", "/"))
+        if is_benchmarking():
+            root.update()
+            record_startup_event(PARSED_GHOST)
+
+    if is_benchmarking():
+        # Started up; that's all the startup benchmark measures
+        root.destroy()
+        sys.exit(0)
 
     logging.info("Starting Poltergust")
     root.mainloop()
@@ -0,0 +1,194 @@
+"""
+    Startup benchmark. Starts Poltergust a number of times and measures how long it takes until its window is
+    shown, and until a ghost file passed to it is shown. Poltergust records when it reaches these points in a
+    file named by `STARTUP_EVENTS_ENV`, and exits right after.
+"""
+from dataclasses import dataclass, field
+import json
+import os
+import sys
+import time
+
+# Set for Poltergust processes started by the benchmark: the file to record startup events in
+STARTUP_EVENTS_ENV = "POLTERGUST_STARTUP_EVENTS"
+
+# Startup events
+FIRST_WINDOW = "first_window"
+PARSED_GHOST = "parsed_ghost"
+
+
+def is_benchmarking() -> bool:
+    """ Checks whether Poltergust was started by the startup benchmark """
+    return bool(os.getenv(STARTUP_EVENTS_ENV))
+
+def record_startup_event(event: str) -> None:
+    """ Records that Poltergust reached a point during startup, if it was started by the startup benchmark """
+    path = os.getenv(STARTUP_EVENTS_ENV)
+    if path:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'event': event, 'time': time.time()}) + "\n")
+
+
+@dataclass
+class PoltergustStartupRun:
+    """ Seconds from starting Poltergust until each startup event, or the reason it failed to start """
+    events: dict[str, float] = field(default_factory=dict)
+    error: str|None = None
+
+@dataclass
+class PoltergustStartupReport:
+    """ Outcome of the startup benchmark """
+    cold: PoltergustStartupRun
+    warm: list[PoltergustStartupRun]
+    # Median time of each measurement, e.g. "warm-window"
+    timings: dict[str, float] = field(default_factory=dict)
+    # (measurement, time, budget) of measurements that took longer than their budget
+    exceeded: list[tuple[str, float, float]] = field(default_factory=list)
+    # (module, cumulative import time in seconds) of the slowest top-level imports of a warm start
+    slowest_imports: list[tuple[str, float]] = field(default_factory=list)
+    # Modules of rarely used features that were imported during startup anyway
+    eager_modules: list[str] = field(default_factory=list)
+
+    @property
+    def errors(self) -> list[str]:
+        """ Reasons Poltergust failed to start, for each start that failed """
+        return [run.error for run in [self.cold, *self.warm] if run.error is not None]
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.errors or self.exceeded or self.eager_modules)
+
+    def summary(self) -> str:
+        """ Human-readable summary of the benchmark """
+        lines = [f"{name}: {timing * 1000:.0f} ms" for name, timing in self.timings.items()]
+        lines += [f"Over budget: {name} took {timing * 1000:.0f} ms, budget is {budget * 1000:.0f} ms" for name, timing, budget in self.exceeded]
+        lines += [f"Imported at startup: {module}" for module in self.eager_modules]
+        lines += [f"Failed to start: {error}" for error in dict.fromkeys(self.errors)]
+        if self.slowest_imports:
+            lines.append("Slowest imports (warm):")
+            lines += [f"  {timing * 1000:7.1f} ms  {module}" for module, timing in self.slowest_imports]
+        return "\n".join(lines)
+
+
+class PoltergustStartupBenchmark:
+    """
+        Measures the time from starting Poltergust until its window is shown, and until a ghost file passed
+        to it is shown. The first start is cold: without any compiled bytecode, as right after installing.
+        The other starts are warm, and their median is compared against the budget. One extra warm start
+        runs with `-X importtime` to find the slowest imports, and modules that should not be imported yet.
+    """
+    SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "poltergust.py")
+
+    # Maximum seconds for each measurement
+    BUDGETS = {
+        "cold-window": 3.0,
+        "cold-ghost": 3.5,
+        "warm-window": 1.0,
+        "warm-ghost": 1.5,
+    }
+
+    # Modules that are only imported once the features they belong to are used
+    LAZY_MODULES = (
+        "multiprocessing",
+        "requests",
+        "poltergust.parsers.downloader",
+        "poltergust.parsers.bulk_converter",
+        "poltergust.controllers.ctlist_controllers",
+        "poltergust.controllers.ct_downloader",
+        "poltergust.controllers.track_change",
+        "poltergust.views.ct_list_view",
+        "poltergust.views.ct_add_view",
+        "poltergust.views.track_change_view",
+        "poltergust.views.about_view",
+    )
+
+    NUM_SLOWEST_IMPORTS = 10
+
+    # Seconds after which a start is considered to hang, e.g. on a messagebox
+    TIMEOUT = 60
+
+    def __init__(self, num_warm_runs: int = 5, budgets: dict[str, float]|None = None, script_path: str|None = None) -> None:
+        self.num_warm_runs = max(1, num_warm_runs)
+        self.budgets = {**self.BUDGETS, **(budgets or {})}
+        self.script_path = script_path or self.SCRIPT_PATH
+
+    def run(self, ghostfile: str|None = None) -> PoltergustStartupReport:
+        """ Runs the benchmark, opening the given ghost file on each start (if any) """
+        import statistics
+        import tempfile
+
+        # Poltergust is started from its own folder
+        ghostfile = os.path.abspath(ghostfile) if ghostfile is not None else None
+        with tempfile.TemporaryDirectory(prefix="poltergust-benchmark-") as pycache:
+            # Compiled bytecode goes to an empty folder, so the first start has to compile everything
+            env = {**os.environ, 'PYTHONPYCACHEPREFIX': pycache}
+            cold, _ = self._start(env, ghostfile)
+            warm = [self._start(env, ghostfile)[0] for _ in range(self.num_warm_runs)]
+            _, importtime = self._start(env, ghostfile, importtime=True)
+
+        report = PoltergustStartupReport(cold, warm)
+        measurements = {"window": FIRST_WINDOW}
+        if ghostfile is not None:
+            measurements["ghost"] = PARSED_GHOST
+        for name, event in measurements.items():
+            for kind, runs in (("cold", [cold]), ("warm", warm)):
+                timings = [run.events[event] for run in runs if event in run.events]
+                if timings:
+                    report.timings[f"{kind}-{name}"] = statistics.median(timings)
+
+        for name, timing in report.timings.items():
+            budget = self.budgets.get(name)
+            if budget is not None and timing > budget:
+                report.exceeded.append((name, timing, budget))
+
+        imports = self._parse_importtime(importtime)
+        report.slowest_imports = sorted(((module, timing) for module, timing, depth in imports if depth == 0),
+                                        key=lambda item: item[1], reverse=True)[:self.NUM_SLOWEST_IMPORTS]
+        imported = {module for module, _, _ in imports}
+        report.eager_modules = [module for module in self.LAZY_MODULES if module in imported]
+        return report
+
+    def _start(self, env: dict[str, str], ghostfile: str|None, importtime: bool = False) -> tuple[PoltergustStartupRun, str]:
+        """ Starts Poltergust until it has shown its window (and the ghost file). Returns its timings and stderr """
+        import subprocess
+        import tempfile
+
+        run = PoltergustStartupRun()
+        with tempfile.TemporaryDirectory(prefix="poltergust-events-") as folder:
+            events_path = os.path.join(folder, "events.jsonl")
+            # Log errors to stderr, and don't block on an error message
+            env = {**env, STARTUP_EVENTS_ENV: events_path, 'LOGFILE': "", 'MESSAGEBOX_ON_ERROR': "0"}
+            args = [sys.executable, *(["-X", "importtime"] if importtime else []), self.script_path, *([ghostfile] if ghostfile is not None else [])]
+
+            started_at = time.time()
+            try:
+                process = subprocess.run(args, env=env, cwd=os.path.dirname(self.script_path), stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, encoding='utf-8', errors='replace', timeout=self.TIMEOUT)
+            except subprocess.TimeoutExpired:
+                run.error = f"No response after {self.TIMEOUT} seconds."
+                return run, ""
+
+            if os.path.exists(events_path):
+                with open(events_path, encoding='utf-8') as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        run.events[entry['event']] = entry['time'] - started_at
+
+        if process.returncode != 0 or FIRST_WINDOW not in run.events:
+            output = [line for line in process.stderr.splitlines() if line.strip() and not line.startswith("import time:")]
+            run.error = f"Exited with code {process.returncode}" + (f": {output[-1].strip()}" if output else ".")
+        return run, process.stderr
+
+    def _parse_importtime(self, output: str) -> list[tuple[str, float, int]]:
+        """ Parses the output of `-X importtime` into (module, cumulative seconds, depth) """
+        imports = []
+        for line in output.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            try:
+                _, cumulative, name = line[len("import time:"):].split("|")
+                imports.append((name.strip(), int(cumulative) / 1000000, (len(name) - len(name.lstrip()) - 1) // 2))
+            except ValueError:
+                # Header
+                continue
+        return imports
@@ -0,0 +1,185 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import TextIO
+
+
+def scan(args: argparse.Namespace) -> int:
+    """ Scans a directory tree for ghost files and outputs one JSON record per ghost file """
+    if args.output == "-":
+        return _scan(args, sys.stdout)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        return _scan(args, output)
+
+def _scan(args: argparse.Namespace, output: TextIO) -> int:
+    if args.index:
+        from poltergust.models.ghost_index import MK8GhostIndex
+
+        index = MK8GhostIndex()
+        result = index.rescan(args.directory, max_workers=args.jobs)
+        logging.info(f"Updated ghost index for {args.directory}: {result.num_updated} parsed, {result.num_unchanged} unchanged, {result.num_removed} removed")
+        for record in index.get_ghosts(args.directory):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return 0
+
+    from poltergust.parsers.ghost_scanner import MK8GhostScanner
+
+    num_scanned = MK8GhostScanner(max_workers=args.jobs).scan_to_jsonl(args.directory, output)
+    logging.info(f"Scanned {num_scanned} ghost files in {args.directory}")
+    return 0
+
+
+def convert(args: argparse.Namespace) -> int:
+    """ Converts all ghosts in a directory tree to staff or downloaded ghosts """
+    from poltergust.models.game_models import MK8GhostType
+    from poltergust.parsers.bulk_converter import MK8GhostBulkConverter
+
+    target_ghost_type = MK8GhostType.STAFF_GHOST if args.to == "staff" else MK8GhostType.DOWNLOADED_GHOST
+    os.makedirs(args.output, exist_ok=True)
+    report = MK8GhostBulkConverter(max_workers=args.jobs).convert_folder(args.directory, args.output, target_ghost_type)
+    print(report.summary(max_lines=len(report.skipped) + len(report.failed)))
+    return 1 if report.failed else 0
+
+
+def relink(args: argparse.Namespace) -> int:
+    """ Relinks all selected ghosts in a directory tree to another track slot and/or custom track """
+    from poltergust.parsers.relinker import MK8GhostRelinker, MK8GhostRelinkSelector, MK8GhostRelinkTarget
+
+    selector = MK8GhostRelinkSelector(args.course, args.mod_site, args.mod_id, args.mod_version)
+    target = MK8GhostRelinkTarget(args.new_course, args.new_mod_site, args.new_mod_id, args.new_mod_version)
+    if target == MK8GhostRelinkTarget():
+        logging.error("Nothing to relink to; pass at least one of the --new-* options.")
+        return 2
+
+    report = MK8GhostRelinker(max_workers=args.jobs, journal_path=args.journal).relink_folder(args.directory, selector, target)
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def sync_mods(args: argparse.Namespace) -> int:
+    """ Downloads the information and preview images of all stored mods again """
+    from datetime import timedelta
+    from poltergust.parsers.mod_sync import MK8ModSyncJob
+
+    job = MK8ModSyncJob(requests_per_second=args.rate, cache_ttl=timedelta(hours=args.max_age))
+    report = job.run(restart=args.restart)
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def previews(args: argparse.Namespace) -> int:
+    """ Adds all cached preview images to the preview atlas, and optionally compacts it """
+    from poltergust.models.preview_cache import MK8PreviewCache
+
+    cache = MK8PreviewCache()
+    num_imported = cache.import_previews()
+    print(f"Added {num_imported} preview image(s) to the preview atlas.")
+    if args.compact:
+        cache.compact()
+    return 0
+
+def build_sprites(args: argparse.Namespace) -> int:
+    """ Slices all icon atlases into sprites at the sizes they are shown at """
+    from poltergust.models.imagemapper import ICON_ATLAS_MAPPERS
+    from poltergust.models.sprite_cache import MK8SpriteCache
+
+    cache = MK8SpriteCache()
+    try:
+        cache.build([mapper() for mapper in ICON_ATLAS_MAPPERS])
+    except OSError as e:
+        logging.error(f"Could not write sprites to {cache.path}: {e}")
+        return 1
+    print(f"Wrote sprites to {cache.path}.")
+    return 0
+
+def benchmark_startup(args: argparse.Namespace) -> int:
+    """ Measures how long Poltergust takes to start, and fails if that exceeds the budget """
+    from poltergust.benchmark import PoltergustStartupBenchmark
+
+    report = PoltergustStartupBenchmark(num_warm_runs=args.runs, budgets=dict(args.budget)).run(args.ghostfile)
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def _mod_version(value: str):
+    """ Parses a mod version such as 1.2 or 1.2.3 """
+    from poltergust.models.mod_models import MK8ModVersion
+
+    try:
+        return MK8ModVersion(*map(int, value.split(".")))
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid mod version: '{value}'")
+
+def _budget(value: str) -> tuple[str, float]:
+    """ Parses a budget such as warm-window=0.8 """
+    from poltergust.benchmark import PoltergustStartupBenchmark
+
+    name, _, seconds = value.partition("=")
+    try:
+        if name not in PoltergustStartupBenchmark.BUDGETS:
+            raise ValueError
+        return name, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid budget: '{value}' (expected one of {', '.join(PoltergustStartupBenchmark.BUDGETS)}=SECONDS)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """ Builds the parser for Poltergust's command-line commands """
+    parser = argparse.ArgumentParser(prog="poltergust", description="Mario Kart 8 Ghost Data visualization, extraction, and conversion tool.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="Parse all ghost files in a directory (tree) and output them as JSON Lines.")
+    scan_parser.add_argument("directory", help="Directory to (recursively) search for ghost files.")
+    scan_parser.add_argument("-o", "--output", default="-", help="File to write the JSON Lines to. Defaults to stdout.")
+    scan_parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes. Defaults to the number of processors.")
+    scan_parser.add_argument("-i", "--index", action="store_true", help="Keep the results in the ghost index, and only parse ghost files that changed since the last scan.")
+    scan_parser.set_defaults(func=scan)
+
+    convert_parser = subparsers.add_parser("convert", help="Convert all ghosts in a directory (tree) to staff or downloaded ghosts.")
+    convert_parser.add_argument("directory", help="Directory to (recursively) search for ghost files.")
+    convert_parser.add_argument("output", help="Directory to write the converted ghosts to.")
+    convert_parser.add_argument("--to", choices=("staff", "downloaded"), required=True, help="Ghost type to convert to.")
+    convert_parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker threads.")
+    convert_parser.set_defaults(func=convert)
+
+    relink_parser = subparsers.add_parser("relink", help="Link all selected ghosts in a directory (tree) to another track slot and/or custom track.")
+    relink_parser.add_argument("directory", help="Directory to (recursively) search for ghost files.")
+    relink_parser.add_argument("--course", type=int, help="Only relink ghosts on this track slot (course ID).")
+    relink_parser.add_argument("--mod-site", type=int, help="Only relink ghosts linked to a custom track on this mod site.")
+    relink_parser.add_argument("--mod-id", type=int, help="Only relink ghosts linked to this custom track (0 selects ghosts without one).")
+    relink_parser.add_argument("--mod-version", type=_mod_version, help="Only relink ghosts linked to this version of their custom track.")
+    relink_parser.add_argument("--new-course", type=int, help="Track slot (course ID) to link the ghosts to.")
+    relink_parser.add_argument("--new-mod-site", type=int, help="Mod site of the custom track to link the ghosts to.")
+    relink_parser.add_argument("--new-mod-id", type=int, help="Custom track to link the ghosts to (0 unlinks them).")
+    relink_parser.add_argument("--new-mod-version", type=_mod_version, help="Custom track version to link the ghosts to.")
+    relink_parser.add_argument("--journal", default=None, help="Journal to keep progress in, so an interrupted relink can be resumed.")
+    relink_parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker threads.")
+    relink_parser.set_defaults(func=relink)
+
+    sync_parser = subparsers.add_parser("sync-mods", help="Download the information and preview images of all stored custom tracks again.")
+    sync_parser.add_argument("--rate", type=float, default=None, help="Maximum number of requests per second to each mod site.")
+    sync_parser.add_argument("--max-age", type=float, default=0, help="Skip mods that were checked less than this many hours ago.")
+    sync_parser.add_argument("--restart", action="store_true", help="Start from the first mod, instead of continuing an interrupted synchronization.")
+    sync_parser.set_defaults(func=sync_mods)
+
+    previews_parser = subparsers.add_parser("previews", help="Add the cached preview images of custom tracks to the preview atlas.")
+    previews_parser.add_argument("--compact", action="store_true", help="Also rewrite the preview atlas without replaced preview images.")
+    previews_parser.set_defaults(func=previews)
+
+    sprites_parser = subparsers.add_parser("build-sprites", help="Slice the icon atlases into the sprite cache, so they don't have to be loaded at startup.")
+    sprites_parser.set_defaults(func=build_sprites)
+
+    benchmark_parser = subparsers.add_parser("benchmark-startup", help="Measure how long Poltergust takes to show its window (and a ghost file), and fail if that exceeds the budget.")
+    benchmark_parser.add_argument("ghostfile", nargs="?", default=None, help="Ghost file to open on each start. Should not be linked to an unknown custom track, which would prompt to download it.")
+    benchmark_parser.add_argument("--runs", type=int, default=5, help="Number of warm starts, after the cold start.")
+    benchmark_parser.add_argument("--budget", type=_budget, action="append", default=[], help="Maximum seconds for a measurement, e.g. warm-window=0.8. Can be given multiple times.")
+    benchmark_parser.set_defaults(func=benchmark_startup)
+
+    return parser
+
+# Commands that can be run without a UI
+COMMANDS = ("scan", "convert", "relink", "sync-mods", "previews", "build-sprites", "benchmark-startup")
+
+def main(argv: list[str]) -> int:
+    """ Runs a command-line command, and returns its exit code """
+    args = build_parser().parse_args(argv)
+    return args.func(args)
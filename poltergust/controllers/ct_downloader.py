@@ -37,11 +37,7 @@ class CTDownloaderController(Observable[MK8CustomTrack]):
             :raise: ModDownloadException if the download could not be completed
         """
         mod = self._downloader.download_from_url(url)
-        if mod.preview_image is not None:
-            # Download image
-            preview_path = self._db.MOD_PREVIEW_PATH % {'mod_id': mod.mod_id, 'mod_site_id': mod.mod_site.id}
-            self._downloader.download_preview_image(mod.preview_image, preview_path)
-            mod.preview_image = preview_path
+        self._downloader.download_mod_preview_image(mod)
 
         # Add downloaded info to the db
         self._db.add_or_update_mod(mod)
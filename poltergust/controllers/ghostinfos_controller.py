@@ -2,19 +2,14 @@ import logging
 import os
 from tkinter import *
 from tkinter import messagebox
-from poltergust.controllers.ctlist_controllers import CTListController, CTListDownloaderController
-from poltergust.controllers.track_change import TrackChangeController
 from poltergust.models.ct_storage import MK8CTStorage
-from poltergust.models.mod_models import MK8ModVersion
-from poltergust.parsers.downloader import MK8CustomTrack
+from poltergust.models.mod_models import MK8CustomTrack, MK8ModVersion
 
 from poltergust.models.game_models import UNKNOWN_COURSE, MK8Course, MK8GhostType
 from poltergust.parsers.filecontent_parser import MK8GhostData, MK8GhostDataParser, MK8GhostDataSerializer
 from poltergust.parsers.filename_parser import MK8GhostFilenameData, MK8GhostFilenameParser, MK8GhostFilenameSerializer
 from poltergust.parsers.ghost_converter import MK8GhostConverter
 from poltergust.parsers.mii_handler import MK8GhostFilenameDataMiiHandler
-from poltergust.views.track_change_view import PoltergustChangeTrackView
-from poltergust.views.ct_list_view import TrackListManagerView
 from poltergust.views.main_view import PoltergustMainView
 
 
@@ -38,10 +33,13 @@ class PoltergustController:
         self._view.menu_export.entryconfig(self._view.BTN_EXPORT_AS_STAFF_GHOST, command=self.export_as_staff)
         for slot in range(16):
             self._view.menu_export_download.entryconfig(self._view.BTN_DOWNLOADED_GHOST_SLOT_PREFIX+str(slot), command=lambda bound_slot=slot: self.export_as_downloaded(bound_slot))
+        self._view.menu_export.entryconfig(self._view.BTN_BULK_EXPORT_AS_STAFF_GHOSTS, command=lambda: self.bulk_export(MK8GhostType.STAFF_GHOST))
+        self._view.menu_export.entryconfig(self._view.BTN_BULK_EXPORT_AS_DOWNLOADED_GHOSTS, command=lambda: self.bulk_export(MK8GhostType.DOWNLOADED_GHOST))
 
         # Setup Edit callbacks
         # self.view.menu_edit.entryconfig(self.view.BTN_REPLACE_MII, command=self.replace_mii)
         self._view.menu_edit.entryconfig(self._view.BTN_CHANGE_TRACK, command=self.open_ct_changer)
+        self._view.menu_edit.entryconfig(self._view.BTN_RETRY_CT_DOWNLOAD, command=self.retry_ct_download)
 
         # CT Manager
         self._view.menubar.entryconfig(self._view.BTN_CT_MANAGER, command=self.open_ct_manager)
@@ -78,6 +76,7 @@ class PoltergustController:
         self._view.menu_export.entryconfig(self._view.BTN_EXTRACT_MII, state=DISABLED)
         # self.view.menu_edit.entryconfig(self.view.BTN_REPLACE_MII, state=DISABLED)
         self._view.menu_edit.entryconfig(self._view.BTN_CHANGE_TRACK, state=DISABLED)
+        self._view.menu_edit.entryconfig(self._view.BTN_RETRY_CT_DOWNLOAD, state=DISABLED)
         self._view.lb_ghostfile.config(text="No ghost data loaded")
 
         # Remove Preview
@@ -85,6 +84,10 @@ class PoltergustController:
 
     def open_ct_changer(self):
         """ Initialises the popup that allows assigning a different track slot or custom track to the loaded ghost """
+        # Rarely used, so only imported when opened. This keeps them (and the downloader) out of startup
+        from poltergust.controllers.track_change import TrackChangeController
+        from poltergust.views.track_change_view import PoltergustChangeTrackView
+
         current_track_slot = self.ghost_data.track_slot
         current_ct = self.ghost_data.mod
         current_mod_version = self.ghost_data.mod_version
@@ -122,9 +125,20 @@ class PoltergustController:
         # Update view (reloads from disk)
         self.update()
 
+    def retry_ct_download(self):
+        """ Downloads the info of the loaded ghost's custom track again, after downloading it failed recently """
+        mod = self.ghost_data.mod
+        if MK8GhostDataParser().retry_download_modinfos(mod.mod_id, mod.mod_site.id) is not None:
+            # Update view (reloads from disk)
+            self.update()
+
     def open_ct_manager(self):
         """ Initialises the custom track manager """
-        ctmanager_view = TrackListManagerView(self._view.root, self._db.get_mods())
+        from poltergust.controllers.ctlist_controllers import CTListDownloaderController
+        from poltergust.views.ct_list_view import TrackListManagerView
+
+        # Mods are looked up in the database as the user searches
+        ctmanager_view = TrackListManagerView(self._view.root, [], search_provider=self._db.search_mods)
         CTListDownloaderController(ctmanager_view)
 
     def parse_filename(self, filepath: str):
@@ -143,7 +157,7 @@ class PoltergustController:
             # Operation cancelled
             return
 
-        handler = MK8GhostFilenameDataMiiHandler(self.ghostfile, self.ghost_data.has_header)
+        handler = MK8GhostFilenameDataMiiHandler(self.ghostfile, self.ghost_data.has_header, raw_data=self.ghost_data.raw)
 
         try:
             handler.extract(filepath)
@@ -213,6 +227,34 @@ class PoltergustController:
 
         messagebox.showinfo("Downloaded Ghost Exported", f"Downloaded Ghost data was exported successfully! It can be found under {output_file}")
 
+    def bulk_export(self, target_ghost_type: MK8GhostType) -> None:
+        """ Converts all ghosts in a folder to the given ghost type """
+        from poltergust.parsers.bulk_converter import MK8GhostBulkConverter
+
+        source_folder = self._view.select_bulk_conversion_source_folder()
+        if not source_folder:
+            # Operation cancelled
+            return
+        if target_ghost_type == MK8GhostType.STAFF_GHOST:
+            output_folder = self._view.select_conversion_staff_output_folder()
+        else:
+            output_folder = self._view.select_conversion_download_output_folder()
+        if not output_folder:
+            # Operation cancelled
+            return
+
+        self._view.root.config(cursor="watch")
+        self._view.root.update_idletasks()
+        try:
+            report = MK8GhostBulkConverter().convert_folder(source_folder, output_folder, target_ghost_type)
+        finally:
+            self._view.root.config(cursor="")
+
+        if report.failed:
+            messagebox.showwarning("Ghosts Converted", report.summary(), parent=self._view.root)
+        else:
+            messagebox.showinfo("Ghosts Converted", report.summary(), parent=self._view.root)
+
     def update(self):
         """ Updates the UI contents based on the loaded ghostfile """
         assert self.ghostfile is not None
@@ -268,7 +310,12 @@ class PoltergustController:
             track = UNKNOWN_COURSE
 
         mod = self.ghost_data.mod
-        self._view.set_track(track, mod, self.ghost_data.mod_version)
+        lookup_failure = None
+        if mod is not None and self._db.find_mod(mod.mod_id, mod.mod_site.id) is None:
+            # Downloading this custom track's info failed recently. Show why, and allow retrying
+            lookup_failure = self._db.find_mod_lookup_failure(mod.mod_id, mod.mod_site.id)
+        self._view.menu_edit.entryconfig(self._view.BTN_RETRY_CT_DOWNLOAD, state=DISABLED if lookup_failure is None else NORMAL)
+        self._view.set_track(track, mod, self.ghost_data.mod_version, lookup_failure=lookup_failure)
 
         # Update text
         self._view.playername.set(self.filename_data.playername)
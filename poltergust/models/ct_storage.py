@@ -1,41 +1,185 @@
-from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 import os
 import sqlite3
-from typing import Iterable
-from poltergust.models.mod_sites import MK8ModSite
+import threading
+from typing import Iterable, Iterator
+import weakref
 
-from poltergust.parsers.downloader import API_MOD_SITES, MK8CustomTrack
+from poltergust.models.mod_models import MK8CustomTrack
+from poltergust.models.mod_sites import API_MOD_SITES
 from poltergust.utils import Singleton
 
 
+@dataclass
+class MK8HTTPCacheEntry:
+    """ Validators of a previously downloaded URL, used to only download it again if it changed """
+    url: str
+    etag: str|None
+    last_modified: str|None
+    checked_at: datetime
+    # Mod the response belonged to (for mod information)
+    mod_site_id: int|None = None
+    mod_id: int|None = None
+
+
+class _MK8ThreadSentinel:
+    """ Kept in a thread's local storage, which is cleared when the thread exits """
+
+
 class MK8CTStorage(metaclass=Singleton):
-    """ Stores Custom Track information on disc """
+    """
+        Stores Custom Track information on disc. Each thread gets its own database connection, so mods can be
+        read and stored from worker threads. A thread's connection is closed once the thread exits. SQLite
+        serializes writes: a thread that starts a transaction blocks other writers (also in other processes)
+        until it commits, so transactions should be committed right away. Other threads can keep reading.
+    """
     CACHE_PATH = "cache"
     DB_NAME = "modinfos.db"
 
+    # Seconds to wait for a write lock held by another process before giving up
+    BUSY_TIMEOUT = 30.0
+
+    # Time during which a mod that could not be downloaded is not looked up again
+    MOD_LOOKUP_FAILURE_TTL = timedelta(days=7)
+    # Same, for failures that may be resolved by trying again (e.g. timeouts)
+    MOD_LOOKUP_TEMPORARY_FAILURE_TTL = timedelta(hours=1)
+
     MOD_PREVIEW_FILENAME = "preview_%(mod_site_id)s_%(mod_id)s.jpeg"
     MOD_PREVIEW_PATH = os.path.join(CACHE_PATH, MOD_PREVIEW_FILENAME)
 
+    # Schema changes, in order. A database at schema version N has had the first N migrations applied
+    MIGRATIONS = [
+        # 1: Mods (Poltergust 2.0.0)
+        ['''CREATE TABLE IF NOT EXISTS mods
+               (id integer not null, mod_site integer not null, name text, author text, last_updated_at text, primary key (id, mod_site))'''],
+        # 2: Conditional requests for downloads
+        ['''CREATE TABLE IF NOT EXISTS http_cache
+               (url text primary key, etag text, last_modified text, checked_at text not null, mod_site integer, mod_id integer)'''],
+        # 3: Mods that could not be downloaded
+        ['''CREATE TABLE IF NOT EXISTS mod_lookup_failures
+               (id integer not null, mod_site integer not null, reason text, expires_at text not null, primary key (id, mod_site))'''],
+        # 4: Full-text search over the names and authors of mods, kept up to date by triggers
+        ['''CREATE VIRTUAL TABLE IF NOT EXISTS mods_fts USING fts5
+               (name, author, content='mods', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')''',
+         '''CREATE TRIGGER IF NOT EXISTS mods_fts_insert AFTER INSERT ON mods BEGIN
+               INSERT INTO mods_fts (rowid, name, author) VALUES (new.rowid, new.name, new.author);
+           END''',
+         '''CREATE TRIGGER IF NOT EXISTS mods_fts_delete AFTER DELETE ON mods BEGIN
+               INSERT INTO mods_fts (mods_fts, rowid, name, author) VALUES ('delete', old.rowid, old.name, old.author);
+           END''',
+         '''CREATE TRIGGER IF NOT EXISTS mods_fts_update AFTER UPDATE ON mods BEGIN
+               INSERT INTO mods_fts (mods_fts, rowid, name, author) VALUES ('delete', old.rowid, old.name, old.author);
+               INSERT INTO mods_fts (rowid, name, author) VALUES (new.rowid, new.name, new.author);
+           END''',
+         '''INSERT INTO mods_fts (mods_fts) VALUES ('rebuild')'''],
+        # 5: Location of the preview thumbnails of each preview image in the preview atlas
+        ['''CREATE TABLE IF NOT EXISTS preview_atlas
+               (path text primary key, offset integer not null, mtime_ns integer not null)'''],
+    ]
+
+    # Inserts a mod, or updates it in place. Unlike INSERT OR REPLACE, this fires the update trigger of the search index
+    UPSERT_MOD = '''INSERT INTO mods (id, mod_site, author, name, last_updated_at) VALUES (:mod_id, :mod_site, :author, :name, :last_updated_at)
+                    ON CONFLICT (id, mod_site) DO UPDATE SET author = excluded.author, name = excluded.name, last_updated_at = excluded.last_updated_at'''
+
     def __init__(self):
-        # Connect with cache
         os.makedirs(self.CACHE_PATH, exist_ok=True)
-        path = os.path.join(self.CACHE_PATH, self.DB_NAME)
-        self.connection = sqlite3.connect(path)
+        self.path = os.path.join(self.CACHE_PATH, self.DB_NAME)
+
+        self._local = threading.local()
+        # All connections that were opened, so they can be closed again
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        # Connect with cache. Readers don't block the writer (and vice versa), so this only needs to be set once
+        self.connection.execute('''PRAGMA journal_mode=WAL''')
 
         # Create tables
-        self.connection.execute('''CREATE TABLE IF NOT EXISTS poltergust (key text unique, value text)''')
-        self.connection.execute('''INSERT OR REPLACE INTO poltergust VALUES ('version', '2.0.0')''')
-        self.connection.commit()
-        self.connection.execute('''CREATE TABLE IF NOT EXISTS mods
-               (id integer not null, mod_site integer not null, name text, author text, last_updated_at text, primary key (id, mod_site))''')
+        with self._write():
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS poltergust (key text unique, value text)''')
+            self.connection.execute('''INSERT OR REPLACE INTO poltergust VALUES ('version', '2.0.0')''')
+            self.connection.commit()
+        self.migrate()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """ The database connection of the current thread """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Only used by this thread, but close_connection may close it from another one
+            connection = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+            # Commits don't wait for the disc
+            connection.execute('''PRAGMA synchronous=NORMAL''')
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+
+            # Close the connection once the thread exits (e.g. the workers of a finished thread pool)
+            self._local.sentinel = _MK8ThreadSentinel()
+            weakref.finalize(self._local.sentinel, self._close, connection)
+        return connection
+
+    def _close(self, connection: sqlite3.Connection) -> None:
+        """ Closes the connection of a thread """
+        with self._connections_lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        connection.close()
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """
+            Writes to the database with the connection of the current thread. Writes of other connections wait
+            (up to BUSY_TIMEOUT) until its transaction ends, so it should be committed before e.g. downloading.
+        """
+        yield self.connection
+
+    @contextmanager
+    def exclusive(self) -> Iterator[sqlite3.Connection]:
+        """
+            Holds the write lock of the database, also against other processes, until the end of the block, and
+            commits at the end. Keeps files that are indexed in the database consistent with it. Can be nested.
+        """
+        with self._write():
+            if getattr(self._local, "exclusive", False):
+                yield self.connection
+                return
+
+            # Changes made before are committed first; a transaction can't be started within another one
+            self.connection.commit()
+            self.connection.execute('''BEGIN IMMEDIATE''')
+            self._local.exclusive = True
+            try:
+                with self.connection:
+                    yield self.connection
+            finally:
+                self._local.exclusive = False
+
+    def get_schema_version(self) -> int:
+        """ Gets the number of migrations that were applied to the database """
+        return int(self.get_value('schema_version') or 0)
+
+    def migrate(self) -> None:
+        """ Applies all migrations that were not yet applied to the database, each in its own transaction """
+        for schema_version in range(self.get_schema_version(), len(self.MIGRATIONS)):
+            with self._write(), self.connection:
+                for statement in self.MIGRATIONS[schema_version]:
+                    self.connection.execute(statement)
+                self.set_value('schema_version', str(schema_version + 1))
 
     def close_connection(self):
-        """ Closes the database connection """
-        self.connection.close()
+        """ Closes the database connections of all threads """
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
 
     def commit(self):
-        """ Saves any changes made by add or delete functions """
-        self.connection.commit()
+        """ Saves any changes made by add or delete functions (of the current thread) """
+        with self._write():
+            self.connection.commit()
 
     def get_mods(self) -> Iterable[MK8CustomTrack]:
         """ Gets an iterable of mods from the database """
@@ -46,6 +190,22 @@ class MK8CTStorage(metaclass=Singleton):
         preview_image = self.MOD_PREVIEW_PATH % {'mod_id': mod_id, 'mod_site_id': mod_site_id}
         return MK8CustomTrack(name, API_MOD_SITES[mod_site_id], mod_id, author, preview_image)
 
+    def search_mods(self, query: str, limit: int|None = None, offset: int = 0) -> list[MK8CustomTrack]:
+        """
+            Finds the mods whose name or author contain words starting with each word of the query, best matches first.
+            An empty query matches all mods, ordered by name.
+        """
+        # Quote each word, so characters like '-' and '"' are not interpreted as FTS5 syntax
+        terms = ['"' + word.replace('"', '""') + '"*' for word in query.split()]
+        parameters = {"limit": -1 if limit is None else limit, "offset": offset}
+        if terms:
+            parameters["match"] = " ".join(terms)
+            rows = self.connection.execute('''SELECT mods.id, mods.name, mods.author, mods.mod_site FROM mods_fts JOIN mods ON mods.rowid = mods_fts.rowid
+                                              WHERE mods_fts MATCH :match ORDER BY mods_fts.rank, mods.name LIMIT :limit OFFSET :offset''', parameters)
+        else:
+            rows = self.connection.execute('SELECT id, name, author, mod_site FROM mods ORDER BY name LIMIT :limit OFFSET :offset', parameters)
+        return [self._get_mod_from_db_infos(mod_id, name, author, mod_site_id) for mod_id, name, author, mod_site_id in rows]
+
     def find_mod(self, mod_id: int, mod_site_id: int) -> MK8CustomTrack|None:
         """ Finds a mod from the given mod site with the given mod_id, or None if no such mod exists """
         for mod_id, name, author, mod_site_id in self.connection.execute('SELECT id, name, author, mod_site FROM mods WHERE id = :mod_id AND mod_site = :mod_site_id', {
@@ -58,13 +218,126 @@ class MK8CTStorage(metaclass=Singleton):
 
     def add_or_update_mod(self, mod: MK8CustomTrack) -> None:
         """ Adds a mod to the database, or updates it if a mod with the given mod_id and mod_site already exists """
-        self.connection.execute('''INSERT OR REPLACE INTO mods (id, mod_site, author, name, last_updated_at) VALUES (:mod_id, :mod_site, :author, :name, :last_updated_at)''', {
+        with self._write():
+            self.connection.execute(self.UPSERT_MOD, {
+                "mod_id": mod.mod_id,
+                "mod_site": mod.mod_site.id,
+                "author": mod.author,
+                "name": mod.name,
+                "last_updated_at": datetime.now().isoformat()
+            })
+            self.remove_mod_lookup_failure(mod.mod_id, mod.mod_site.id)
+
+    def add_or_update_mods(self, mods: Iterable[MK8CustomTrack]) -> None:
+        """ Adds or updates many mods at once, in a single transaction """
+        now = datetime.now().isoformat()
+        rows = [{
             "mod_id": mod.mod_id,
             "mod_site": mod.mod_site.id,
             "author": mod.author,
             "name": mod.name,
-            "last_updated_at": datetime.now().isoformat()
-        })
+            "last_updated_at": now
+        } for mod in mods]
+
+        with self._write(), self.connection:
+            self.connection.executemany(self.UPSERT_MOD, rows)
+            self.connection.executemany('DELETE FROM mod_lookup_failures WHERE id = :mod_id AND mod_site = :mod_site', rows)
+
+    def find_mod_lookup_failure(self, mod_id: int, mod_site_id: int) -> str|None:
+        """ Gets the reason a mod could not be downloaded recently, or None if it should be looked up """
+        for reason, expires_at in self.connection.execute('SELECT reason, expires_at FROM mod_lookup_failures WHERE id = :mod_id AND mod_site = :mod_site_id', {
+                    "mod_id": mod_id,
+                    "mod_site_id": mod_site_id
+                }):
+            if datetime.fromisoformat(expires_at) > datetime.now():
+                return reason
+        return None
+
+    def add_mod_lookup_failure(self, mod_id: int, mod_site_id: int, reason: str, temporary: bool = False) -> None:
+        """ Records that a mod could not be downloaded, so it is not looked up again until the failure expires """
+        ttl = self.MOD_LOOKUP_TEMPORARY_FAILURE_TTL if temporary else self.MOD_LOOKUP_FAILURE_TTL
+        with self._write():
+            self.connection.execute('''INSERT OR REPLACE INTO mod_lookup_failures (id, mod_site, reason, expires_at) VALUES (:mod_id, :mod_site, :reason, :expires_at)''', {
+                "mod_id": mod_id,
+                "mod_site": mod_site_id,
+                "reason": reason,
+                "expires_at": (datetime.now() + ttl).isoformat()
+            })
+
+    def remove_mod_lookup_failure(self, mod_id: int, mod_site_id: int) -> None:
+        """ Forgets that a mod could not be downloaded """
+        with self._write():
+            self.connection.execute('DELETE FROM mod_lookup_failures WHERE id = :mod_id AND mod_site = :mod_site_id', {
+                "mod_id": mod_id,
+                "mod_site_id": mod_site_id
+            })
+
+    def get_value(self, key: str) -> str|None:
+        """ Gets a value stored by Poltergust itself (e.g. the progress of a background job), or None if it was not set """
+        for value, in self.connection.execute('SELECT value FROM poltergust WHERE key = :key', {"key": key}):
+            return value
+        return None
+
+    def set_value(self, key: str, value: str|None) -> None:
+        """ Stores a value for Poltergust itself, or removes it if `value` is None """
+        with self._write():
+            if value is None:
+                self.connection.execute('DELETE FROM poltergust WHERE key = :key', {"key": key})
+            else:
+                self.connection.execute('INSERT OR REPLACE INTO poltergust (key, value) VALUES (:key, :value)', {"key": key, "value": value})
+
+    def get_preview_atlas_entry(self, preview_path: str) -> tuple[int, int, int]|None:
+        """
+            Gets the offset of the thumbnails of a preview image in the preview atlas, the mtime of the preview image
+            they were made from, and the generation of the atlas file the offset is in
+        """
+        for offset, mtime_ns, generation in self.connection.execute(
+                '''SELECT offset, mtime_ns, (SELECT value FROM poltergust WHERE key = 'preview_atlas_generation') FROM preview_atlas WHERE path = :path''', {"path": preview_path}):
+            return offset, mtime_ns, int(generation or 0)
+        return None
+
+    def get_preview_atlas_entries(self) -> list[tuple[str, int, int]]:
+        """ Gets the path, offset and mtime of all preview images in the preview atlas, ordered by offset """
+        return self.connection.execute('SELECT path, offset, mtime_ns FROM preview_atlas ORDER BY offset').fetchall()
+
+    def count_preview_atlas_entries(self) -> int:
+        """ Gets the number of preview images in the preview atlas """
+        return self.connection.execute('SELECT count(*) FROM preview_atlas').fetchone()[0]
+
+    def set_preview_atlas_entry(self, preview_path: str, offset: int, mtime_ns: int) -> None:
+        """ Stores where the thumbnails of a preview image are in the preview atlas """
+        with self._write():
+            self.connection.execute('''INSERT OR REPLACE INTO preview_atlas (path, offset, mtime_ns) VALUES (:path, :offset, :mtime_ns)''', {
+                "path": preview_path,
+                "offset": offset,
+                "mtime_ns": mtime_ns
+            })
+
+    def replace_preview_atlas_entries(self, entries: Iterable[tuple[str, int, int]], generation: int) -> None:
+        """ Replaces the whole index of the preview atlas (path, offset, mtime) at once, e.g. after compacting it into a new file """
+        with self._write():
+            self.connection.execute('DELETE FROM preview_atlas')
+            self.connection.executemany('INSERT INTO preview_atlas (path, offset, mtime_ns) VALUES (?, ?, ?)', entries)
+            self.set_value('preview_atlas_generation', str(generation))
+
+    def get_http_cache_entry(self, url: str) -> MK8HTTPCacheEntry|None:
+        """ Gets the validators of a previously downloaded URL, or None if it was not downloaded before """
+        for url, etag, last_modified, checked_at, mod_site_id, mod_id in self.connection.execute(
+                'SELECT url, etag, last_modified, checked_at, mod_site, mod_id FROM http_cache WHERE url = :url', {"url": url}):
+            return MK8HTTPCacheEntry(url, etag, last_modified, datetime.fromisoformat(checked_at), mod_site_id, mod_id)
+        return None
+
+    def set_http_cache_entry(self, entry: MK8HTTPCacheEntry) -> None:
+        """ Stores the validators of a downloaded URL """
+        with self._write():
+            self.connection.execute('''INSERT OR REPLACE INTO http_cache (url, etag, last_modified, checked_at, mod_site, mod_id) VALUES (:url, :etag, :last_modified, :checked_at, :mod_site, :mod_id)''', {
+                "url": entry.url,
+                "etag": entry.etag,
+                "last_modified": entry.last_modified,
+                "checked_at": entry.checked_at.isoformat(),
+                "mod_site": entry.mod_site_id,
+                "mod_id": entry.mod_id
+            })
 
 if __name__ == "__main__":
     x = MK8CTStorage()
@@ -0,0 +1,39 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from tkinter import Toplevel
+
+    from poltergust.widgets.trackframes import MK8TrackFrameBig, MK8TrackFrameSmall
+
+
+class FramableTrack(ABC):
+    """ Abstract class to make a track a FramableTrack """
+    TRACK_PREVIEW_SIZE: tuple[int, int] = (96, 54)
+
+    _sort_field_name: str = None
+
+    @property
+    def sort_field(self) -> str:
+        """ The name of the class's field that should be used for sorting and searching purposes """
+        return getattr(self, self._sort_field_name)
+
+    @abstractmethod
+    def get_frame_args(self) -> tuple:
+        """ Gets the information about this track shown in a big frame, as the arguments of `MK8TrackFrameBig` after its master """
+
+    def frame(self, master: "Toplevel", *args, **kwargs) -> "MK8TrackFrameBig":
+        """ Creates a big frame with information about this track. """
+        from poltergust.widgets.trackframes import MK8TrackFrameBig
+
+        return MK8TrackFrameBig(master, *self.get_frame_args(), *args, **kwargs)
+
+    def reframe(self, frame: "MK8TrackFrameBig") -> None:
+        """ Shows this track in an existing big frame instead, e.g. one that was made for another track """
+        frame.set_track(*self.get_frame_args())
+
+class MiniFramableTrack(FramableTrack, ABC):
+    """ Abstract class to make a track a FramableTrack that also supports a small variant. """
+    @abstractmethod
+    def miniframe(self, master: "Toplevel", *args, **kwargs) -> "MK8TrackFrameSmall":
+        """ Creates a small frame with information about this track. """
@@ -1,12 +1,16 @@
 from dataclasses import dataclass
 from enum import Enum
-from tkinter import Toplevel
+from typing import TYPE_CHECKING
 
-from PIL import Image
-
-from poltergust.models.imagemapper import MK8TrackImageMapper
+from poltergust.models.framable import MiniFramableTrack
 from poltergust.models.mod_sites import GameBananaSite, MarioWikiSite
-from poltergust.widgets.trackframes import MK8TrackFrameBig, MK8TrackFrameSmall, MiniFramableTrack
+
+if TYPE_CHECKING:
+    from tkinter import Toplevel
+
+    from PIL import Image
+
+    from poltergust.widgets.trackframes import MK8TrackFrameSmall
 
 
 class MK8GhostType(Enum):
@@ -49,16 +53,23 @@ class MK8Course(MiniFramableTrack):
             return self.course_id == other.course_id
         return False
 
-    def _get_frame_kwargs(self, master: Toplevel, preview_size: tuple[int, int]) -> tuple[str, Image.Image]:
+    def __hash__(self):
+        return hash(self.course_id)
+
+    def _get_frame_kwargs(self, preview_size: tuple[int, int]) -> tuple[str, "Image.Image"]:
         """ Gets a tuple of the track slot's name and preview image """
+        from poltergust.models.imagemapper import MK8TrackImageMapper
+
         icon_index = self.icon_index
         track_preview = MK8TrackImageMapper().index_to_image(icon_index, resize_to=preview_size)
 
         track_name = self.name
         return track_name, track_preview
 
-    def frame(self, master: Toplevel, *args, **kwargs) -> MK8TrackFrameBig:
-        track_name, track_preview = self._get_frame_kwargs(master, MK8TrackFrameBig.TRACK_PREVIEW_SIZE)
+    def get_frame_args(self) -> tuple:
+        from poltergust.widgets.trackframes import MK8TrackFrameBig
+
+        track_name, track_preview = self._get_frame_kwargs(MK8TrackFrameBig.TRACK_PREVIEW_SIZE)
 
         track_author = self.cup
         url_text = str(self.course_id)
@@ -66,10 +77,12 @@ class MK8Course(MiniFramableTrack):
         url_link = self.url
         url_tooltip = f"Super Mario Wiki - {url_link}"
 
-        return MK8TrackFrameBig(master, track_name, track_preview, track_author, url_text, url_icon, url_link, url_tooltip, *args, **kwargs)
+        return track_name, track_preview, track_author, url_text, url_icon, url_link, url_tooltip
+
+    def miniframe(self, master: "Toplevel", *args, **kwargs) -> "MK8TrackFrameSmall":
+        from poltergust.widgets.trackframes import MK8TrackFrameSmall
 
-    def miniframe(self, master: Toplevel, *args, **kwargs) -> MK8TrackFrameSmall:
-        track_name, track_preview = self._get_frame_kwargs(master, MK8TrackFrameSmall.TRACK_PREVIEW_SIZE)
+        track_name, track_preview = self._get_frame_kwargs(MK8TrackFrameSmall.TRACK_PREVIEW_SIZE)
         track_name = f"Replaces {track_name}"
         return MK8TrackFrameSmall(master, track_name, track_preview, *args, **kwargs)
 
@@ -0,0 +1,176 @@
+from dataclasses import dataclass, fields, replace
+import hashlib
+import os
+import sqlite3
+from typing import Iterator
+
+from poltergust.models.ct_storage import MK8CTStorage
+from poltergust.models.gamedata import COURSE_IDS
+from poltergust.models.mod_models import UNKNOWN_CUSTOM_TRACK
+from poltergust.models.mod_sites import API_MOD_SITES
+from poltergust.parsers.filename_parser import MK8GhostFilenameData, MK8GhostFilenameFormat, int_lap
+from poltergust.parsers.ghost_scanner import MK8GhostScanner, get_mod_record, scan_ghostfile
+from poltergust.utils import Singleton
+
+
+def index_ghostfile(path: str) -> dict:
+    """ Parses a single ghost file like `scan_ghostfile`, and adds a hash of its contents to the record """
+    record = scan_ghostfile(path)
+    try:
+        content_hash = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            while chunk := f.read(MK8GhostIndex.HASH_CHUNK_SIZE):
+                content_hash.update(chunk)
+        record['content_hash'] = content_hash.hexdigest()
+    except OSError as e:
+        record.setdefault('error', f"{e.__class__.__name__}: {e}")
+    return record
+
+
+@dataclass
+class MK8GhostIndexScanResult:
+    """ Summary of a rescan of the ghost index """
+    num_unchanged: int = 0
+    num_updated: int = 0
+    num_removed: int = 0
+
+
+class MK8GhostIndex(metaclass=Singleton):
+    """
+        Stores the parsed filenames and contents of ghost files on disc. A rescan only parses
+        ghost files that are new, or whose size or modification time changed since the last scan.
+        The records of indexed ghost files are the same as those of `scan_ghostfile`; the names
+        of courses and mods are looked up when they are read, so they stay up to date.
+    """
+    DB_NAME = "ghostindex.db"
+
+    # Size of the blocks in which ghost files are read to calculate their content hash
+    HASH_CHUNK_SIZE = 1 << 16
+
+    # Below this number of changed ghost files, parsing in a worker pool is slower than parsing them directly
+    MIN_PARALLEL_SCAN = 256
+
+    # Columns describing the ghost file itself
+    FILE_COLUMNS = [
+        ("path", "text primary key"),
+        ("size", "integer not null"),
+        ("mtime_ns", "integer not null"),
+        ("content_hash", "text"),
+        ("error", "text"),
+    ]
+
+    # Columns describing the contents of the ghost file (the filename columns follow `MK8GhostFilenameFormat`)
+    CONTENT_COLUMNS = [
+        ("has_header", "integer"),
+        ("course_id", "integer"),
+        ("mod_site", "integer"),
+        ("mod_id", "integer"),
+        ("mod_version", "text"),
+    ]
+
+    def __init__(self):
+        filename_columns = [("game_version", "text")]
+        for _, identifier, data_type in MK8GhostFilenameFormat.format:
+            if data_type is None:
+                continue
+            filename_columns.append((identifier, "integer" if data_type in (int, int_lap) else "text"))
+        self.columns = self.FILE_COLUMNS + filename_columns + self.CONTENT_COLUMNS
+        self.column_names = [name for name, _ in self.columns]
+
+        # Connect with cache
+        os.makedirs(MK8CTStorage.CACHE_PATH, exist_ok=True)
+        path = os.path.join(MK8CTStorage.CACHE_PATH, self.DB_NAME)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+
+        # Create tables
+        self.connection.execute(f'''CREATE TABLE IF NOT EXISTS ghosts ({", ".join(f"{name} {definition}" for name, definition in self.columns)})''')
+        self.connection.commit()
+
+    def close_connection(self):
+        """ Closes the database connection """
+        self.connection.close()
+
+    def _get_prefix(self, root: str) -> str:
+        """ Gets the prefix shared by the (absolute) paths of all ghost files in the given directory """
+        return os.path.join(os.path.abspath(root), "")
+
+    def rescan(self, root: str, max_workers: int|None = None) -> MK8GhostIndexScanResult:
+        """
+            Brings the index up to date with the ghost files in the given directory tree: parses new
+            and changed ghost files (in up to `max_workers` processes), and removes ghost files that
+            no longer exist from the index.
+        """
+        result = MK8GhostIndexScanResult()
+        scanner = MK8GhostScanner(max_workers=max_workers)
+        prefix = self._get_prefix(root)
+        indexed = {row['path']: (row['size'], row['mtime_ns']) for row in self.connection.execute(
+            'SELECT path, size, mtime_ns FROM ghosts WHERE substr(path, 1, :length) = :prefix', {"length": len(prefix), "prefix": prefix})}
+
+        # Only ghost files whose stat changed need to be parsed again
+        changed = {}
+        for entry in scanner.iter_ghostfile_entries(prefix):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if indexed.pop(entry.path, None) == (stat.st_size, stat.st_mtime_ns):
+                result.num_unchanged += 1
+            else:
+                changed[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        # Whatever is left in the index no longer exists
+        self.connection.executemany('DELETE FROM ghosts WHERE path = ?', ((path,) for path in indexed))
+        result.num_removed = len(indexed)
+
+        if len(changed) >= self.MIN_PARALLEL_SCAN:
+            records = scanner.scan(changed, scan_function=index_ghostfile)
+        else:
+            records = map(index_ghostfile, changed)
+
+        placeholders = ", ".join(f":{name}" for name in self.column_names)
+        for record in records:
+            record['size'], record['mtime_ns'] = changed[record['path']]
+            self.connection.execute(f'INSERT OR REPLACE INTO ghosts ({", ".join(self.column_names)}) VALUES ({placeholders})',
+                {name: record.get(name) for name in self.column_names})
+            result.num_updated += 1
+
+        self.connection.commit()
+        return result
+
+    def get_ghosts(self, root: str|None = None) -> Iterator[dict]:
+        """
+            Gets the records of all indexed ghost files (in the given directory tree), ordered by path. Paths
+            start with the given root, like those of `MK8GhostScanner`; without a root, they are absolute.
+        """
+        if root is None:
+            rows = self.connection.execute('SELECT * FROM ghosts ORDER BY path')
+            for row in rows:
+                yield self._get_record(row, row['path'])
+        else:
+            prefix = self._get_prefix(root)
+            rows = self.connection.execute('SELECT * FROM ghosts WHERE substr(path, 1, :length) = :prefix ORDER BY path', {"length": len(prefix), "prefix": prefix})
+            for row in rows:
+                yield self._get_record(row, os.path.join(root, row['path'][len(prefix):]))
+
+    def _get_record(self, row: sqlite3.Row, path: str) -> dict:
+        """ Turns an indexed ghost file into the same record `scan_ghostfile` makes """
+        record = {'path': path}
+        if row['error'] is not None:
+            record['error'] = row['error']
+            return record
+
+        for field in fields(MK8GhostFilenameData):
+            record[field.name] = row[field.name]
+        record['has_header'] = bool(row['has_header'])
+        record['course_id'] = row['course_id']
+        record['course_name'] = COURSE_IDS[row['course_id']].name
+
+        mod = None
+        if row['mod_id'] is not None:
+            # Not downloaded (yet); shown like MK8GhostDataParser does
+            mod = MK8CTStorage().find_mod(row['mod_id'], row['mod_site'])
+            if mod is None:
+                mod = replace(UNKNOWN_CUSTOM_TRACK, mod_site=API_MOD_SITES[row['mod_site']], mod_id=row['mod_id'])
+        record.update(get_mod_record(mod, row['mod_version']))
+        return record
@@ -1,9 +1,90 @@
 from abc import ABC
+from collections import OrderedDict
+from dataclasses import dataclass
 import logging
+import threading
+from typing import Any
 
 from PIL import Image
 
-from poltergust.utils import SingletonABCMeta, get_resource_path
+from poltergust.models.sprite_cache import MK8SpriteCache
+from poltergust.utils import Singleton, SingletonABCMeta, get_resource_path
+
+
+@dataclass
+class _MK8IconCacheEntry:
+    """ A cached icon, and the Tk image made from it (once the UI asked for it) """
+    image: Image.Image
+    photo_image: Any = None
+
+    def get_size_bytes(self) -> int:
+        """ Approximate memory used by the icon; Tk stores 4 bytes per pixel as well """
+        num_bytes = self.image.width * self.image.height * 4
+        return num_bytes * 2 if self.photo_image is not None else num_bytes
+
+class MK8IconCache(metaclass=Singleton):
+    """
+        Least recently used cache of icons extracted from icon atlases, keyed on (mapper class, index, size, resample).
+        Holds both the PIL image and the Tk image made from it, so showing the same icon again does no image work.
+    """
+    # Icons are evicted once the cached icons use more memory than this (in bytes)
+    MAX_SIZE_BYTES = 32 * 1000 * 1000
+
+    def __init__(self, max_size_bytes: int|None = None) -> None:
+        self.max_size_bytes = max_size_bytes or self.MAX_SIZE_BYTES
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[tuple, _MK8IconCacheEntry] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _get_entry(self, mapper: "MK8ImageAtlasMapper", index: int|None, size: tuple[int, int]|None, resample: int|None) -> _MK8IconCacheEntry:
+        """ Gets the cache entry of an icon, extracting it from the atlas if it is not cached """
+        key = (mapper.__class__, index, size, resample)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry
+
+            self.misses += 1
+            entry = _MK8IconCacheEntry(mapper.extract_image(index, size, resample))
+            self._entries[key] = entry
+            self.size_bytes += entry.get_size_bytes()
+            self._evict()
+            return entry
+
+    def _evict(self) -> None:
+        """ Removes the least recently used icons until the cache fits in its memory budget (always keeping the newest) """
+        while self.size_bytes > self.max_size_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.size_bytes -= entry.get_size_bytes()
+
+    def get_image(self, mapper: "MK8ImageAtlasMapper", index: int|None, size: tuple[int, int]|None = None, resample: int|None = None) -> Image.Image:
+        """ Gets the (shared) icon at an index of an atlas, optionally resized. The icon must not be modified """
+        return self._get_entry(mapper, index, size, resample).image
+
+    def get_photo_image(self, mapper: "MK8ImageAtlasMapper", index: int|None, size: tuple[int, int]|None = None, resample: int|None = None):
+        """ Gets the icon at an index of an atlas as a Tk image. Must be called from the UI thread """
+        # Only the UI needs Tk images
+        from PIL import ImageTk
+
+        with self._lock:
+            entry = self._get_entry(mapper, index, size, resample)
+            if entry.photo_image is None:
+                self.size_bytes -= entry.get_size_bytes()
+                entry.photo_image = ImageTk.PhotoImage(entry.image)
+                self.size_bytes += entry.get_size_bytes()
+                self._evict()
+            return entry.photo_image
+
+    def clear(self) -> None:
+        """ Removes all icons from the cache """
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
 
 
 class MK8ImageAtlasMapper(ABC, metaclass=SingletonABCMeta):
@@ -22,20 +103,34 @@ class MK8ImageAtlasMapper(ABC, metaclass=SingletonABCMeta):
     x_offset: int = 0
     y_offset: int = 0
 
-    # Cached image atlas
-    _atlas_cache: Image.Image
+    # Sizes at which the icons are shown. These are read from the sprite cache instead of the atlas
+    sprite_sizes: list[tuple[int, int]] = []
 
-    def __init__(self):
-        # Load Atlas in memory when initialised
-        logging.info(f"{self.__class__.__name__} cached its icon atlas: {self.image_name}.")
-        self._atlas_cache = Image.open(get_resource_path(self.image_name))
+    # Cached image atlas, loaded when an icon is first extracted from it
+    _atlas_cache: Image.Image|None = None
+
+    def get_atlas(self) -> Image.Image:
+        """ Gets the image atlas, loading it in memory the first time """
+        if self._atlas_cache is None:
+            logging.info(f"{self.__class__.__name__} cached its icon atlas: {self.image_name}.")
+            self._atlas_cache = Image.open(get_resource_path(self.image_name))
+        return self._atlas_cache
+
+    def index_to_image(self, index: int | None, resize_to: tuple[int, int] | None = None, resample: int | None = None) -> Image.Image:
+        """ Given some index, gets the icon at that index from the atlas and optionally resizes it. The icon is cached, and must not be modified """
+        return MK8IconCache().get_image(self, index, resize_to, resample)
+
+    def extract_image(self, index: int | None, resize_to: tuple[int, int] | None = None, resample: int | None = None, from_atlas: bool = False) -> Image.Image:
+        """ Given some index, extracts the icon at that index (from the sprite cache if possible, or else the atlas) and optionally resizes it """
+        if not from_atlas and resize_to in self.sprite_sizes and resample is None:
+            img = MK8SpriteCache().get_image(self, index, resize_to)
+            if img is not None:
+                return img
 
-    def index_to_image(self, index: int | None, resize_to: tuple[int, int] | None = None) -> Image.Image:
-        """ Given some index, extracts the icon at that index from the atlas and optionally resizes it """
         x, y, x_offset, y_offset = self.get_coordinates(index)
-        img = self._atlas_cache.crop((x, y, x_offset, y_offset))
+        img = self.get_atlas().crop((x, y, x_offset, y_offset))
         if resize_to:
-            img = img.resize(resize_to)
+            img = img.resize(resize_to, resample)
         return img
 
     def get_coordinates(self, index: int | None) -> tuple[int, int, int, int]:
@@ -65,6 +160,9 @@ class MK8FlagImageMapper(MK8ImageAtlasMapper):
     num_icons = 71
     icons_per_row = 10
 
+    # PoltergustMainView.FLAG_SIZE
+    sprite_sizes = [(33, 22)]
+
     invalid_coordinates = (590, 312)
 
 class MK8CharacterImageMapper(MK8ImageAtlasMapper):
@@ -77,6 +175,9 @@ class MK8CharacterImageMapper(MK8ImageAtlasMapper):
     num_icons = 65
     icons_per_row = 12
 
+    # PoltergustMainView.CHARACTER_SIZE
+    sprite_sizes = [(64, 64)]
+
     invalid_coordinates = (646, 646)
 
 class MK8TrackImageMapper(MK8ImageAtlasMapper):
@@ -89,6 +190,9 @@ class MK8TrackImageMapper(MK8ImageAtlasMapper):
     num_icons = 64
     icons_per_row = 8
 
+    # MK8TrackFrameBig.TRACK_PREVIEW_SIZE, MK8TrackFrameSmall.TRACK_PREVIEW_SIZE
+    sprite_sizes = [(96, 54), (48, 27)]
+
     invalid_coordinates = (17, 2151)
 
 class MK8VehiclePartImageMapper(MK8ImageAtlasMapper):
@@ -101,4 +205,10 @@ class MK8VehiclePartImageMapper(MK8ImageAtlasMapper):
     num_icons = 448
     icons_per_row = 12
 
+    # PoltergustMainView.VEHICLE_PART_SIZE
+    sprite_sizes = [(75, 48)]
+
     invalid_coordinates = (805, 5268)
+
+# All icon atlases, e.g. to slice into sprites up front
+ICON_ATLAS_MAPPERS: list[type[MK8ImageAtlasMapper]] = [MK8FlagImageMapper, MK8CharacterImageMapper, MK8TrackImageMapper, MK8VehiclePartImageMapper]
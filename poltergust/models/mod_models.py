@@ -1,12 +1,12 @@
 from dataclasses import dataclass
-from typing import ClassVar
-from tkinter import Toplevel
-
-from PIL import Image
+from typing import TYPE_CHECKING, ClassVar
 
+from poltergust.models.framable import FramableTrack
 from poltergust.models.mod_sites import MK8APIModSite, MK8ModSite
 from poltergust.utils import get_resource_path
-from poltergust.widgets.trackframes import FramableTrack, MK8TrackFrameBig
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 
 @dataclass
@@ -41,44 +41,39 @@ class MK8CustomTrack(FramableTrack):
             return self.mod_id == other.mod_id and self.mod_site == other.mod_site
         return False
 
-    def _get_frame_args(self, image_size: tuple[int, int]) -> tuple[str, str, Image.Image]:
+    def __hash__(self):
+        return hash((self.mod_site.id, self.mod_id))
+
+    def _get_frame_contents(self, image_size: tuple[int, int]) -> tuple[str, str, "Image.Image"]:
         """ Gets a tuple of the custom track's name, author, and preview image """
         track_name = self.name
         track_author = self.author or "Unknown Author"
 
         track_preview = None
         if self.preview_image is not None:
+            # The preview cache stores its index in the database, which depends on this module
+            from poltergust.models.preview_cache import MK8PreviewCache
             try:
-                track_preview = Image.open(self.preview_image).resize(size=image_size)
+                track_preview = MK8PreviewCache().load(self.preview_image, image_size)
             except FileNotFoundError as e:
                 pass
 
         if track_preview is None:
-            size = min(*image_size) / 2
+            size = min(*image_size) // 2
             track_preview = self.mod_site.icon.resize(size=(size, size))
 
         return track_name, track_author, track_preview
 
-    def frame(self, master: Toplevel, *args, **kwargs) -> MK8TrackFrameBig:
-        track_name = self.name
-        track_author = self.author or "Unknown Author"
+    def get_frame_args(self) -> tuple:
+        from poltergust.widgets.trackframes import MK8TrackFrameBig
 
-        track_preview = None
-        if self.preview_image is not None:
-            try:
-                track_preview = Image.open(self.preview_image).resize(size=MK8TrackFrameBig.TRACK_PREVIEW_SIZE)
-            except FileNotFoundError as e:
-                pass
-
-        if track_preview is None:
-            size = min(*MK8TrackFrameBig.TRACK_PREVIEW_SIZE) // 2
-            track_preview = self.mod_site.icon.resize(size=(size, size))
+        track_name, track_author, track_preview = self._get_frame_contents(MK8TrackFrameBig.TRACK_PREVIEW_SIZE)
 
         url_text = str(self.mod_id)
         url_icon = self.mod_site.icon
         url_link = self.mod_site.get_url_for_mod_id(self.mod_id)
         url_tooltip = f"{self.mod_site} - {url_link}"
 
-        return MK8TrackFrameBig(master, track_name, track_preview, track_author, url_text, url_icon, url_link, url_tooltip, *args, **kwargs)
+        return track_name, track_preview, track_author, url_text, url_icon, url_link, url_tooltip
 
 UNKNOWN_CUSTOM_TRACK = MK8CustomTrack("Unknown Custom Track", None, -1, None, get_resource_path("resources/unknown-track.png"))
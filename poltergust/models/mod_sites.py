@@ -1,20 +1,30 @@
 from abc import ABC, abstractmethod
 import json
+from typing import TYPE_CHECKING
+from urllib.parse import urlencode
 
-from PIL import Image
+from poltergust.utils import LazyResourceImage, Singleton, SingletonABCMeta
 
-from poltergust.utils import Singleton, SingletonABCMeta, get_resource_path
+if TYPE_CHECKING:
+    from PIL import Image
 
 
 class ModDownloadException(Exception):
     """ Raised when something goes wrong when downloading a mod. """
 
+class ModDownloadTemporaryException(ModDownloadException):
+    """ Raised when downloading a mod failed, but may succeed if tried again later (e.g. timeouts or server errors). """
+    def __init__(self, message: str, retry_after: float|None = None):
+        super().__init__(message)
+        # Number of seconds the site asked to wait before trying again (if any)
+        self.retry_after = retry_after
+
 class MK8ModSite:
     """ A website that hosts mods """
     id: int
     name: str
     domain: str
-    icon: Image.Image
+    icon: "Image.Image"
 
     def __str__(self):
         return self.name
@@ -29,7 +39,7 @@ class MK8APIModSite(MK8ModSite, ABC):
     id: int
     name: str
     domain: str
-    icon: Image.Image
+    icon: "Image.Image"
 
     mod_id_url = "%(mod_id)s"
 
@@ -51,6 +61,31 @@ class MK8APIModSite(MK8ModSite, ABC):
         """
         return json_res
 
+    # Maximum number of mods that can be fetched in a single request (1 if the API does not support this)
+    batch_size = 1
+
+    def get_batch_api_endpoint(self, mod_ids: list[str]) -> str|None:
+        """ Gets the API endpoint to fetch mod data for several mods (by mod_id) at once, if the API supports this """
+        return None
+
+    def split_batch_json(self, mod_ids: list[str], json_res: dict|list) -> dict[str, dict]:
+        """
+            Splits the json response from a batch request into the cleaned json of each mod, by mod_id.
+            Mods that are missing from the response are left out.
+        """
+        raise NotImplementedError(f"{self.name} does not support fetching several mods at once.")
+
+    def get_continuation_endpoint(self, api_endpoint: str, json_res: dict|list) -> str|None:
+        """
+            Gets the API endpoint to fetch the remainder of a response that did not fit in one request (if any).
+            `api_endpoint` is the endpoint of the original request, and `json_res` the latest response.
+        """
+        return None
+
+    def merge_continuation_json(self, json_res: dict, continued_json: dict) -> dict:
+        """ Merges the remainder of a response into the response so far """
+        return json_res
+
     @abstractmethod
     def validate(self, clean_json: dict) -> None:
         """
@@ -78,7 +113,7 @@ class CTWikiSite(MK8APIModSite, metaclass=SingletonABCMeta):
     id = 0
     name = "CT Wiki"
     domain = "https://mk8.tockdom.com/wiki/"
-    icon = Image.open(get_resource_path("resources/favicons/favicon_ctwiki.png")).resize(size=(16, 16))
+    icon = LazyResourceImage("resources/favicons/favicon_ctwiki.png", size=(16, 16))
 
     mod_id_url = "https://mk8.tockdom.com/w/index.php?curid=%(mod_id)s"
     shared_api_endpoint = "https://mk8.tockdom.com/w/api.php?action=query&prop=images|templates|categories&clcategories=Category:Track/Retro|Category:Track/Custom|Category:Track/Edit|Category:Track/Import&tldir=descending&format=json&format=json&%s"
@@ -86,11 +121,40 @@ class CTWikiSite(MK8APIModSite, metaclass=SingletonABCMeta):
     int_api_endpoint = shared_api_endpoint % "pageids=%(mod_id)s"
     name_api_endpoint = shared_api_endpoint % "titles=%(name)s"
 
+    # MediaWiki allows up to 50 pages per query. List properties are shared between all pages of a query,
+    # so they are requested in full (and continued if they still do not fit)
+    batch_size = 50
+    batch_api_endpoint = shared_api_endpoint % "imlimit=max&tllimit=max&cllimit=max&pageids=%(mod_ids)s"
+    list_properties = ('images', 'templates', 'categories')
+
     def get_api_endpoint(self, identifier: str) -> str:
         if identifier.isdigit():
             return self.int_api_endpoint % {'mod_id': identifier}
         return self.name_api_endpoint % {'name': identifier}
 
+    def get_batch_api_endpoint(self, mod_ids: list[str]) -> str|None:
+        return self.batch_api_endpoint % {'mod_ids': "|".join(mod_ids)}
+
+    def split_batch_json(self, mod_ids: list[str], json_res: dict|list) -> dict[str, dict]:
+        pages: dict = json_res['query']['pages']
+        return {mod_id: pages[str(int(mod_id))] for mod_id in mod_ids if str(int(mod_id)) in pages}
+
+    def get_continuation_endpoint(self, api_endpoint: str, json_res: dict|list) -> str|None:
+        if 'continue' not in json_res:
+            return None
+        return api_endpoint + "&" + urlencode(json_res['continue'])
+
+    def merge_continuation_json(self, json_res: dict, continued_json: dict) -> dict:
+        pages: dict = json_res['query']['pages']
+        for page_id, continued_page in continued_json['query']['pages'].items():
+            page = pages.setdefault(page_id, continued_page)
+            if page is continued_page:
+                continue
+            for list_property in self.list_properties:
+                if list_property in continued_page:
+                    page.setdefault(list_property, []).extend(continued_page[list_property])
+        return json_res
+
     def clean_json(self, json_res: dict) -> dict:
         pages: dict = json_res['query']['pages']
 
@@ -103,7 +167,7 @@ class CTWikiSite(MK8APIModSite, metaclass=SingletonABCMeta):
 
     def validate(self, clean_json: dict) -> None:
         # Page doesn't exist (invalid URL)
-        if clean_json.get('pageid', -1) < 0:
+        if clean_json.get('pageid', -1) < 0 or 'missing' in clean_json:
             raise ModDownloadException("Mod not found. Is the URL correct?")
 
         # Must have params
@@ -181,16 +245,32 @@ class GameBananaSite(MK8APIModSite, metaclass=SingletonABCMeta):
     id = 1
     name = "GameBanana"
     domain = "https://gamebanana.com/mods/"
-    icon = Image.open(get_resource_path("resources/favicons/favicon_gb.png")).resize(size=(16, 16))
+    icon = LazyResourceImage("resources/favicons/favicon_gb.png", size=(16, 16))
 
     mod_id_url = "https://gamebanana.com/mods/%(mod_id)s"
     api_endpoint = "https://api.gamebanana.com/Core/Item/Data?itemtype=Mod&return_keys=1&format=json_min&itemid=%(mod_id)s&fields=authors,name,Owner().name,Preview().sSubFeedImageUrl(),screenshots,Credits().aAuthors(),Category().name,Withhold().bIsWithheld(),RootCategory().name,Game().name,Trash().bIsTrashed()"
 
+    # Several items can be requested at once by repeating the item parameters
+    batch_size = 50
+    batch_api_endpoint = "https://api.gamebanana.com/Core/Item/Data?return_keys=1&format=json_min&%(items)s"
+    batch_item_fields = api_endpoint.partition("&fields=")[2]
+
     def get_api_endpoint(self, identifier: str) -> str:
         if identifier.isdigit():
             return self.api_endpoint % {'mod_id': identifier}
         return None
 
+    def get_batch_api_endpoint(self, mod_ids: list[str]) -> str|None:
+        items = "&".join(f"itemtype[]=Mod&itemid[]={mod_id}&fields[]={self.batch_item_fields}" for mod_id in mod_ids)
+        return self.batch_api_endpoint % {'items': items}
+
+    def split_batch_json(self, mod_ids: list[str], json_res: dict|list) -> dict[str, dict]:
+        if isinstance(json_res, dict):
+            # The request as a whole failed (e.g. because one of the mods is invalid), which says nothing about each mod
+            return {}
+        # Items are returned in the order they were requested
+        return dict(zip(mod_ids, json_res))
+
     def validate(self, clean_json: dict) -> None:
         if clean_json.get("error", None):
             raise ModDownloadException("Mod not found. Is the URL correct?")
@@ -251,6 +331,6 @@ class MarioWikiSite(MK8ModSite):
     id = 2
     name = "Super Mario Wiki"
     domain = "https://www.mariowiki.com/"
-    icon = Image.open(get_resource_path("resources/favicons/favicon_mariowiki.png")).resize(size=(16, 16))
+    icon = LazyResourceImage("resources/favicons/favicon_mariowiki.png", size=(16, 16))
 
 API_MOD_SITES: tuple[MK8APIModSite] = (CTWikiSite(), GameBananaSite())
@@ -0,0 +1,215 @@
+import logging
+import mmap
+import os
+import re
+import threading
+
+from PIL import Image
+
+from poltergust.models.ct_storage import MK8CTStorage
+from poltergust.utils import Singleton, get_resource_path
+from poltergust.widgets.trackframes import MK8TrackFrameBig, MK8TrackFrameSmall
+
+
+class MK8PreviewCache(metaclass=Singleton):
+    """
+        Stores the preview images of custom tracks along with thumbnails at the sizes shown in the UI, so
+        frames don't have to open, decode and resize a JPEG for every custom track.
+
+        The thumbnails of all previews are packed into a single memory-mapped atlas file. Each preview gets a
+        record with its thumbnails as raw pixels, and loading a thumbnail slices it out of the map without
+        copying. The offset of each record is indexed in `MK8CTStorage`. Records are only ever appended, so
+        the atlas is compacted once most of it consists of records that were replaced. Records that are
+        missing or older than their preview image are made again when they are looked up.
+
+        Several processes (e.g. the GUI and the CLI) may use the atlas at once. Appending, indexing and
+        compacting happen while holding the database's write lock, and each process re-maps the atlas when
+        another one compacted it into a new generation.
+    """
+    # Sizes at which previews are shown in the UI, besides the full preview image
+    THUMBNAIL_SIZES = [MK8TrackFrameBig.TRACK_PREVIEW_SIZE, MK8TrackFrameSmall.TRACK_PREVIEW_SIZE]
+
+    # RGB with a padding byte, which is how Pillow stores RGB images in memory. Only then can it use thumbnails without copying them
+    THUMBNAIL_MODE = "RGBX"
+    BYTES_PER_PIXEL = 4
+
+    # Compacting writes a new atlas file, since a memory-mapped file cannot be replaced on Windows
+    ATLAS_FILENAME = "previews.%(generation)s.bin"
+    ATLAS_FILENAME_PATTERN = re.compile(r"previews\.\d+\.bin")
+    GENERATION_KEY = "preview_atlas_generation"
+
+    # The atlas is compacted once it is larger than this, and more than half of it consists of replaced records
+    COMPACT_MIN_SIZE = 4 * 1000 * 1000
+
+    # Preview images, and the separate thumbnail files stored by the previous version
+    PREVIEW_FILENAME_PATTERN = re.compile(r"preview_\d+_\d+\.jpeg")
+    OLD_THUMBNAIL_FILENAME_PATTERN = re.compile(r"preview_\d+_\d+_\d+x\d+\.jpeg")
+
+    def __init__(self) -> None:
+        self.db = MK8CTStorage()
+
+        # Offset of each thumbnail within a record
+        self.thumbnail_offsets: dict[tuple[int, int], int] = {}
+        self.record_size = 0
+        for size in self.THUMBNAIL_SIZES:
+            self.thumbnail_offsets[size] = self.record_size
+            self.record_size += size[0] * size[1] * self.BYTES_PER_PIXEL
+
+        # Guards appending to, mapping and compacting the atlas within this process
+        self._lock = threading.RLock()
+        self._map: mmap.mmap|None = None
+        self._map_generation: int|None = None
+
+    def get_generation(self) -> int:
+        """ Gets the generation of the current atlas file, which increases each time the atlas is compacted """
+        return int(self.db.get_value(self.GENERATION_KEY) or 0)
+
+    def get_atlas_path(self, generation: int|None = None) -> str:
+        """ Gets the path of the atlas file of a generation (by default, the current one) """
+        if generation is None:
+            generation = self.get_generation()
+        return os.path.join(MK8CTStorage.CACHE_PATH, self.ATLAS_FILENAME % {'generation': generation})
+
+    def store(self, image: Image.Image, preview_path: str) -> None:
+        """ Saves a preview image and adds its thumbnails to the atlas """
+        image.save(preview_path)
+        self._add_record(image, preview_path)
+
+    def regenerate(self, preview_path: str) -> int:
+        """ Adds the thumbnails of a stored preview image to the atlas again, and returns the offset of their record """
+        with Image.open(preview_path) as image:
+            return self._add_record(image, preview_path)
+
+    def _add_record(self, image: Image.Image, preview_path: str) -> int:
+        """ Appends a record with the thumbnails of a preview image to the atlas, and returns its offset """
+        record = b"".join(image.resize(size, Image.Resampling.LANCZOS).convert(self.THUMBNAIL_MODE).tobytes() for size in self.THUMBNAIL_SIZES)
+        mtime_ns = os.stat(preview_path).st_mtime_ns
+
+        # Other processes may append to or compact the atlas as well
+        with self._lock, self.db.exclusive():
+            with open(self.get_atlas_path(), 'ab') as f:
+                offset = f.tell()
+                f.write(record)
+            # Only index the record once it was written completely
+            self.db.set_preview_atlas_entry(preview_path, offset, mtime_ns)
+
+            atlas_size = offset + self.record_size
+            if atlas_size >= self.COMPACT_MIN_SIZE and 2 * self.db.count_preview_atlas_entries() * self.record_size < atlas_size:
+                self.compact()
+                offset, _, _ = self.db.get_preview_atlas_entry(preview_path)
+        return offset
+
+    def _get_map(self, generation: int, length: int) -> mmap.mmap|None:
+        """
+            Gets a memory map of the atlas file of a generation that is at least `length` bytes long, or None if
+            that file is shorter (or was removed after compacting it)
+        """
+        with self._lock:
+            if self._map is None or self._map_generation != generation or len(self._map) < length:
+                # The atlas grew or was compacted. The old map is closed once no thumbnails use it anymore
+                self._map = None
+                self._map_generation = generation
+                try:
+                    with open(self.get_atlas_path(generation), 'rb') as f:
+                        if os.fstat(f.fileno()).st_size >= max(length, 1):
+                            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except FileNotFoundError:
+                    pass
+            return self._map if self._map is not None and len(self._map) >= length else None
+
+    def _is_resource(self, path: str) -> bool:
+        """ Checks whether a path points to an image bundled with Poltergust """
+        return os.path.abspath(path).startswith(os.path.join(os.path.abspath(get_resource_path("resources")), ""))
+
+    def load(self, preview_path: str, size: tuple[int, int]) -> Image.Image:
+        """
+            Loads a preview image at the given size, from the atlas if there are thumbnails of that size.
+            Thumbnails from the atlas are read-only.
+            :raise: OSError if the preview image does not exist
+        """
+        if size not in self.thumbnail_offsets or self._is_resource(preview_path):
+            # Bundled images (e.g. of unknown tracks) don't get thumbnails
+            with Image.open(preview_path) as image:
+                return image.resize(size)
+
+        mtime_ns = os.stat(preview_path).st_mtime_ns
+        with self._lock:
+            # The offset and generation are read at once, so they match even if another process compacts the atlas
+            entry = self.db.get_preview_atlas_entry(preview_path)
+            atlas = self._get_map(entry[2], entry[0] + self.record_size) if entry is not None else None
+            if atlas is None or entry[1] != mtime_ns:
+                # Not in the atlas yet, or the preview image changed since
+                try:
+                    self.regenerate(preview_path)
+                    entry = self.db.get_preview_atlas_entry(preview_path)
+                    atlas = self._get_map(entry[2], entry[0] + self.record_size)
+                    if atlas is None:
+                        raise OSError("Preview atlas was removed while it was being read.")
+                except OSError as e:
+                    if not os.path.exists(preview_path):
+                        raise
+                    logging.warning(f"Could not add preview image {preview_path} to the preview atlas: {e}")
+                    with Image.open(preview_path) as image:
+                        return image.resize(size)
+            offset = entry[0]
+
+        start = offset + self.thumbnail_offsets[size]
+        data = memoryview(atlas)[start:start + size[0] * size[1] * self.BYTES_PER_PIXEL]
+        return Image.frombuffer(self.THUMBNAIL_MODE, size, data, "raw", self.THUMBNAIL_MODE, 0, 1)
+
+    def compact(self) -> None:
+        """ Rewrites the atlas into a new file, without the records of preview images that were replaced or removed """
+        with self._lock, self.db.exclusive():
+            old_generation = self.get_generation()
+            generation = old_generation + 1
+            new_path = self.get_atlas_path(generation)
+
+            old_entries = self.db.get_preview_atlas_entries()
+            atlas = self._get_map(old_generation, old_entries[-1][1] + self.record_size) if old_entries else None
+
+            entries = []
+            with open(new_path, 'wb') as f:
+                for preview_path, offset, mtime_ns in old_entries:
+                    if atlas is None or offset + self.record_size > len(atlas) or not os.path.exists(preview_path):
+                        continue
+                    entries.append((preview_path, f.tell(), mtime_ns))
+                    f.write(atlas[offset:offset + self.record_size])
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.db.replace_preview_atlas_entries(entries, generation)
+            self._map = None
+            logging.info(f"Compacted the preview atlas into {new_path}, keeping {len(entries)} preview images")
+            self._remove_old_atlases()
+
+    def _remove_old_atlases(self) -> None:
+        """ Removes the files of previous atlases, unless they are still in use """
+        current = os.path.basename(self.get_atlas_path())
+        for filename in os.listdir(MK8CTStorage.CACHE_PATH):
+            if filename != current and self.ATLAS_FILENAME_PATTERN.fullmatch(filename):
+                try:
+                    os.remove(os.path.join(MK8CTStorage.CACHE_PATH, filename))
+                except OSError as e:
+                    # Still mapped (on Windows); removed after the next compaction instead
+                    logging.info(f"Could not remove old preview atlas {filename}: {e}")
+
+    def import_previews(self) -> int:
+        """
+            Adds all preview images in the cache that are not in the atlas yet (e.g. from older versions) to it,
+            and removes the separate thumbnail files of the previous version. Returns the number of added previews.
+        """
+        num_imported = 0
+        for filename in sorted(os.listdir(MK8CTStorage.CACHE_PATH)):
+            path = os.path.join(MK8CTStorage.CACHE_PATH, filename)
+            if self.OLD_THUMBNAIL_FILENAME_PATTERN.fullmatch(filename):
+                os.remove(path)
+            elif self.PREVIEW_FILENAME_PATTERN.fullmatch(filename):
+                entry = self.db.get_preview_atlas_entry(path)
+                if entry is not None and entry[1] == os.stat(path).st_mtime_ns:
+                    continue
+                try:
+                    self.regenerate(path)
+                    num_imported += 1
+                except OSError as e:
+                    logging.error(f"Could not add preview image {path} to the preview atlas: {e}")
+        return num_imported
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import struct
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Iterable
+
+from PIL import Image
+
+from poltergust.models.ct_storage import MK8CTStorage
+from poltergust.utils import Singleton, get_resource_path
+
+if TYPE_CHECKING:
+    from poltergust.models.imagemapper import MK8ImageAtlasMapper
+
+
+class MK8SpriteCache(metaclass=Singleton):
+    """
+        Stores the icons of the icon atlases pre-sliced at the sizes they are shown at (`sprite_sizes` of each
+        mapper), so the large atlases don't have to be loaded and resized to show a few small icons.
+
+        All sprites are kept in a single file: a header with the index (per mapper: the atlas it was made from,
+        and the offset of each sprite size), followed by the raw pixels of all sprites. Only the sprites that are
+        needed are read. A mapper's sprites are sliced again when its atlas or layout changed. Another process
+        may replace the sprite file at any time, so the index is read again whenever the file changed.
+    """
+    FILENAME = "sprites.bin"
+
+    # Magic, version, length of the index
+    HEADER_STRUCT = struct.Struct(">8sHI")
+    MAGIC = b"PGSPRITE"
+    VERSION = 1
+
+    MODE = "RGBA"
+    BYTES_PER_PIXEL = 4
+
+    def __init__(self) -> None:
+        os.makedirs(MK8CTStorage.CACHE_PATH, exist_ok=True)
+        self.path = os.path.join(MK8CTStorage.CACHE_PATH, self.FILENAME)
+
+        # Index of the sprite file, the offset at which the sprites start, and the file they were read from
+        self._index: dict[str, dict]|None = None
+        self._data_offset = 0
+        self._index_file_id: tuple[int, int, int]|None = None
+        # Mappers whose sprites are up to date (or cannot be made)
+        self._checked: dict[str, bool] = {}
+        self._lock = threading.RLock()
+
+    def _get_size_key(self, size: tuple[int, int]) -> str:
+        """ Gets the key of a sprite size in the index """
+        return f"{size[0]}x{size[1]}"
+
+    def _get_source(self, mapper: "MK8ImageAtlasMapper") -> list|None:
+        """ Describes the atlas and layout of a mapper, or None if its atlas does not exist """
+        try:
+            stat = os.stat(get_resource_path(mapper.image_name))
+        except OSError:
+            return None
+        return [mapper.image_name, stat.st_size, stat.st_mtime_ns, list(mapper.icon_size), mapper.image_xgap, mapper.image_ygap,
+                mapper.num_icons, mapper.icons_per_row, list(mapper.invalid_coordinates), mapper.x_offset, mapper.y_offset,
+                [self._get_size_key(size) for size in mapper.sprite_sizes]]
+
+    def _read_index(self, f: BinaryIO|None = None) -> dict[str, dict]:
+        """
+            Reads the index of the sprite file, unless it was read before and the file did not change since.
+            If the sprite file `f` is given, the index is read from it, so sprites can be read from the same file.
+        """
+        try:
+            if f is None:
+                with open(self.path, 'rb') as f:
+                    return self._read_index(f)
+
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if self._index is not None and file_id == self._index_file_id:
+                return self._index
+
+            self._index = {}
+            f.seek(0)
+            magic, version, index_length = self.HEADER_STRUCT.unpack(f.read(self.HEADER_STRUCT.size))
+            if magic == self.MAGIC and version == self.VERSION:
+                self._index = json.loads(f.read(index_length))
+                self._data_offset = self.HEADER_STRUCT.size + index_length
+        except (OSError, struct.error, ValueError) as e:
+            logging.info(f"Could not read sprite cache {self.path}: {e}")
+            file_id = None
+            self._index = {}
+
+        if file_id != self._index_file_id:
+            # Replaced (e.g. by another process); its sprites have to be checked again
+            self._index_file_id = file_id
+            self._checked.clear()
+        return self._index
+
+    def _is_up_to_date(self, mapper: "MK8ImageAtlasMapper") -> bool:
+        """ Checks whether the sprites of a mapper are up to date, slicing its atlas (once) if they are not """
+        name = mapper.__class__.__name__
+        if name not in self._checked:
+            source = self._get_source(mapper)
+            entry = self._read_index().get(name)
+            if source is not None and (entry is None or entry['source'] != source):
+                try:
+                    self.build([mapper])
+                except OSError as e:
+                    logging.warning(f"Could not build sprite cache for {name}: {e}")
+            entry = self._read_index().get(name)
+            self._checked[name] = source is not None and entry is not None and entry['source'] == source
+        return self._checked[name]
+
+    def get_image(self, mapper: "MK8ImageAtlasMapper", index: int|None, size: tuple[int, int]) -> Image.Image|None:
+        """ Reads the sprite of a mapper's icon at the given size, or returns None if there is no such sprite """
+        if size not in mapper.sprite_sizes:
+            return None
+        # The sprite of invalid indices comes after the other icons
+        if index is None or index < 0 or index >= mapper.num_icons:
+            index = mapper.num_icons
+        sprite_length = size[0] * size[1] * self.BYTES_PER_PIXEL
+
+        name = mapper.__class__.__name__
+        with self._lock:
+            if not self._is_up_to_date(mapper):
+                return None
+            try:
+                with open(self.path, 'rb') as f:
+                    # The index must describe the file the sprite is read from
+                    entry = self._read_index(f).get(name)
+                    if name not in self._checked and (entry is None or entry['source'] != self._get_source(mapper)):
+                        # Replaced by an outdated sprite file since it was checked; checked again next time
+                        return None
+                    f.seek(self._data_offset + entry['sprites'][self._get_size_key(size)] + index * sprite_length)
+                    data = f.read(sprite_length)
+            except OSError as e:
+                logging.info(f"Could not read sprite cache {self.path}: {e}")
+                return None
+        if len(data) != sprite_length:
+            return None
+        return Image.frombytes(self.MODE, size, data)
+
+    def build(self, mappers: Iterable["MK8ImageAtlasMapper"]) -> None:
+        """ Slices the atlases of the given mappers into sprites, keeping the sprites of other mappers """
+        with self._lock:
+            # Sprites of mappers that are kept, and the new ones
+            sprites: dict[str, tuple[list, dict[str, bytes]]] = {}
+            rebuilt = {mapper.__class__.__name__ for mapper in mappers}
+            try:
+                with open(self.path, 'rb') as f:
+                    for name, entry in self._read_index(f).items():
+                        if name in rebuilt:
+                            continue
+                        kept = {}
+                        for size_key, offset in entry['sprites'].items():
+                            width, height = map(int, size_key.split("x"))
+                            f.seek(self._data_offset + offset)
+                            kept[size_key] = f.read(width * height * self.BYTES_PER_PIXEL * entry['num_sprites'])
+                        sprites[name] = (entry['source'], kept)
+            except FileNotFoundError:
+                pass
+
+            for mapper in mappers:
+                source = self._get_source(mapper)
+                if source is None:
+                    continue
+                logging.info(f"Slicing icon atlas {mapper.image_name} into sprites")
+                sliced = {}
+                for size in mapper.sprite_sizes:
+                    sliced[self._get_size_key(size)] = b"".join(
+                        mapper.extract_image(index, size, from_atlas=True).convert(self.MODE).tobytes()
+                        for index in [*range(mapper.num_icons), None]
+                    )
+                sprites[mapper.__class__.__name__] = (source, sliced)
+
+            self._write(sprites)
+            self._index = None
+            self._checked.clear()
+
+    def _write(self, sprites: dict[str, tuple[list, dict[str, bytes]]]) -> None:
+        """ Writes a new sprite file """
+        index = {}
+        offset = 0
+        for name, (source, sliced) in sprites.items():
+            entry = {'source': source, 'sprites': {}, 'num_sprites': 0}
+            for size_key, data in sliced.items():
+                width, height = map(int, size_key.split("x"))
+                entry['sprites'][size_key] = offset
+                entry['num_sprites'] = len(data) // (width * height * self.BYTES_PER_PIXEL)
+                offset += len(data)
+            index[name] = entry
+
+        # Only needed when building, which is rare compared to loading sprites
+        import tempfile
+
+        index_data = json.dumps(index).encode()
+        # Each build writes its own temporary file, so concurrent builds (e.g. of multiple processes) don't clash
+        f = tempfile.NamedTemporaryFile(dir=os.path.dirname(self.path), prefix=os.path.basename(self.path) + ".", suffix=".tmp", delete=False)
+        try:
+            with f:
+                f.write(self.HEADER_STRUCT.pack(self.MAGIC, self.VERSION, len(index_data)))
+                f.write(index_data)
+                for _, sliced in sprites.values():
+                    for data in sliced.values():
+                        f.write(data)
+            os.replace(f.name, self.path)
+        except BaseException:
+            os.remove(f.name)
+            raise
@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import logging
+import os
+from typing import Iterable
+
+from poltergust.models.game_models import MK8GhostType
+from poltergust.parsers.filecontent_parser import MK8GhostDataDecoder
+from poltergust.parsers.filename_parser import MK8GhostFilenameData, MK8GhostFilenameParser
+from poltergust.parsers.ghost_converter import MK8GhostConverter
+from poltergust.parsers.ghost_scanner import MK8GhostScanner
+
+
+@dataclass
+class MK8GhostBulkConversionReport:
+    """ Outcome of converting a folder of ghosts """
+    target_ghost_type: MK8GhostType
+    # (source file, output file)
+    exported: list[tuple[str, str]] = field(default_factory=list)
+    # (source file, reason)
+    skipped: list[tuple[str, str]] = field(default_factory=list)
+    # (source file, error)
+    failed: list[tuple[str, str]] = field(default_factory=list)
+
+    def summary(self, max_lines: int = 10) -> str:
+        """ Human-readable summary of the conversion, listing at most `max_lines` skipped and failed ghosts """
+        target = "Staff Ghost" if self.target_ghost_type == MK8GhostType.STAFF_GHOST else "Downloaded Ghost"
+        lines = [f"Converted {len(self.exported)} ghost(s) to {target}s. Skipped {len(self.skipped)}, failed {len(self.failed)}."]
+        problems = [f"Failed: {os.path.basename(path)}: {error}" for path, error in self.failed]
+        problems += [f"Skipped: {os.path.basename(path)}: {reason}" for path, reason in self.skipped]
+        lines += problems[:max_lines]
+        if len(problems) > max_lines:
+            lines.append(f"...and {len(problems) - max_lines} more.")
+        return "\n".join(lines)
+
+@dataclass
+class _MK8GhostConversionSource:
+    """ A ghost file that can be converted """
+    path: str
+    filename_data: MK8GhostFilenameData
+    has_header: bool
+
+    def get_total_time(self) -> int:
+        """ Total time of the ghost, in milliseconds """
+        return (self.filename_data.total_minutes * 60 + self.filename_data.total_seconds) * 1000 + self.filename_data.total_ms
+
+
+class MK8GhostBulkConverter:
+    """
+        Converts all ghosts in a folder (e.g. a save folder) to staff ghosts or downloaded ghosts at once.
+
+        Staff ghosts are stored per track, so only the fastest ghost of each track is exported. There are
+        only 16 downloaded ghost slots, which are assigned in order while skipping slots that are already
+        used by downloaded ghosts in the output folder.
+    """
+    # Downloaded ghosts can be stored in these slots
+    DOWNLOADED_GHOST_SLOTS = range(16)
+
+    # Staff ghosts are numbered by their track ID, starting from this track ID
+    STAFF_GHOST_FIRST_TRACK_ID = 16
+
+    def __init__(self, max_workers: int|None = None) -> None:
+        # Converting is mostly waiting on the disc, so threads suffice. Defaults to ThreadPoolExecutor's default
+        self.max_workers = max_workers
+
+    def convert_folder(self, source_folder: str, output_folder: str, target_ghost_type: MK8GhostType) -> MK8GhostBulkConversionReport:
+        """ Converts all eligible ghosts in the source folder (tree) into the output folder """
+        if target_ghost_type not in (MK8GhostType.STAFF_GHOST, MK8GhostType.DOWNLOADED_GHOST):
+            raise ValueError(f"Cannot convert ghosts to {target_ghost_type}.")
+
+        report = MK8GhostBulkConversionReport(target_ghost_type)
+        source_files = [path for path in MK8GhostScanner().iter_ghostfiles(source_folder)
+                        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(output_folder)]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Read all ghosts
+            sources = []
+            for path, result in zip(source_files, executor.map(self._load_source, source_files)):
+                if isinstance(result, str):
+                    report.failed.append((path, result))
+                elif result.filename_data.ghost_type == target_ghost_type:
+                    report.skipped.append((path, "Ghost already has this ghost type."))
+                elif result.filename_data.ghost_type == MK8GhostType.MKTV_REPLAY:
+                    report.skipped.append((path, "MKTV replays cannot be converted."))
+                else:
+                    sources.append(result)
+
+            # Decide on the ghost number of each ghost (this must be done in order to prevent collisions)
+            if target_ghost_type == MK8GhostType.STAFF_GHOST:
+                assignments = self._assign_staff_ghosts(sources, output_folder, report)
+            else:
+                assignments = self._assign_downloaded_ghost_slots(sources, output_folder, report)
+
+            # Write all ghosts
+            converter = MK8GhostConverter()
+            def export(assignment: tuple[_MK8GhostConversionSource, int]) -> str:
+                source, ghost_slot = assignment
+                if target_ghost_type == MK8GhostType.STAFF_GHOST:
+                    return converter.export_as_staff(source.path, source.filename_data, source.has_header, output_folder)
+                return converter.export_as_downloaded(source.path, source.filename_data, source.has_header, output_folder, ghost_slot)
+
+            futures = [(source, executor.submit(export, (source, ghost_slot))) for source, ghost_slot in assignments]
+            for source, future in futures:
+                try:
+                    report.exported.append((source.path, future.result()))
+                except OSError as e:
+                    logging.error(f"Could not convert {source.path}: {e}")
+                    report.failed.append((source.path, str(e)))
+
+        logging.info(f"Converted {len(report.exported)} ghosts from {source_folder} to {output_folder}, skipped {len(report.skipped)}, failed {len(report.failed)}")
+        return report
+
+    def _load_source(self, path: str) -> _MK8GhostConversionSource|str:
+        """ Parses the information needed to convert a ghost file, or returns an error message if that is not possible """
+        try:
+            filename = os.path.basename(path).rpartition(".")[0]
+            filename_data = MK8GhostFilenameParser().parse(filename)
+            has_header = MK8GhostDataDecoder().read(path).has_header
+        except (ValueError, NotImplementedError, OSError) as e:
+            return str(e)
+        return _MK8GhostConversionSource(path, filename_data, has_header)
+
+    def _get_used_ghost_numbers(self, output_folder: str, ghost_type: MK8GhostType) -> set[int]:
+        """ Gets the ghost numbers that are already used by ghosts of the given type in the output folder """
+        used = set()
+        parser = MK8GhostFilenameParser()
+        with os.scandir(output_folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(MK8GhostScanner.GHOST_FILE_EXTENSION):
+                    continue
+                try:
+                    filename_data = parser.parse(entry.name.rpartition(".")[0])
+                except (ValueError, NotImplementedError):
+                    continue
+                if filename_data.ghost_type == ghost_type:
+                    used.add(filename_data.ghost_number)
+        return used
+
+    def _assign_staff_ghosts(self, sources: Iterable[_MK8GhostConversionSource], output_folder: str, report: MK8GhostBulkConversionReport) -> list[tuple[_MK8GhostConversionSource, int]]:
+        """ Picks the fastest ghost for each track that does not have a staff ghost in the output folder yet """
+        used_tracks = self._get_used_ghost_numbers(output_folder, MK8GhostType.STAFF_GHOST)
+        fastest: dict[int, _MK8GhostConversionSource] = {}
+        for source in sources:
+            ghost_number = source.filename_data.track_id - self.STAFF_GHOST_FIRST_TRACK_ID
+            if ghost_number < 0:
+                report.skipped.append((source.path, "Ghost has an invalid track ID."))
+            elif ghost_number in used_tracks:
+                report.skipped.append((source.path, "Output folder already contains a staff ghost for this track."))
+            elif ghost_number in fastest and fastest[ghost_number].get_total_time() <= source.get_total_time():
+                report.skipped.append((source.path, "A faster ghost exists for this track."))
+            else:
+                if ghost_number in fastest:
+                    report.skipped.append((fastest[ghost_number].path, "A faster ghost exists for this track."))
+                fastest[ghost_number] = source
+        return [(source, ghost_number) for ghost_number, source in sorted(fastest.items())]
+
+    def _assign_downloaded_ghost_slots(self, sources: Iterable[_MK8GhostConversionSource], output_folder: str, report: MK8GhostBulkConversionReport) -> list[tuple[_MK8GhostConversionSource, int]]:
+        """ Assigns the free downloaded ghost slots of the output folder to the ghosts, in order """
+        used_slots = self._get_used_ghost_numbers(output_folder, MK8GhostType.DOWNLOADED_GHOST)
+        free_slots = iter([slot for slot in self.DOWNLOADED_GHOST_SLOTS if slot not in used_slots])
+        assignments = []
+        for source in sources:
+            slot = next(free_slots, None)
+            if slot is None:
+                report.skipped.append((source.path, "All downloaded ghost slots are in use."))
+            else:
+                assignments.append((source, slot))
+        return assignments
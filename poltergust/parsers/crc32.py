@@ -0,0 +1,66 @@
+"""
+    CRC-32 helpers for updating the checksum of the player ghost header without reading the whole ghost.
+
+    CRC-32 is linear over GF(2): changing bytes `old` into `new` at `offset` in a message of `length` bytes
+    changes its CRC by the zero-initialized CRC of `old ^ new`, multiplied by x^(8 * bytes after the change)
+    modulo the CRC polynomial. This is the same math as zlib's crc32_combine.
+"""
+import binascii
+from typing import BinaryIO, Iterable
+
+# CRC-32 polynomial (reversed bit order)
+POLYNOMIAL = 0xedb88320
+
+# Size of the blocks in which files are read when the CRC-32 has to be calculated from scratch
+CHUNK_SIZE = 1 << 16
+
+
+def _multmodp(a: int, b: int) -> int:
+    """ Multiplies two polynomials modulo the CRC-32 polynomial (reversed bit order) """
+    m = 1 << 31
+    p = 0
+    while True:
+        if a & m:
+            p ^= b
+            if (a & (m - 1)) == 0:
+                return p
+        m >>= 1
+        b = (b >> 1) ^ POLYNOMIAL if b & 1 else b >> 1
+
+# x^(2^n) modulo the CRC-32 polynomial
+_X2N_TABLE = [1 << 30]
+for _ in range(31):
+    _X2N_TABLE.append(_multmodp(_X2N_TABLE[-1], _X2N_TABLE[-1]))
+
+def _x8nmodp(n: int) -> int:
+    """ Gets x^(8n) modulo the CRC-32 polynomial, i.e. the effect of appending n zero bytes """
+    p = 1 << 31 # x^0
+    k = 3
+    while n:
+        if n & 1:
+            p = _multmodp(_X2N_TABLE[k & 31], p)
+        n >>= 1
+        k += 1
+    return p
+
+def crc32_update(crc: int, length: int, changes: Iterable[tuple[int, bytes, bytes]]) -> int:
+    """
+        Updates the CRC-32 of a message of `length` bytes after some of its bytes were changed.
+        Each change is given as (offset in the message, old bytes, new bytes).
+    """
+    for offset, old, new in changes:
+        if len(old) != len(new) or offset < 0 or offset + len(old) > length:
+            raise ValueError(f"Cannot update CRC-32 for a change of {len(old)} to {len(new)} bytes at offset {offset:#x} in a message of {length} bytes.")
+        delta = bytes(a ^ b for a, b in zip(old, new))
+        # Zero-initialized CRC-32 without final xor
+        delta_crc = binascii.crc32(delta, 0xffffffff) ^ 0xffffffff
+        crc ^= _multmodp(_x8nmodp(length - offset - len(old)), delta_crc)
+    return crc
+
+def crc32_file(f: BinaryIO, offset: int = 0) -> int:
+    """ Calculates the CRC-32 over everything after the given offset in a file, reading it in chunks """
+    f.seek(offset)
+    crc = 0
+    while chunk := f.read(CHUNK_SIZE):
+        crc = binascii.crc32(chunk, crc)
+    return crc
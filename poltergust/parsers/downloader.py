@@ -1,17 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timedelta
 import io
 import logging
-import requests
+import os
+import threading
+from typing import Callable, Iterable
 
-from PIL import Image, ImageOps
+import requests
+from requests.adapters import HTTPAdapter
 
+from poltergust.models.ct_storage import MK8CTStorage, MK8HTTPCacheEntry
 from poltergust.models.mod_models import MK8CustomTrack
-from poltergust.models.mod_sites import API_MOD_SITES, MK8APIModSite, ModDownloadException
+from poltergust.models.mod_sites import API_MOD_SITES, MK8APIModSite, ModDownloadException, ModDownloadTemporaryException
 
 
 class PoltergustDownloader:
-    """ Connects to the API endpoint of `MOD_SITES` and fetches a mod's information from them. """
+    """
+        Connects to the API endpoint of `MOD_SITES` and fetches a mod's information from them.
+        All downloaders share a single session, so connections to a site are kept alive and reused.
+
+        Mod information and preview images are only downloaded again if they changed since they were
+        last downloaded (using ETag/Last-Modified), and are not checked at all within `cache_ttl`.
+        If `rate_limit` is given, it is called with the mod site before each request to its API, and may block.
+    """
     TIMEOUT = 6.05
 
+    # Time during which a previous download is used without checking whether it changed
+    CACHE_TTL = timedelta(days=1)
+
+    # Maximum number of simultaneous requests to a single mod site (and connections kept open to it)
+    MAX_REQUESTS_PER_SITE = 4
+
+    # Preview images larger than this (in bytes) are not downloaded
+    MAX_PREVIEW_IMAGE_SIZE = 5*1000*1000
+    # Size of the blocks in which preview images are downloaded
+    PREVIEW_IMAGE_CHUNK_SIZE = 1 << 16
+
+    _session: requests.Session|None = None
+    _session_lock = threading.Lock()
+    _site_semaphores: dict[int, threading.BoundedSemaphore] = {}
+
+    def __init__(self, cache_ttl: timedelta|None = None, rate_limit: Callable[[MK8APIModSite], None]|None = None) -> None:
+        self.cache_ttl = cache_ttl if cache_ttl is not None else self.CACHE_TTL
+        self.rate_limit = rate_limit
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """ Gets the session shared by all downloaders """
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(API_MOD_SITES) + 1, pool_maxsize=cls.MAX_REQUESTS_PER_SITE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                cls._session = session
+            return cls._session
+
+    @classmethod
+    def get_site_semaphore(cls, site: MK8APIModSite) -> threading.BoundedSemaphore:
+        """ Gets the semaphore limiting the number of simultaneous requests to a mod site """
+        with cls._session_lock:
+            return cls._site_semaphores.setdefault(site.id, threading.BoundedSemaphore(cls.MAX_REQUESTS_PER_SITE))
+
     def download_from_url(self, site_url: str) -> MK8CustomTrack:
         """
             Fetches mod data from a given site_url, raising a ModDownloadException if
@@ -32,16 +83,199 @@ class PoltergustDownloader:
         if api_endpoint is None:
             api_endpoint = site.get_api_endpoint(identifier)
 
+        # A previous download can only be reused if the mod is still in the database
+        db = MK8CTStorage()
+        cache_entry = db.get_http_cache_entry(api_endpoint)
+        cached_mod = None
+        if cache_entry is not None and cache_entry.mod_id is not None:
+            cached_mod = db.find_mod(cache_entry.mod_id, cache_entry.mod_site_id)
+            if cached_mod is not None and self._is_fresh(cache_entry):
+                return cached_mod
+
+        res = self._request(site, api_endpoint, cache_entry if cached_mod is not None else None)
+        if res.status_code == 304:
+            logging.info(f"Mod infos did not change: {api_endpoint}")
+            self._store_cache_entry(replace(cache_entry, checked_at=datetime.now()))
+            return cached_mod
+
+        json_res = self._get_continued_json(site, api_endpoint, res.json())
+        mod = self._create_mod(site, identifier, site.clean_json(json_res))
+        self._store_cache_entry(self._create_cache_entry(api_endpoint, res, mod))
+        return mod
+
+    def download_batch(self, site: MK8APIModSite, mod_ids: list[str]) -> dict[str, MK8CustomTrack|ModDownloadException]:
+        """
+            Fetches the mod data of several mods from a site that supports batch requests, using as few
+            requests as possible. Each mod is validated on its own; a mod that could not be downloaded
+            is replaced by the exception explaining why. Mods missing from a batch response are downloaded
+            on their own, so one invalid mod cannot make a whole batch fail. Batch requests are not
+            conditional, but keep the validators stored by `download` for later single downloads.
+        """
+        results = {}
+
+        # Mods that were checked within `cache_ttl` are not requested again
+        db = MK8CTStorage()
+        to_download = []
+        cache_entries: dict[str, MK8HTTPCacheEntry|None] = {}
+        for mod_id in mod_ids:
+            cache_entry = cache_entries[mod_id] = db.get_http_cache_entry(site.get_api_endpoint(mod_id))
+            if cache_entry is not None and cache_entry.mod_id is not None and self._is_fresh(cache_entry):
+                cached_mod = db.find_mod(cache_entry.mod_id, cache_entry.mod_site_id)
+                if cached_mod is not None:
+                    results[mod_id] = cached_mod
+                    continue
+            to_download.append(mod_id)
+
+        for start in range(0, len(to_download), site.batch_size):
+            batch = to_download[start:start + site.batch_size]
+            try:
+                api_endpoint = site.get_batch_api_endpoint(batch)
+                clean_jsons = site.split_batch_json(batch, self._get_json(site, api_endpoint))
+            except ModDownloadException as e:
+                logging.error(e)
+                results.update((mod_id, e) for mod_id in batch)
+                continue
+            except (KeyError, ValueError, TypeError) as e:
+                results.update((mod_id, self._unexpected_response(site, mod_id, e)) for mod_id in batch)
+                continue
+
+            for mod_id in batch:
+                if mod_id not in clean_jsons:
+                    results[mod_id] = self._download_single(site, mod_id)
+                    continue
+                try:
+                    mod = self._create_mod(site, mod_id, clean_jsons[mod_id])
+                    # Batch responses have no validators per mod; only remember when the mod was checked, keeping
+                    # the validators of its last single download (if the mod changed since, they just won't match)
+                    cache_entry = cache_entries[mod_id] or MK8HTTPCacheEntry(site.get_api_endpoint(mod_id), None, None, datetime.now())
+                    self._store_cache_entry(replace(cache_entry, checked_at=datetime.now(), mod_site_id=site.id, mod_id=mod.mod_id))
+                    results[mod_id] = mod
+                except ModDownloadException as e:
+                    logging.error(e)
+                    results[mod_id] = e
+                except (KeyError, ValueError, TypeError) as e:
+                    results[mod_id] = self._unexpected_response(site, mod_id, e)
+        return results
+
+    def download_many(self, mods: Iterable[tuple[MK8APIModSite, str]], max_workers: int|None = None) -> list[MK8CustomTrack|ModDownloadException]:
+        """
+            Fetches the mod data of many (site, identifier) pairs at once. Mods by mod_id are grouped into
+            batch requests for sites that support them. Requests to different sites run concurrently, and at
+            most `MAX_REQUESTS_PER_SITE` requests run at once per site. Returns the mods in the given order;
+            a mod that could not be downloaded is replaced by the exception explaining why.
+        """
+        mods = list(mods)
+        if max_workers is None:
+            max_workers = self.MAX_REQUESTS_PER_SITE * len(API_MOD_SITES)
+
+        def download(mod: tuple[MK8APIModSite, str]) -> dict[tuple[int, str], MK8CustomTrack|ModDownloadException]:
+            site, identifier = mod
+            return {(site.id, identifier): self._download_single(site, identifier)}
+
+        def download_batch(batch: tuple[MK8APIModSite, list[str]]) -> dict[tuple[int, str], MK8CustomTrack|ModDownloadException]:
+            site, mod_ids = batch
+            return {(site.id, mod_id): result for mod_id, result in self.download_batch(site, mod_ids).items()}
+
+        # Group mods by site (without duplicates) to request them in batches
+        singles = []
+        batchable: dict[int, tuple[MK8APIModSite, list[str]]] = {}
+        unique_mods = {(site.id, identifier): (site, identifier) for site, identifier in mods}
+        for site, identifier in unique_mods.values():
+            if site.batch_size > 1 and identifier.isdigit():
+                batchable.setdefault(site.id, (site, []))[1].append(identifier)
+            else:
+                singles.append((site, identifier))
+        batches = [(site, mod_ids[start:start + site.batch_size]) for site, mod_ids in batchable.values() for start in range(0, len(mod_ids), site.batch_size)]
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(singles) + len(batches)))) as executor:
+            futures = [executor.submit(download_batch, batch) for batch in batches]
+            futures += [executor.submit(download, mod) for mod in singles]
+            for future in futures:
+                results.update(future.result())
+        return [results[(site.id, identifier)] for site, identifier in mods]
+
+    def _download_single(self, site: MK8APIModSite, identifier: str) -> MK8CustomTrack|ModDownloadException:
+        """ Fetches the mod data of a single mod; a mod that could not be downloaded is replaced by the exception explaining why """
+        try:
+            return self.download(site, identifier)
+        except ModDownloadException as e:
+            logging.error(e)
+            return e
+        except (KeyError, ValueError, TypeError) as e:
+            return self._unexpected_response(site, identifier, e)
+
+    def _get_json(self, site: MK8APIModSite, api_endpoint: str) -> dict|list:
+        """ Fetches the json response of a site's API endpoint, including the remainder of responses that are continued """
+        return self._get_continued_json(site, api_endpoint, self._request(site, api_endpoint).json())
+
+    def _get_continued_json(self, site: MK8APIModSite, api_endpoint: str, json_res: dict|list) -> dict|list:
+        """ Fetches the remainder of a json response (if it was continued) """
+        continuation_endpoint = site.get_continuation_endpoint(api_endpoint, json_res)
+        while continuation_endpoint is not None:
+            continued_json = self._request(site, continuation_endpoint).json()
+            json_res = site.merge_continuation_json(json_res, continued_json)
+            continuation_endpoint = site.get_continuation_endpoint(api_endpoint, continued_json)
+        return json_res
+
+    def _request(self, site: MK8APIModSite, api_endpoint: str, cache_entry: MK8HTTPCacheEntry|None = None) -> requests.Response:
+        """
+            Performs a single request to a site's API. If a cache entry is given, the request is conditional,
+            and the response may be 304 (Not Modified).
+        """
         try:
             logging.info(f"Downloading mod infos from: {api_endpoint}")
-            res = requests.get(api_endpoint, timeout=self.TIMEOUT)
+            if self.rate_limit is not None:
+                self.rate_limit(site)
+            with self.get_site_semaphore(site):
+                res = self.get_session().get(api_endpoint, headers=self._get_conditional_headers(cache_entry), timeout=self.TIMEOUT)
         except requests.ConnectTimeout as e:
-            raise ModDownloadException(f"Could not reach {site.name}. The site may be down or you may not have an Internet connection.") from e
+            raise ModDownloadTemporaryException(f"Could not reach {site.name}. The site may be down or you may not have an Internet connection.") from e
+        except (requests.Timeout, requests.ConnectionError) as e:
+            raise ModDownloadTemporaryException(f"Something went wrong when fetching the mod data from {site.name}: {e}. Please try again later.") from e
+        except requests.RequestException as e:
+            raise ModDownloadException(f"Something went wrong when fetching the mod data from {site.name}: {e}. Please try again later.") from e
 
+        if res.status_code == 304 and cache_entry is not None:
+            return res
         if res.status_code != 200:
-            raise ModDownloadException(f"Something went wrong when fetching the mod data from {site.name}: HTTP {res.status_code}. Please try again later.")
+            self._raise_for_status(res, f"Something went wrong when fetching the mod data from {site.name}: HTTP {res.status_code}. Please try again later.")
+        return res
+
+    def _raise_for_status(self, res: requests.Response, message: str) -> None:
+        """ Raises the exception for an unsuccessful response; server errors and rate limits are temporary """
+        if res.status_code == 429 or res.status_code >= 500:
+            retry_after = res.headers.get('Retry-After')
+            raise ModDownloadTemporaryException(message, retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        raise ModDownloadException(message)
 
-        clean_json = site.clean_json(res.json())
+    def _is_fresh(self, cache_entry: MK8HTTPCacheEntry) -> bool:
+        """ Checks whether a previous download is recent enough to not check whether it changed """
+        return datetime.now() - cache_entry.checked_at < self.cache_ttl
+
+    def _get_conditional_headers(self, cache_entry: MK8HTTPCacheEntry|None) -> dict[str, str]:
+        """ Gets the headers that make a request return 304 (Not Modified) if the previous download did not change """
+        headers = {}
+        if cache_entry is not None:
+            if cache_entry.etag is not None:
+                headers['If-None-Match'] = cache_entry.etag
+            if cache_entry.last_modified is not None:
+                headers['If-Modified-Since'] = cache_entry.last_modified
+        return headers
+
+    def _create_cache_entry(self, url: str, res: requests.Response, mod: MK8CustomTrack|None = None) -> MK8HTTPCacheEntry:
+        """ Creates a cache entry from the validators of a response """
+        return MK8HTTPCacheEntry(url, res.headers.get('ETag'), res.headers.get('Last-Modified'), datetime.now(),
+            mod_site_id=mod.mod_site.id if mod is not None else None, mod_id=mod.mod_id if mod is not None else None)
+
+    def _store_cache_entry(self, cache_entry: MK8HTTPCacheEntry) -> None:
+        """ Stores a cache entry in the database """
+        db = MK8CTStorage()
+        db.set_http_cache_entry(cache_entry)
+        db.commit()
+
+    def _create_mod(self, site: MK8APIModSite, identifier: str, clean_json: dict) -> MK8CustomTrack:
+        """ Validates the cleaned json of a single mod, and creates the mod from it """
         site.validate(clean_json)
 
         mod = MK8CustomTrack(
@@ -53,6 +287,11 @@ class PoltergustDownloader:
         )
         return mod
 
+    def _unexpected_response(self, site: MK8APIModSite, identifier: str, e: Exception) -> ModDownloadException:
+        """ Creates the exception for a response that did not have the expected format """
+        logging.error(f"Unexpected response from {site.name} for mod {identifier}: {e!r}")
+        return ModDownloadException(f"Unexpected response from {site.name} for mod {identifier}. The API might have changed!")
+
     def get_mod_site_for_url(self, site_url: str) -> tuple[MK8APIModSite, str, str]:
         """
             Gets a (mod_site, identifier, api_endpoint) triple for a given URL.
@@ -69,21 +308,80 @@ class PoltergustDownloader:
                     return site, identifier, api_endpoint
         return None, None, None
 
+    def _read_preview_image(self, res: requests.Response, preview_url: str) -> bytearray:
+        """
+            Reads the body of a streamed preview image response, giving up as soon as it exceeds `MAX_PREVIEW_IMAGE_SIZE`
+            :raise: ModDownloadException if the image is too large or the download is interrupted
+        """
+        too_large_message = f"Image preview size too large: {preview_url}. Max size is {self.MAX_PREVIEW_IMAGE_SIZE // (1000*1000)}MB."
+
+        # Servers may leave out the length, so it is checked again while reading
+        content_length = res.headers.get('content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.MAX_PREVIEW_IMAGE_SIZE:
+            raise ModDownloadException(too_large_message)
+
+        content = bytearray()
+        try:
+            for chunk in res.iter_content(chunk_size=self.PREVIEW_IMAGE_CHUNK_SIZE):
+                content += chunk
+                if len(content) > self.MAX_PREVIEW_IMAGE_SIZE:
+                    raise ModDownloadException(too_large_message)
+        except requests.RequestException as e:
+            raise ModDownloadTemporaryException(f"Could not download {preview_url}: {e}. Please check your Internet connection.") from e
+        return content
+
+    def download_mod_preview_image(self, mod: MK8CustomTrack) -> None:
+        """ Downloads the preview image of a downloaded mod into the cache, and makes the mod point to the cached image """
+        if mod.preview_image is None or not mod.preview_image.startswith(("http://", "https://")):
+            # No preview image, or it is already cached
+            return
+
+        preview_path = MK8CTStorage.MOD_PREVIEW_PATH % {'mod_id': mod.mod_id, 'mod_site_id': mod.mod_site.id}
+        self.download_preview_image(mod.preview_image, preview_path)
+        mod.preview_image = preview_path
+
     def download_preview_image(self, preview_url: str, output_path: str) -> None:
         """ Downloads a preview image from a given URL to a given path on the system """
+        # Only needed for downloading images; importing them takes a while
+        from PIL import Image, ImageOps
+
+        from poltergust.models.preview_cache import MK8PreviewCache
+
+        # A previous download can only be reused if the image is still on the system
+        cache_entry = None
+        if os.path.exists(output_path):
+            cache_entry = MK8CTStorage().get_http_cache_entry(preview_url)
+            if cache_entry is not None and self._is_fresh(cache_entry):
+                return
+
         logging.info(f"Downloading preview image from: {preview_url}")
-        with requests.get(preview_url, stream=True, timeout=self.TIMEOUT) as res:
+        try:
+            res = self.get_session().get(preview_url, headers=self._get_conditional_headers(cache_entry), stream=True, timeout=self.TIMEOUT)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            raise ModDownloadTemporaryException(f"Could not download {preview_url}: {e}. Please check your Internet connection.") from e
+        except requests.RequestException as e:
+            raise ModDownloadException(f"Could not download {preview_url}: {e}.") from e
+
+        with res:
+            if res.status_code == 304 and cache_entry is not None:
+                logging.info(f"Preview image did not change: {preview_url}")
+                self._store_cache_entry(replace(cache_entry, checked_at=datetime.now()))
+                return
+
             if res.status_code != 200:
-                raise ModDownloadException(f"Could not download {preview_url}: HTTP {res.status_code}. Please check your Internet connection.")
-
-            # Check image size (assumes this is actually correct)
-            if int(res.headers['content-length']) > 5*1000*1000:
-                raise ModDownloadException(f"Image preview size too large: {res.headers['content-length']}. Max size is 50Mb.")
-
-            with io.BytesIO(res.content) as f:
-                with Image.open(f) as img:
-                    # Resize and crop image to expected size
-                    img = ImageOps.fit(img, MK8CustomTrack.PREVIEW_SIZE)
-                    # Discard alpha channel (if present)
-                    img = img.convert('RGB')
-                    img.save(output_path)
+                self._raise_for_status(res, f"Could not download {preview_url}: HTTP {res.status_code}. Please check your Internet connection.")
+
+            with io.BytesIO(self._read_preview_image(res, preview_url)) as f:
+                try:
+                    with Image.open(f) as img:
+                        # Let JPEGs decode at a reduced scale that still covers the expected size
+                        img.draft('RGB', MK8CustomTrack.PREVIEW_SIZE)
+                        # Resize and crop image to expected size
+                        img = ImageOps.fit(img, MK8CustomTrack.PREVIEW_SIZE)
+                        # Discard alpha channel (if present)
+                        img = img.convert('RGB')
+                except (OSError, Image.DecompressionBombError) as e:
+                    raise ModDownloadException(f"Could not read the preview image at {preview_url}: {e}") from e
+            # Also store it at the sizes shown in the UI
+            MK8PreviewCache().store(img, output_path)
+        self._store_cache_entry(self._create_cache_entry(preview_url, res))
@@ -1,18 +1,36 @@
 from abc import ABC
-import binascii
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import logging
 import os
-from tkinter import messagebox
+import struct
 from poltergust.models.ct_storage import MK8CTStorage
 
 from poltergust.models.game_models import MK8Course
 from poltergust.models.gamedata import COURSE_IDS
 from poltergust.models.mod_models import UNKNOWN_CUSTOM_TRACK, MK8CustomTrack, MK8ModVersion
-from poltergust.models.mod_sites import API_MOD_SITES, ModDownloadException
-from poltergust.parsers.downloader import PoltergustDownloader
+from poltergust.models.mod_sites import API_MOD_SITES, ModDownloadException, ModDownloadTemporaryException
+from poltergust.parsers.crc32 import crc32_file, crc32_update
 
 
+@dataclass
+class MK8GhostRawData:
+    """
+        Dataclass containing the undecoded information at the start of Mario Kart 8 ghost files.
+    """
+    has_header: bool
+    header_crc: int|None
+    course_id: int
+
+    # Poltergust injects
+    mod_version: tuple[int, int, int]
+    mod_site_id: int
+    mod_id: int
+
+    # Mii data
+    mii_data: bytes
+    mii_padding: bytes
+    mii_checksum: int
+
 @dataclass
 class MK8GhostData:
     """
@@ -27,6 +45,9 @@ class MK8GhostData:
     mod: MK8CustomTrack|None
     mod_version: MK8ModVersion|None
 
+    # Undecoded data the above was parsed from
+    raw: MK8GhostRawData|None = None
+
 class MK8GhostDataOffsetInfos(ABC):
     """ Offets for information embedded in ghost files """
     HEADER_PREFIX = "CTG0" # Identifier of the player ghost header
@@ -40,6 +61,9 @@ class MK8GhostDataOffsetInfos(ABC):
     POLTERGUST_MOD_SITE_OFFSET = 0x237 # u1
     POLTERGUST_MOD_ID_OFFSET = 0x238 # u4
 
+    # Mii data (0x5c bytes), followed by two zero bytes and a CRC-16 XMODEM checksum
+    MII_OFFSET = 0x244
+
     def _has_header(self) -> bool:
         """ Checks whether the player ghost header is present on a file. Requires `self.f to be set` """
         self.f.seek(0, os.SEEK_SET)
@@ -55,10 +79,70 @@ class MK8GhostDataOffsetInfos(ABC):
         """ Shortcut to seek at an offset relative to the player ghost header """
         self.f.seek(self.get_offset(offset), os.SEEK_SET)
 
+class MK8GhostDataDecoder(MK8GhostDataOffsetInfos):
+    """
+        Decodes the information at the start of Mario Kart 8 ghost files in one go,
+        rather than seeking to (and reading) each individual value.
+    """
+    # Layouts of the data at the above offsets
+    CRC32_STRUCT = struct.Struct(">I")
+    COURSE_ID_STRUCT = struct.Struct(">I")
+    POLTERGUST_STRUCT = struct.Struct(">BBBBI") # Version (major, minor, patch), site, id
+    MII_STRUCT = struct.Struct(">92s2sH") # Mii data, zero padding, checksum
+
+    # Everything that's decoded is within the first bytes of a ghost file
+    READ_LENGTH = 0x300
+
+    def read(self, input_file: str) -> MK8GhostRawData:
+        """ Reads and decodes the start of the given ghost file """
+        with open(input_file, 'rb') as f:
+            return self.decode(f.read(self.READ_LENGTH))
+
+    def decode(self, data: bytes) -> MK8GhostRawData:
+        """ Decodes the start of a ghost file, with or without the player ghost header """
+        data = memoryview(data)
+        has_header = data[:len(self.HEADER_PREFIX)] == self.HEADER_PREFIX.encode()
+        start = self.HEADER_LENGTH if has_header else 0
+
+        if len(data) < start + self.MII_OFFSET + self.MII_STRUCT.size:
+            raise ValueError(f"Ghost file is too short: found only {len(data)} bytes.")
+
+        header_crc = None
+        if has_header:
+            header_crc, = self.CRC32_STRUCT.unpack_from(data, self.CRC32_OFFSET)
+
+        course_id, = self.COURSE_ID_STRUCT.unpack_from(data, start + self.COURSE_ID_OFFSET)
+        major, minor, patch, mod_site_id, mod_id = self.POLTERGUST_STRUCT.unpack_from(data, start + self.POLTERGUST_MOD_VERSION_OFFSET)
+        mii_data, mii_padding, mii_checksum = self.MII_STRUCT.unpack_from(data, start + self.MII_OFFSET)
+
+        return MK8GhostRawData(
+            has_header=has_header,
+            header_crc=header_crc,
+            course_id=course_id,
+            mod_version=(major, minor, patch),
+            mod_site_id=mod_site_id,
+            mod_id=mod_id,
+            mii_data=mii_data,
+            mii_padding=mii_padding,
+            mii_checksum=mii_checksum
+        )
+
 class MK8GhostDataParser(MK8GhostDataOffsetInfos):
-    """ Parses information from Mario Kart 8 Ghost Files """
+    """
+        Parses information from Mario Kart 8 Ghost Files. If `interactive=False`, the user
+        is never prompted and no mod information is downloaded; this allows running the
+        parser without a UI (e.g. in worker processes).
+    """
+    def __init__(self, interactive: bool = True) -> None:
+        self.interactive = interactive
+
     def _download_modinfos(self, mod_id: int, mod_site_id: int) -> MK8CustomTrack|None:
         """ Downloads a the info of a mod from a given site with a given id """
+        from tkinter import messagebox
+
+        # Downloading is rare compared to parsing, and the downloader takes a while to import
+        from poltergust.parsers.downloader import PoltergustDownloader
+
         try:
             mod_site = API_MOD_SITES[mod_site_id]
 
@@ -68,11 +152,7 @@ class MK8GhostDataParser(MK8GhostDataOffsetInfos):
             db = MK8CTStorage()
 
             mod = downloader.download(mod_site, str(mod_id))
-            if mod.preview_image is not None:
-                # Download image
-                preview_path = db.MOD_PREVIEW_PATH % {'mod_id': mod_id, 'mod_site_id': mod_site_id}
-                downloader.download_preview_image(mod.preview_image, preview_path)
-                mod.preview_image = preview_path
+            downloader.download_mod_preview_image(mod)
 
             # Add downloaded info to the db
             db.add_or_update_mod(mod)
@@ -81,141 +161,128 @@ class MK8GhostDataParser(MK8GhostDataOffsetInfos):
             return mod
         except ModDownloadException as e:
             logging.error(e)
+            # Don't try again every time a ghost linked to this mod is opened
+            db = MK8CTStorage()
+            db.add_mod_lookup_failure(mod_id, mod_site_id, str(e), temporary=isinstance(e, ModDownloadTemporaryException))
+            db.commit()
             messagebox.showerror("Download Error!", str(e))
         return None
 
-    def _get_mod_infos_for_id(self, mod_id: int) -> tuple[MK8CustomTrack, MK8ModVersion]|tuple[None, None]:
-        """ Gets info of a mod for a given id """
-        # Parse mod version (Poltergust injection)
-        self.seek(self.POLTERGUST_MOD_VERSION_OFFSET)
-        mod_version_major = self.f.read(1)
-        mod_version_major = int.from_bytes(mod_version_major, byteorder='big')
-
-        mod_version_minor = self.f.read(1)
-        mod_version_minor = int.from_bytes(mod_version_minor, byteorder='big')
-
-        mod_version_patch = self.f.read(1)
-        mod_version_patch = int.from_bytes(mod_version_patch, byteorder='big')
+    def retry_download_modinfos(self, mod_id: int, mod_site_id: int) -> MK8CustomTrack|None:
+        """ Forgets that downloading the info of a mod failed recently, and downloads it again """
+        db = MK8CTStorage()
+        db.remove_mod_lookup_failure(mod_id, mod_site_id)
+        db.commit()
+        return self._download_modinfos(mod_id, mod_site_id)
 
-        mod_version = MK8ModVersion(mod_version_major, mod_version_minor, mod_version_patch)
+    def _get_mod_infos(self, raw: MK8GhostRawData) -> tuple[MK8CustomTrack, MK8ModVersion]|tuple[None, None]:
+        """ Gets info of the mod a ghost is linked to """
+        # Mod version (Poltergust injection)
+        mod_version = MK8ModVersion(*raw.mod_version)
 
-        # Parse mod site (Poltergust injection)
-        self.seek(self.POLTERGUST_MOD_SITE_OFFSET)
-        mod_site_id = self.f.read(1)
-        mod_site_id = int.from_bytes(mod_site_id, byteorder='big')
+        # Mod site (Poltergust injection)
+        mod_id = raw.mod_id
+        mod_site_id = raw.mod_site_id
 
         if mod_site_id < 0 or mod_site_id >= len(API_MOD_SITES):
             # Invalid data
-            messagebox.showerror("Ghost data corrupted!", f"Found unknown mod site {mod_site_id}! This does not break the ghost, and likely means something went wrong internally in Poltergust.")
+            logging.warning(f"Found unknown mod site {mod_site_id} for mod {mod_id}")
+            if self.interactive:
+                # Only imported when interactive, so the parser can be used without tkinter
+                from tkinter import messagebox
+                messagebox.showerror("Ghost data corrupted!", f"Found unknown mod site {mod_site_id}! This does not break the ghost, and likely means something went wrong internally in Poltergust.")
             return None, None
 
         db = MK8CTStorage()
         mod = db.find_mod(mod_id, mod_site_id)
         if mod is None:
-            # Not found in database
-            should_download = messagebox.askyesno("Download Custom Track Info?", "This ghost file is associated with a custom track. Would you like to download this track's information?\n\nNote: An internet connection is required.")
-            if should_download:
-                mod = self._download_modinfos(mod_id, mod_site_id)
-            else:
-                mod = UNKNOWN_CUSTOM_TRACK
-                mod.mod_site = API_MOD_SITES[mod_site_id]
-                mod.mod_id = mod_id
+            # Not found in database. If downloading it failed recently, don't ask again; the UI offers a retry instead
+            failure = db.find_mod_lookup_failure(mod_id, mod_site_id)
+            if failure is not None:
+                logging.info(f"Not downloading mod {mod_id} from {API_MOD_SITES[mod_site_id]}, as this failed recently: {failure}")
+            elif self.interactive:
+                from tkinter import messagebox
+                if messagebox.askyesno("Download Custom Track Info?", "This ghost file is associated with a custom track. Would you like to download this track's information?\n\nNote: An internet connection is required."):
+                    mod = self._download_modinfos(mod_id, mod_site_id)
+            if mod is None:
+                # Don't modify UNKNOWN_CUSTOM_TRACK itself; it's shared between ghosts
+                mod = replace(UNKNOWN_CUSTOM_TRACK, mod_site=API_MOD_SITES[mod_site_id], mod_id=mod_id)
         return mod, mod_version
 
-
     def parse(self, input_file: str) -> MK8GhostData:
         """ Parses ghost data from the given file """
-        with open(input_file, 'rb') as f:
-            self.f = f
-            self.has_header = self._has_header()
-
-            track_slot = None
-            mod = None
-            mod_version = None
-
-            # Read track slot
-            self.seek(self.COURSE_ID_OFFSET)
-            course_id = f.read(4)
-            course_id = int.from_bytes(course_id, byteorder='big')
-
-            track_slot = COURSE_IDS.get(course_id, None)
-
-            if track_slot is None:
-                raise ValueError(f"Found invalid track slot in ghost file: {course_id}")
+        raw = MK8GhostDataDecoder().read(input_file)
 
-            # Parse mod_id (Poltergust injection)
-            self.seek(self.POLTERGUST_MOD_ID_OFFSET)
-            mod_id = f.read(4)
-            mod_id = int.from_bytes(mod_id, byteorder='big')
+        track_slot = COURSE_IDS.get(raw.course_id, None)
+        if track_slot is None:
+            raise ValueError(f"Found invalid track slot in ghost file: {raw.course_id}")
 
-            if mod_id != 0:
-                mod, mod_version = self._get_mod_infos_for_id(mod_id)
+        mod = None
+        mod_version = None
+        if raw.mod_id != 0:
+            mod, mod_version = self._get_mod_infos(raw)
 
-            return MK8GhostData(self.has_header, track_slot, mod, mod_version)
+        return MK8GhostData(raw.has_header, track_slot, mod, mod_version, raw=raw)
 
 class MK8GhostDataSerializer(MK8GhostDataOffsetInfos):
-    """ Serializes information from Mario Kart 8 Ghost Files """
+    """
+        Serializes information from Mario Kart 8 Ghost Files. Only bytes that actually change are written.
+        The CRC-32 of the player ghost header is updated from the changed bytes alone, unless
+        `incremental_crc=False`, in which case it is recalculated over the entire ghost data
+        (e.g. to repair a ghost whose CRC-32 was already incorrect).
+    """
+
+    def __init__(self, incremental_crc: bool = True) -> None:
+        self.incremental_crc = incremental_crc
 
-    def serialize(self, output_file: str, data: MK8GhostData) -> str:
+    def serialize(self, output_file: str, data: MK8GhostData) -> None:
         """ Serializes ghost data into the given file """
         with open(output_file, 'rb+') as f:
             self.f = f
-            self.has_header = self._has_header()
+            head = f.read(MK8GhostDataDecoder.READ_LENGTH)
+            raw = MK8GhostDataDecoder().decode(head)
+            self.has_header = raw.has_header
 
-            # Write track slot
-            self.seek(self.COURSE_ID_OFFSET)
-            course_id = data.track_slot.course_id.to_bytes(4, byteorder='big')
-            f.write(course_id)
-
-            # Linking to a mod is optional
+            # Linking to a mod is optional; clean up if there is none
             if data.mod is None:
-                # Clean up
-                self.seek(self.POLTERGUST_MOD_VERSION_OFFSET)
-                f.write(int(0).to_bytes(3, byteorder='big'))
-
-                self.seek(self.POLTERGUST_MOD_SITE_OFFSET)
-                f.write(int(0).to_bytes(1, byteorder='big'))
-
-                self.seek(self.POLTERGUST_MOD_ID_OFFSET)
-                f.write(int(0).to_bytes(4, byteorder='big'))
-                return
-
-            # Inject mod version (for Poltergust)
-            self.seek(self.POLTERGUST_MOD_VERSION_OFFSET)
-            mod_version_major = data.mod_version.major.to_bytes(1, byteorder='big')
-            f.write(mod_version_major)
-
-            mod_version_minor = data.mod_version.minor.to_bytes(1, byteorder='big')
-            f.write(mod_version_minor)
-
-            mod_version_patch = data.mod_version.patch.to_bytes(1, byteorder='big')
-            f.write(mod_version_patch)
-
-            # Inject mod site (for Poltergust)
-            self.seek(self.POLTERGUST_MOD_SITE_OFFSET)
-            mod_site = data.mod.mod_site.id.to_bytes(1, byteorder='big')
-            f.write(mod_site)
+                poltergust_data = MK8GhostDataDecoder.POLTERGUST_STRUCT.pack(0, 0, 0, 0, 0)
+            else:
+                version = data.mod_version
+                poltergust_data = MK8GhostDataDecoder.POLTERGUST_STRUCT.pack(version.major, version.minor, version.patch, data.mod.mod_site.id, data.mod.mod_id)
 
-            # Inject mod_id (for Poltergust)
-            self.seek(self.POLTERGUST_MOD_ID_OFFSET)
-            mod_id = data.mod.mod_id.to_bytes(4, byteorder='big')
-            f.write(mod_id)
+            changes = self.write_changes(head, [
+                (self.COURSE_ID_OFFSET, MK8GhostDataDecoder.COURSE_ID_STRUCT.pack(data.track_slot.course_id)),
+                (self.POLTERGUST_MOD_VERSION_OFFSET, poltergust_data),
+            ])
 
-            if self.has_header:
+            if self.has_header and (changes or not self.incremental_crc):
                 # Need to fix the CRC-32
-                crc = self.calculate_crc()
-
                 logging.info("Recalculating CRC-32 for player ghost header.")
-                self.f.seek(self.CRC32_OFFSET, os.SEEK_SET)
-                self.f.write(crc)
-
-    def calculate_crc(self):
+                if self.incremental_crc:
+                    length = os.fstat(f.fileno()).st_size - self.HEADER_LENGTH
+                    crc = crc32_update(raw.header_crc, length, changes)
+                else:
+                    crc = crc32_file(f, self.HEADER_LENGTH)
+                f.seek(self.CRC32_OFFSET, os.SEEK_SET)
+                f.write(MK8GhostDataDecoder.CRC32_STRUCT.pack(crc))
+
+    def write_changes(self, head: bytes, changes: list[tuple[int, bytes]]) -> list[tuple[int, bytes, bytes]]:
+        """
+            Writes (offset, new bytes) pairs into `self.f`, skipping bytes that are already the same in `head`
+            (the start of the file). Offsets are relative to the player ghost header. Returns the changes
+            that were made as (offset, old bytes, new bytes), to update the CRC-32 with.
+        """
+        written = []
+        for offset, new_bytes in changes:
+            file_offset = self.get_offset(offset)
+            old_bytes = head[file_offset:file_offset + len(new_bytes)]
+            if old_bytes == new_bytes:
+                continue
+            self.f.seek(file_offset, os.SEEK_SET)
+            self.f.write(new_bytes)
+            written.append((offset, old_bytes, new_bytes))
+        return written
+
+    def calculate_crc(self) -> bytes:
         """ Calculate the CRC-32 over everything after the header """
-        # Read everything after the header
-        self.seek(0)
-
-        return binascii.crc32(self.f.read()).to_bytes(4, byteorder='big')
-
-
-
-
+        return MK8GhostDataDecoder.CRC32_STRUCT.pack(crc32_file(self.f, self.HEADER_LENGTH))
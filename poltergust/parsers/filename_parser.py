@@ -1,5 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
+import re
+from typing import Callable, ClassVar, Iterable
 
 from poltergust.models.game_models import MK8GhostType
 
@@ -145,33 +147,29 @@ class MK8GhostFilenameParser:
     def parse_game_version(self, filename: str) -> str:
         """ Parses game version from filename """
         # Santity check filename length
-        filename_len = len(filename)
-        valid_filename_lens = [item.value for item in MK8GhostFilenameFormat.Length]
-        if filename_len not in valid_filename_lens:
-            raise ValueError(f"Filename was of incorrect length. Expected one of {', '.join(map(str, valid_filename_lens))}.")
-
-        if filename_len == MK8GhostFilenameFormat.Length.FILENAME_V4.value:
-            return MK8GhostFilenameFormat.GameVersion.FILENAME_V4
-        elif filename_len == MK8GhostFilenameFormat.Length.FILENAME_V3.value:
-            return MK8GhostFilenameFormat.GameVersion.FILENAME_V3
-        return MK8GhostFilenameFormat.GameVersion.FILENAME_V3_NONSTANDARD
+        try:
+            return MK8GhostFilenameCodec.GAME_VERSIONS[len(filename)]
+        except KeyError:
+            valid_filename_lens = [item.value for item in MK8GhostFilenameFormat.Length]
+            raise ValueError(f"Filename was of incorrect length. Expected one of {', '.join(map(str, valid_filename_lens))}.") from None
 
     def parse(self, filename: str) -> MK8GhostFilenameData:
         """ Parses the filename of the attached file"""
         game_version = self.parse_game_version(filename)
-
-        # Parse contents
-        i = 0
-        results = {}
-        for num_chars, identifier, data_type in MK8GhostFilenameFormat.format:
-            if data_type is not None:
-                val = filename[i:i+num_chars]
-                if i + num_chars > len(filename):
-                    # Nothing left to parse
-                    break
-                results[identifier] = getattr(self, f"parse_{data_type.__name__}")(val)
-            i += num_chars
-        return MK8GhostFilenameData(game_version, **results)
+        return MK8GhostFilenameCodec.for_game_version(game_version).decode(filename)
+
+    def parse_many(self, filenames: Iterable[str]) -> list[MK8GhostFilenameData]:
+        """ Parses many filenames at once (e.g. those of a folder listing) """
+        game_versions = MK8GhostFilenameCodec.GAME_VERSIONS
+        codecs = {length: MK8GhostFilenameCodec.for_game_version(game_version) for length, game_version in game_versions.items()}
+        results = []
+        for filename in filenames:
+            codec = codecs.get(len(filename))
+            if codec is None:
+                # Raises an appropriate error
+                self.parse_game_version(filename)
+            results.append(codec.decode(filename))
+        return results
 
 class MK8GhostFilenameSerializer:
     """ Serializes information from the filename of Mario Kart 8 Ghost Files """
@@ -201,20 +199,145 @@ class MK8GhostFilenameSerializer:
     def serialize(self, data: MK8GhostFilenameData) -> str:
         """ Serializes ghost data into a filename as expected by the game """
         # Obtain filename pattern based on game version
-        output = ""
-        chars_remaining = MK8GhostFilenameFormat.Length[data.game_version.name].value
+        return MK8GhostFilenameCodec.for_game_version(data.game_version).encode(data)
+
+class MK8GhostFilenameCodec:
+    """
+        The filename format of a single game version, compiled into functions that parse
+        or serialize filenames without looking up how to handle each individual field.
+        Use `for_game_version` to obtain a (cached) codec.
+    """
+    GAME_VERSIONS: ClassVar[dict[int, MK8GhostFilenameFormat.GameVersion]] = {
+        length.value: MK8GhostFilenameFormat.GameVersion[length.name] for length in MK8GhostFilenameFormat.Length
+    }
+
+    _codecs: ClassVar[dict[MK8GhostFilenameFormat.GameVersion, 'MK8GhostFilenameCodec']] = {}
+
+    def __init__(self, game_version: MK8GhostFilenameFormat.GameVersion) -> None:
+        self.game_version = game_version
+        self.length = MK8GhostFilenameFormat.Length[game_version.name].value
+
+        # (start, end, identifier, data_type) of each field present in filenames of this game version
+        self.fields: list[tuple[int, int, str, type]] = []
+        i = 0
         for num_chars, identifier, data_type in MK8GhostFilenameFormat.format:
-            if data_type is not None:
-                output += getattr(self, f"serialize_{data_type.__name__}")(getattr(data, identifier, None), num_chars)
-            else:
+            if data_type is not None and i + num_chars <= self.length:
+                self.fields.append((i, i + num_chars, identifier, data_type))
+            i += num_chars
+
+        self.decode = self._compile_decoder()
+        self.encode = self._compile_encoder()
+
+    @classmethod
+    def for_game_version(cls, game_version: MK8GhostFilenameFormat.GameVersion) -> 'MK8GhostFilenameCodec':
+        """ Gets the codec for a given game version, compiling it if that was not done before """
+        codec = cls._codecs.get(game_version, None)
+        if codec is None:
+            codec = cls._codecs[game_version] = cls(game_version)
+        return codec
+
+    def _hex_runs(self) -> list[list[tuple[int, int, str]]]:
+        """ Groups hexadecimal number fields that directly follow each other """
+        runs = []
+        end_of_run = None
+        for start, end, identifier, data_type in self.fields:
+            if data_type not in (int, int_lap):
+                continue
+            if start != end_of_run:
+                runs.append([])
+            runs[-1].append((start, end, identifier))
+            end_of_run = end
+        return runs
+
+    def _compile(self, source: str, namespace: dict):
+        """ Compiles the source code of a single function, and returns that function """
+        exec(compile(source, f"<{self.__class__.__name__} {self.game_version.value}>", "exec"), namespace)
+        return namespace[source[len("def "):source.index("(")]]
+
+    def _compile_decoder(self) -> Callable[[str], MK8GhostFilenameData]:
+        """ Compiles a function that parses a filename of this game version """
+        parser = MK8GhostFilenameParser()
+        namespace = {'MK8GhostFilenameData': MK8GhostFilenameData, 'game_version': self.game_version}
+        statements = []
+        values = {}
+
+        # Hexadecimal numbers may only consist of hexadecimal digits (i.e. no signs or prefixes)
+        pattern = ""
+        i = 0
+        for num_chars, identifier, data_type in MK8GhostFilenameFormat.format:
+            num_chars = min(num_chars, self.length - i)
+            if num_chars <= 0:
+                break
+            pattern += f"[0-9a-fA-F]{{{num_chars}}}" if data_type in (int, int_lap) else f".{{{num_chars}}}"
+            i += num_chars
+        namespace['is_valid'] = re.compile(pattern, re.DOTALL).fullmatch
+        statements.append("if is_valid(filename) is None:")
+        statements.append("    raise ValueError(f'Filename contains invalid characters: {filename}')")
+
+        # Each run of hexadecimal numbers is parsed as a single (large) number, which is then split up
+        for i, run in enumerate(self._hex_runs()):
+            run_start, run_end = run[0][0], run[-1][1]
+            statements.append(f"run{i} = int(filename[{run_start}:{run_end}], 16)")
+            for start, end, identifier in run:
+                shift = 4 * (run_end - end)
+                mask = (1 << 4 * (end - start)) - 1
+                values[identifier] = f"run{i} >> {shift} & {mask:#x}"
+
+        # Other fields use the parser's methods
+        for start, end, identifier, data_type in self.fields:
+            if identifier in values:
+                continue
+            parse = namespace[f"parse_{identifier}"] = getattr(parser, f"parse_{data_type.__name__}")
+            values[identifier] = f"parse_{identifier}(filename[{start}:{end}])"
+
+            if issubclass(data_type, Enum):
+                # Look up values that are known to be valid instead
+                namespace[f"known_{identifier}"] = known_values = {}
+                for item in data_type:
+                    try:
+                        known_values[item.value] = parse(item.value)
+                    except NotImplementedError:
+                        pass
+                values[identifier] = f"known_{identifier}.get(filename[{start}:{end}]) or {values[identifier]}"
+
+        # Pass arguments in order; that's faster than using keywords
+        arguments = ""
+        for field in fields(MK8GhostFilenameData)[1:]:
+            if field.name not in values:
+                break
+            arguments += f", {values.pop(field.name)}"
+        arguments += "".join(f", {identifier}={value}" for identifier, value in values.items())
+
+        source = "def decode(filename):\n"
+        source += "".join(f"    {statement}\n" for statement in statements)
+        source += f"    return MK8GhostFilenameData(game_version{arguments})\n"
+        return self._compile(source, namespace)
+
+    def _compile_encoder(self) -> Callable[[MK8GhostFilenameData], str]:
+        """ Compiles a function that serializes data into a filename of this game version """
+        serializer = MK8GhostFilenameSerializer()
+        namespace = {}
+
+        # The filename is built by a single f-string
+        parts = ""
+        chars_remaining = self.length
+        for num_chars, identifier, data_type in MK8GhostFilenameFormat.format:
+            if data_type is None:
                 # Cannot seralize; fill with zeroes
-                output += "0" * min(num_chars, chars_remaining)
+                parts += "0" * min(num_chars, chars_remaining)
+            elif data_type is int:
+                parts += f"{{data.{identifier}:0{num_chars}x}}"
+            else:
+                namespace[f"serialize_{identifier}"] = getattr(serializer, f"serialize_{data_type.__name__}")
+                parts += f"{{serialize_{identifier}(data.{identifier}, {num_chars})}}"
 
             chars_remaining -= num_chars
             if chars_remaining <= 0:
                 # Nothing left to serialize
                 break
-        return output + ".dat"
+
+        source = f"def encode(data):\n    return f'{parts}.dat'\n"
+        return self._compile(source, namespace)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from poltergust.parsers.filename_parser import MK8GhostFilenameCodec, MK8GhostFilenameFormat, MK8GhostFilenameParser, MK8GhostFilenameSerializer, int_lap, str_utf16be
+
+
+class MK8GhostFilenameTableParser:
+    """
+        Parses the filenames of many Mario Kart 8 ghost files at once into a columnar table:
+        a structured NumPy array with one column per field in `MK8GhostFilenameFormat.format`.
+        This uses far less memory than a `MK8GhostFilenameData` per ghost.
+
+        Hexadecimal fields are decoded for all filenames at once. Player names are kept as their
+        raw utf-16-be bytes, and are only decoded when requested through `parse_playername(s)`.
+    """
+    # Number of filenames that are decoded at once (limits the memory used while decoding)
+    CHUNK_SIZE = 1 << 16
+
+    # Game versions are stored by their index in this list
+    GAME_VERSIONS = list(MK8GhostFilenameFormat.GameVersion)
+
+    # Value of each hexadecimal digit (or 0xff if the character is not a hexadecimal digit)
+    _HEX_DIGITS = np.full(256, 0xff, dtype=np.uint8)
+    _HEX_DIGITS[np.frombuffer(b"0123456789abcdefABCDEF", dtype=np.uint8)] = [*range(16), *range(10, 16)]
+
+    def __init__(self) -> None:
+        columns = [('game_version', np.uint8)]
+        for num_chars, identifier, data_type in MK8GhostFilenameFormat.format:
+            if data_type is None:
+                continue
+            elif data_type is str_utf16be:
+                columns.append((identifier, np.void, num_chars // 2))
+            elif data_type in (int, int_lap):
+                columns.append((identifier, np.uint8 if num_chars <= 2 else np.uint16))
+            else:
+                columns.append((identifier, np.dtype(('S', num_chars))))
+        self.dtype = np.dtype(columns)
+
+    def parse(self, filenames: Sequence[str]) -> np.ndarray:
+        """
+            Parses the given filenames (without extension) into a structured array. Laps that are
+            not present in a filename are filled in as they would be serialized (i.e. 9:59.999).
+        """
+        table = np.empty(len(filenames), dtype=self.dtype)
+
+        # Filenames of each game version have their own layout
+        rows_by_length: dict[int, list[int]] = {}
+        for row, filename in enumerate(filenames):
+            rows_by_length.setdefault(len(filename), []).append(row)
+
+        for length, rows in rows_by_length.items():
+            if length not in MK8GhostFilenameCodec.GAME_VERSIONS:
+                # Raises an appropriate error
+                MK8GhostFilenameParser().parse_game_version(filenames[rows[0]])
+
+            codec = MK8GhostFilenameCodec.for_game_version(MK8GhostFilenameCodec.GAME_VERSIONS[length])
+            for chunk_start in range(0, len(rows), self.CHUNK_SIZE):
+                chunk = np.array(rows[chunk_start:chunk_start + self.CHUNK_SIZE])
+                table[chunk] = self._parse_chunk(codec, [filenames[row] for row in chunk])
+        return table
+
+    def _parse_chunk(self, codec: MK8GhostFilenameCodec, filenames: list[str]) -> np.ndarray:
+        """ Parses filenames of a single game version """
+        chunk = np.empty(len(filenames), dtype=self.dtype)
+        chunk['game_version'] = self.GAME_VERSIONS.index(codec.game_version)
+
+        # One row of characters per filename
+        chars = np.frombuffer("".join(filenames).encode('ascii'), dtype=np.uint8).reshape(len(filenames), codec.length)
+        digits = self._HEX_DIGITS[chars]
+
+        serializer = MK8GhostFilenameSerializer()
+        present = set()
+        for start, end, identifier, data_type in codec.fields:
+            present.add(identifier)
+            if data_type is str_utf16be:
+                name_digits = digits[:, start:end]
+                self._check_hex_digits(name_digits, identifier)
+                name_bytes = name_digits[:, 0::2] << 4 | name_digits[:, 1::2]
+                chunk[identifier] = name_bytes.view(chunk.dtype[identifier]).reshape(-1)
+            elif data_type in (int, int_lap):
+                field_digits = digits[:, start:end]
+                self._check_hex_digits(field_digits, identifier)
+                column = np.zeros(len(filenames), dtype=chunk.dtype[identifier])
+                for i in range(end - start):
+                    column = column << 4 | field_digits[:, i]
+                chunk[identifier] = column
+            else:
+                # Enumerations are stored by their (raw) value
+                values = chars[:, start:end].copy().view(chunk.dtype[identifier]).reshape(-1)
+                valid_values = np.array([item.value.encode() for item in data_type], dtype=chunk.dtype[identifier])
+                if not np.isin(values, valid_values).all():
+                    raise ValueError(f"Found invalid values in field '{identifier}'.")
+                chunk[identifier] = values
+
+        # Fill in laps that are not present in this game version
+        for num_chars, identifier, data_type in MK8GhostFilenameFormat.format:
+            if data_type is int_lap and identifier not in present:
+                chunk[identifier] = int(serializer.serialize_int_lap(None, num_chars), 16)
+        return chunk
+
+    def _check_hex_digits(self, digits: np.ndarray, identifier: str) -> None:
+        """ Raises a ValueError if a column contained characters that are not hexadecimal digits """
+        invalid_rows = np.flatnonzero((digits == 0xff).any(axis=1))
+        if len(invalid_rows):
+            raise ValueError(f"Found invalid characters in field '{identifier}' of {len(invalid_rows)} filename(s).")
+
+    def parse_playername(self, row: np.void) -> str:
+        """ Decodes the player name of a single row of a parsed table """
+        return MK8GhostFilenameParser().parse_str_utf16be(row['playername'].tobytes().hex())
+
+    def parse_playernames(self, rows: np.ndarray) -> Iterable[str]:
+        """ Lazily decodes the player names of the given rows of a parsed table """
+        parser = MK8GhostFilenameParser()
+        return (parser.parse_str_utf16be(name.tobytes().hex()) for name in rows['playername'])
+
+    def get_game_version(self, row: np.void) -> MK8GhostFilenameFormat.GameVersion:
+        """ Gets the game version of a single row of a parsed table """
+        return self.GAME_VERSIONS[row['game_version']]
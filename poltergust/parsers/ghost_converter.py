@@ -1,4 +1,6 @@
+import logging
 import os
+from typing import BinaryIO
 
 from poltergust.parsers.filename_parser import MK8GhostFilenameData, MK8GhostFilenameSerializer
 from poltergust.models.game_models import MK8GhostType
@@ -15,6 +17,9 @@ class MK8GhostConverter:
     """
     PLAYER_GHOST_HEADER_SIZE = 0x48
 
+    # Size of the blocks in which ghosts are copied if the OS cannot copy them directly
+    COPY_CHUNK_SIZE = 1 << 16
+
     def export_as_staff(self, source_file: str, filename_data: MK8GhostFilenameData, ghost_has_header: bool, output_folder: str) -> str:
         """ Exports a given ghostfile as a staff ghost """
         # Temporarily change ghost type for the serializer
@@ -59,17 +64,59 @@ class MK8GhostConverter:
             Copies a ghost into another file, optionally removing its header.
             TODO: Add code to reconstruct the header
         """
-        print(f"converting {source_file} to {output_file}")
+        logging.info(f"converting {source_file} to {output_file}")
         # Offset changes if the header needs to be removed.
         copy_offset = 0
         if remove_header:
             copy_offset = self.PLAYER_GHOST_HEADER_SIZE
 
-        # Read current ghost data
-        with open(source_file, 'rb') as file:
-            file.seek(copy_offset, os.SEEK_SET)
-            ghost_data = file.read()
+        with open(source_file, 'rb') as source, open(output_file, 'wb') as output:
+            count = os.fstat(source.fileno()).st_size - copy_offset
+            self._copy_range(source, output, copy_offset, count)
+
+    def _copy_range(self, source: BinaryIO, output: BinaryIO, offset: int, count: int) -> None:
+        """
+            Copies `count` bytes from `offset` in the source file to the start of the output file.
+            Lets the OS copy the data directly between both files where possible, so the ghost
+            data never has to be read into memory. Falls back to copying it in chunks otherwise.
+        """
+        copied = 0
+        for copy_function in (self._copy_file_range, self._sendfile):
+            try:
+                copy_function(source.fileno(), output.fileno(), offset + copied, count - copied)
+            except (AttributeError, OSError):
+                # Not supported by this OS or file system
+                pass
+            # Both write at the position of the output file, which may have moved before an error
+            copied = os.lseek(output.fileno(), 0, os.SEEK_CUR)
+            if copied >= count:
+                return
+
+        # Chunked fallback
+        source.seek(offset + copied, os.SEEK_SET)
+        output.seek(copied, os.SEEK_SET)
+        remaining = count - copied
+        while remaining > 0:
+            chunk = source.read(min(self.COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            output.write(chunk)
+            remaining -= len(chunk)
+
+    def _copy_file_range(self, source_fd: int, output_fd: int, offset: int, count: int) -> None:
+        """ Copies data within the kernel (or file system) using copy_file_range (Linux) """
+        copied = 0
+        while copied < count:
+            num_bytes = os.copy_file_range(source_fd, output_fd, count - copied, offset + copied)
+            if num_bytes == 0:
+                break
+            copied += num_bytes
 
-        # Write new file
-        with open(output_file, 'wb') as file:
-            file.write(ghost_data)
+    def _sendfile(self, source_fd: int, output_fd: int, offset: int, count: int) -> None:
+        """ Copies data within the kernel using sendfile """
+        copied = 0
+        while copied < count:
+            num_bytes = os.sendfile(output_fd, source_fd, offset + copied, count - copied)
+            if num_bytes == 0:
+                break
+            copied += num_bytes
@@ -0,0 +1,107 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from enum import Enum
+import json
+import logging
+import os
+from typing import Callable, Iterable, Iterator, TextIO
+
+from poltergust.models.ct_storage import MK8CTStorage
+from poltergust.models.mod_models import MK8CustomTrack
+from poltergust.parsers.filecontent_parser import MK8GhostDataParser
+from poltergust.parsers.filename_parser import MK8GhostFilenameParser
+
+
+def scan_ghostfile(path: str) -> dict:
+    """
+        Parses both the filename and the contents of a single ghost file into a flat,
+        JSON-serializable record. Never prompts the user; if the ghost file cannot be
+        parsed, the record contains an `error` instead.
+    """
+    record = {'path': path}
+    try:
+        filename = os.path.basename(path).rpartition(".")[0]
+        filename_data = MK8GhostFilenameParser().parse(filename)
+        ghost_data = MK8GhostDataParser(interactive=False).parse(path)
+    except (ValueError, NotImplementedError, OSError) as e:
+        record['error'] = f"{e.__class__.__name__}: {e}"
+        return record
+
+    # Filename data
+    for key, value in asdict(filename_data).items():
+        record[key] = value.value if isinstance(value, Enum) else value
+
+    # File contents
+    record['has_header'] = ghost_data.has_header
+    record['course_id'] = ghost_data.track_slot.course_id
+    record['course_name'] = ghost_data.track_slot.name
+
+    # Poltergust injects
+    record.update(get_mod_record(ghost_data.mod, str(ghost_data.mod_version) if ghost_data.mod_version is not None else None))
+    return record
+
+def get_mod_record(mod: MK8CustomTrack|None, mod_version: str|None) -> dict:
+    """ Gets the fields of a ghost file's record that describe the custom track it is linked to """
+    return {
+        'mod_site': mod.mod_site.id if mod is not None else None,
+        'mod_id': mod.mod_id if mod is not None else None,
+        'mod_name': mod.name if mod is not None else None,
+        'mod_author': mod.author if mod is not None else None,
+        'mod_version': mod_version,
+        # Why the mod is unknown, if downloading it failed recently
+        'mod_lookup_failure': MK8CTStorage().find_mod_lookup_failure(mod.mod_id, mod.mod_site.id) if mod is not None else None,
+    }
+
+
+class MK8GhostScanner:
+    """
+        Scans (large) directory trees for Mario Kart 8 ghost files, and parses their filenames
+        and contents in parallel over a pool of worker processes. Does not require a UI.
+    """
+    GHOST_FILE_EXTENSION = ".dat"
+
+    # Number of ghost files that are sent to a worker process at once
+    CHUNK_SIZE = 64
+
+    def __init__(self, max_workers: int|None = None) -> None:
+        # Defaults to the number of processors on the machine
+        self.max_workers = max_workers
+
+    def iter_ghostfiles(self, root: str) -> Iterator[str]:
+        """ Recursively yields the paths of all ghost files in a directory tree """
+        for entry in self.iter_ghostfile_entries(root):
+            yield entry.path
+
+    def iter_ghostfile_entries(self, root: str) -> Iterator[os.DirEntry]:
+        """ Recursively yields the directory entries of all ghost files in a directory tree """
+        pending = [root]
+        while pending:
+            folder = pending.pop()
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file() and entry.name.lower().endswith(self.GHOST_FILE_EXTENSION):
+                            yield entry
+            except OSError as e:
+                logging.warning(f"Could not scan {folder}: {e}")
+
+    def scan(self, paths: Iterable[str], scan_function: Callable[[str], dict] = scan_ghostfile) -> Iterator[dict]:
+        """
+            Parses the given ghost files in parallel, and yields a record for each of them (in order).
+            `scan_function` must be a module-level function, so it can be sent to the worker processes.
+        """
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from executor.map(scan_function, paths, chunksize=self.CHUNK_SIZE)
+
+    def scan_to_jsonl(self, root: str, output: TextIO) -> int:
+        """
+            Scans a directory tree for ghost files, and streams one JSON record per ghost
+            file to the given output. Returns the number of ghost files that were scanned.
+        """
+        num_scanned = 0
+        for record in self.scan(self.iter_ghostfiles(root)):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            num_scanned += 1
+        return num_scanned
@@ -1,6 +1,8 @@
 import binascii
 import os
 
+from poltergust.parsers.filecontent_parser import MK8GhostDataDecoder, MK8GhostRawData
+
 
 class MK8GhostFilenameDataMiiHandler:
     """ Class that can extract or replace Mii data from Mario Kart 8 ghost files """
@@ -17,9 +19,11 @@ class MK8GhostFilenameDataMiiHandler:
     MII_NAME_OFFSET = 0x1a
     MII_NAME_LENGTH = 0x14
 
-    def __init__(self, ghost_filename: str, has_header=False) -> None:
+    def __init__(self, ghost_filename: str, has_header=False, raw_data: MK8GhostRawData|None=None) -> None:
         self.filename = ghost_filename
         self.has_header = has_header
+        # Start of the ghost file, if it was already read before
+        self.raw_data = raw_data
 
     def get_mii_offset(self):
         """ Returns the offset of the Mii in the ghost file """
@@ -32,40 +36,37 @@ class MK8GhostFilenameDataMiiHandler:
         """ Calculates the CRC-16 XMODEM checksum of some Mii data (containing two trailing nul-bytes) """
         return binascii.crc_hqx(mii_data, 0x00).to_bytes(2, byteorder='big')
 
+    def get_raw_data(self) -> MK8GhostRawData:
+        """ Reads the start of the ghost file (containing the Mii), unless that was done before """
+        if self.raw_data is None:
+            self.raw_data = MK8GhostDataDecoder().read(self.filename)
+        return self.raw_data
+
     def get_mii_data(self, strict=True) -> bytes:
         """
             Reads Mii data from the ghostfile. If invalid data is found
             and `strict=True`, an error will be thrown and no data will be exported.
         """
-        # Offset depends on whether data was created in-game.
-        offset = self.get_mii_offset()
-        with open(self.filename, 'rb') as file:
-            file.seek(offset, os.SEEK_SET)
-            ghost_data = file.read(self.MII_GHOST_LENGTH)
-            zeroes = file.read(self.ZERO_PADDING_LENGTH)
-            checksum = file.read(self.CHECKSUM_LENGTH)
+        raw_data = self.get_raw_data()
 
-            # Verify Mii data; File might be invalid if this doesn't match
-            if strict:
-                # Check for the zero-byte padding. It's not actually used for Mii data though
-                if zeroes != b'\x00\x00':
-                    raise ValueError("MK8 Ghost Data Mii is missing a zero byte")
+        # Verify Mii data; File might be invalid if this doesn't match
+        if strict:
+            # Check for the zero-byte padding. It's not actually used for Mii data though
+            if raw_data.mii_padding != b'\x00\x00':
+                raise ValueError("MK8 Ghost Data Mii is missing a zero byte")
 
-                # Verify the checksum of the Mii data is correct
-                calculated_checksum = self.calculate_ghost_mii_checksum(ghost_data + zeroes)
-                if checksum != calculated_checksum:
-                    raise ValueError("MK8 Ghost Data Mii checksum is incorrect")
+            # Verify the checksum of the Mii data is correct
+            calculated_checksum = self.calculate_ghost_mii_checksum(raw_data.mii_data + raw_data.mii_padding)
+            if raw_data.mii_checksum.to_bytes(self.CHECKSUM_LENGTH, byteorder='big') != calculated_checksum:
+                raise ValueError("MK8 Ghost Data Mii checksum is incorrect")
 
-            return ghost_data
+        return raw_data.mii_data
 
     def extract_mii_name(self) -> str:
         """ Extracts the mii name from the the attached ghost file """
-        offset = self.get_mii_offset()
-        with open(self.filename, 'rb') as file:
-            file.seek(offset + self.MII_NAME_OFFSET, os.SEEK_SET)
-            mii_name = file.read(self.MII_NAME_LENGTH)
-            mii_name = mii_name.decode('utf-16-le')
-            return mii_name
+        mii_data = self.get_raw_data().mii_data
+        mii_name = mii_data[self.MII_NAME_OFFSET:self.MII_NAME_OFFSET + self.MII_NAME_LENGTH]
+        return mii_name.decode('utf-16-le')
 
     def extract(self, output_filename: str) -> None:
         """ Extract the Mii from `self.ghost_filename`, and export the result to a given location """
@@ -93,3 +94,6 @@ class MK8GhostFilenameDataMiiHandler:
             file.seek(offset, os.SEEK_SET)
             file.write(new_mii_data)
             file.write(self.calculate_ghost_mii_checksum(new_mii_data))
+
+        # Previously read data is outdated
+        self.raw_data = None
@@ -0,0 +1,211 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+import logging
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+from poltergust.models.ct_storage import MK8CTStorage
+from poltergust.models.mod_models import MK8CustomTrack
+from poltergust.models.mod_sites import API_MOD_SITES, MK8APIModSite, ModDownloadException, ModDownloadTemporaryException
+from poltergust.parsers.downloader import PoltergustDownloader
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """ Rate limiter that allows bursts of up to `capacity` requests, refilled at `rate` requests per second """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """ Blocks until a request may be made """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+@dataclass
+class MK8ModSyncReport:
+    """ Outcome of synchronizing the stored mods """
+    num_synced: int = 0
+    # Mods that were already synchronized before the job was interrupted, or that failed recently
+    num_skipped: int = 0
+    # (mod, error)
+    failed: list[tuple[MK8CustomTrack, str]] = field(default_factory=list)
+
+    def merge(self, other: "MK8ModSyncReport") -> None:
+        """ Adds the outcome of another (partial) synchronization to this one """
+        self.num_synced += other.num_synced
+        self.num_skipped += other.num_skipped
+        self.failed += other.failed
+
+    def summary(self) -> str:
+        """ Human-readable summary of the synchronization """
+        lines = [f"Synchronized {self.num_synced} mod(s). Skipped {self.num_skipped}, failed {len(self.failed)}."]
+        lines += [f"Failed: {mod}: {error}" for mod, error in self.failed]
+        return "\n".join(lines)
+
+
+class MK8ModSyncJob:
+    """
+        Downloads the information and preview images of all stored mods again, to keep the database up to date.
+        Each mod site is synchronized in its own thread, at a limited rate. The information of a site's mods is
+        fetched in batches where the site supports this. Batch requests are not conditional; preview images are
+        downloaded one by one, and only if they changed. Temporary errors (timeouts, server errors and rate
+        limits) are retried with exponential backoff. Each mod is committed together with the progress, so an
+        interrupted synchronization continues where it left off, and no transaction is kept open while downloading.
+    """
+    # Progress of each mod site: the mod_id of the last mod that was synchronized
+    CURSOR_KEY = "sync_mods_cursor_%(mod_site_id)s"
+
+    # Requests per second per mod site, and number of requests that may be made at once after idling
+    REQUESTS_PER_SECOND = 1.0
+    BURST = 5
+
+    # Temporary errors are retried after BACKOFF_BASE, 2 * BACKOFF_BASE, 4 * BACKOFF_BASE, ... seconds
+    MAX_RETRIES = 5
+    BACKOFF_BASE = 2.0
+    BACKOFF_MAX = 300.0
+
+    def __init__(self, requests_per_second: float|None = None, cache_ttl: timedelta = timedelta(0)) -> None:
+        # Mods that were checked within `cache_ttl` are not checked again
+        rate = requests_per_second or self.REQUESTS_PER_SECOND
+        self.buckets = {site.id: TokenBucket(rate, self.BURST) for site in API_MOD_SITES}
+
+        # Every request to a site's API, including those within a batch download, is rate limited
+        self.downloader = PoltergustDownloader(cache_ttl=cache_ttl, rate_limit=lambda site: self.buckets[site.id].acquire())
+        self.db = MK8CTStorage()
+
+    def run(self, restart: bool = False) -> MK8ModSyncReport:
+        """ Synchronizes all stored mods. If `restart=True`, previous progress is discarded """
+        mods_by_site: dict[int, list[MK8CustomTrack]] = {}
+        for mod in sorted(self.db.get_mods(), key=lambda mod: (mod.mod_site.id, mod.mod_id)):
+            mods_by_site.setdefault(mod.mod_site.id, []).append(mod)
+
+        report = MK8ModSyncReport()
+        with ThreadPoolExecutor(max_workers=max(1, len(mods_by_site))) as executor:
+            for site_report in executor.map(lambda mods: self._sync_site(mods, restart), mods_by_site.values()):
+                report.merge(site_report)
+        return report
+
+    def _sync_site(self, mods: list[MK8CustomTrack], restart: bool) -> MK8ModSyncReport:
+        """ Synchronizes the mods of a single mod site in batches, in order of their mod_id """
+        report = MK8ModSyncReport()
+        site = mods[0].mod_site
+        cursor_key = self.CURSOR_KEY % {'mod_site_id': site.id}
+        cursor = None if restart else self.db.get_value(cursor_key)
+
+        batch = []
+        for mod in mods:
+            if cursor is not None and mod.mod_id <= int(cursor):
+                report.num_skipped += 1
+                continue
+
+            failure = self.db.find_mod_lookup_failure(mod.mod_id, mod.mod_site.id)
+            if failure is not None:
+                # Failed recently; don't try again until this expires
+                logging.info(f"Skipping {mod}, which failed recently: {failure}")
+                report.num_skipped += 1
+                continue
+
+            batch.append(mod)
+            if len(batch) >= site.batch_size:
+                report.merge(self._sync_batch(batch, cursor_key))
+                batch = []
+        if batch:
+            report.merge(self._sync_batch(batch, cursor_key))
+
+        # Done; the next synchronization starts from the beginning
+        self.db.set_value(cursor_key, None)
+        self.db.commit()
+        return report
+
+    def _sync_batch(self, mods: list[MK8CustomTrack], cursor_key: str) -> MK8ModSyncReport:
+        """ Synchronizes a batch of mods of a single mod site, and stores the progress """
+        report = MK8ModSyncReport()
+        new_mods = self._download_infos(mods[0].mod_site, [str(mod.mod_id) for mod in mods])
+        for mod, new_mod in zip(mods, new_mods):
+            try:
+                if isinstance(new_mod, ModDownloadException):
+                    raise new_mod
+                self._sync_mod(new_mod)
+                report.num_synced += 1
+            except ModDownloadException as e:
+                self._add_failure(report, mod, e, temporary=isinstance(e, ModDownloadTemporaryException))
+            except (KeyError, ValueError, TypeError, OSError) as e:
+                # Unexpected responses, and preview images that could not be read or stored
+                self._add_failure(report, mod, e)
+
+            # Commit right away; an open transaction blocks the other sites' threads from writing
+            self.db.set_value(cursor_key, str(mod.mod_id))
+            self.db.commit()
+        return report
+
+    def _add_failure(self, report: MK8ModSyncReport, mod: MK8CustomTrack, e: Exception, temporary: bool = False) -> None:
+        """ Records that a mod could not be synchronized, so it is not tried again until the failure expires """
+        logging.error(f"Could not synchronize {mod}: {e!r}")
+        report.failed.append((mod, str(e)))
+        self.db.add_mod_lookup_failure(mod.mod_id, mod.mod_site.id, str(e), temporary=temporary)
+
+    def _download_infos(self, site: MK8APIModSite, mod_ids: list[str]) -> list[MK8CustomTrack|ModDownloadException]:
+        """
+            Downloads the information of several mods of a site at once, retrying the mods that failed temporarily.
+            A mod that could not be downloaded is replaced by the exception explaining why.
+        """
+        results: dict[str, MK8CustomTrack|ModDownloadException] = {}
+        pending = mod_ids
+        for attempt in range(self.MAX_RETRIES + 1):
+            results.update(zip(pending, self.downloader.download_many((site, mod_id) for mod_id in pending)))
+            temporary = [e for mod_id in pending if isinstance(e := results[mod_id], ModDownloadTemporaryException)]
+            if not temporary or attempt == self.MAX_RETRIES:
+                break
+            pending = [mod_id for mod_id in pending if isinstance(results[mod_id], ModDownloadTemporaryException)]
+            self._wait_before_retry(attempt, max(temporary, key=lambda e: e.retry_after or 0))
+        return [results[mod_id] for mod_id in mod_ids]
+
+    def _sync_mod(self, new_mod: MK8CustomTrack) -> None:
+        """ Downloads the preview image of a mod whose information was downloaded again, and stores the mod """
+        site = new_mod.mod_site
+
+        # Mods that did not change are returned from the database, with a local preview image
+        preview_url = new_mod.preview_image
+        if preview_url is not None and not preview_url.startswith(("http://", "https://")):
+            return
+
+        if preview_url is not None:
+            self._retry(site, lambda: self.downloader.download_mod_preview_image(new_mod))
+        self.db.add_or_update_mod(new_mod)
+
+    def _retry(self, site: MK8APIModSite, download: Callable[[], T]) -> T:
+        """ Performs a download within the rate limit of its site, retrying it if it fails temporarily """
+        for attempt in range(self.MAX_RETRIES + 1):
+            self.buckets[site.id].acquire()
+            try:
+                return download()
+            except ModDownloadTemporaryException as e:
+                if attempt == self.MAX_RETRIES:
+                    raise
+                self._wait_before_retry(attempt, e)
+
+    def _wait_before_retry(self, attempt: int, e: ModDownloadTemporaryException) -> None:
+        """ Waits before retrying a download that failed temporarily, as long as the site asked or with exponential backoff """
+        delay = e.retry_after
+        if delay is None:
+            # Randomize delays, so retries are spread out
+            delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        logging.warning(f"{e} Retrying in {delay:.1f} seconds.")
+        time.sleep(delay)
@@ -0,0 +1,251 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+import json
+import logging
+import os
+from typing import TextIO
+
+from poltergust.models.ct_storage import MK8CTStorage
+from poltergust.models.game_models import MK8GhostType
+from poltergust.models.gamedata import COURSE_IDS
+from poltergust.models.mod_models import UNKNOWN_CUSTOM_TRACK, MK8ModVersion
+from poltergust.models.mod_sites import API_MOD_SITES
+from poltergust.parsers.filecontent_parser import MK8GhostData, MK8GhostDataDecoder, MK8GhostDataSerializer, MK8GhostRawData
+from poltergust.parsers.filename_parser import MK8GhostFilenameParser, MK8GhostFilenameSerializer
+from poltergust.parsers.ghost_scanner import MK8GhostScanner
+
+
+@dataclass(frozen=True)
+class MK8GhostRelinkSelector:
+    """ Selects ghosts by the track slot and custom track they are linked to. Fields that are None match any ghost """
+    course_id: int|None = None
+    mod_site_id: int|None = None
+    # 0 selects ghosts that are not linked to a custom track
+    mod_id: int|None = None
+    mod_version: MK8ModVersion|None = None
+
+    def matches(self, raw: MK8GhostRawData) -> bool:
+        """ Checks whether a ghost is selected """
+        return ((self.course_id is None or raw.course_id == self.course_id)
+            and (self.mod_site_id is None or raw.mod_site_id == self.mod_site_id)
+            and (self.mod_id is None or raw.mod_id == self.mod_id)
+            and (self.mod_version is None or raw.mod_version == (self.mod_version.major, self.mod_version.minor, self.mod_version.patch)))
+
+@dataclass(frozen=True)
+class MK8GhostRelinkTarget:
+    """ Track slot and custom track to link the selected ghosts to. Fields that are None keep their current value """
+    course_id: int|None = None
+    mod_site_id: int|None = None
+    # 0 unlinks ghosts from their custom track
+    mod_id: int|None = None
+    mod_version: MK8ModVersion|None = None
+
+@dataclass
+class MK8GhostRelinkReport:
+    """ Outcome of relinking a folder of ghosts """
+    # (old file, new file)
+    relinked: list[tuple[str, str]] = field(default_factory=list)
+    # (file, error)
+    failed: list[tuple[str, str]] = field(default_factory=list)
+    # Ghosts that were not selected, or that would get the same name as another relinked ghost
+    num_skipped: int = 0
+    # (file, new file) of ghosts that were skipped because another ghost is renamed to the same file
+    conflicts: list[tuple[str, str]] = field(default_factory=list)
+
+    def summary(self) -> str:
+        """ Human-readable summary of the relink """
+        lines = [f"Relinked {len(self.relinked)} ghost(s). Skipped {self.num_skipped}, failed {len(self.failed)}."]
+        lines += [f"Skipped: {path}: another ghost is renamed to {os.path.basename(new_path)}" for path, new_path in self.conflicts]
+        lines += [f"Failed: {path}: {error}" for path, error in self.failed]
+        return "\n".join(lines)
+
+@dataclass
+class _MK8GhostRelinkPlan:
+    """ Changes to make to a single ghost file """
+    path: str
+    new_path: str
+    course_id: int
+    mod_site_id: int
+    mod_id: int
+    mod_version: tuple[int, int, int]
+    # Set when resuming; the CRC-32 in the header may not match the contents anymore
+    recalculate_crc: bool = False
+
+
+class MK8GhostRelinker:
+    """
+        Relinks all selected ghosts in a folder (tree) to another track slot and/or custom track, e.g. to
+        restamp all ghosts of a custom track with its new version. Each ghost is renamed to match its new
+        track slot, after which its contents (and CRC-32) are updated.
+
+        Progress is kept in a journal. If a relink is interrupted, running it again with the same journal
+        first finishes the ghosts that were being relinked.
+    """
+    JOURNAL_PATH = os.path.join(MK8CTStorage.CACHE_PATH, "relink-journal.jsonl")
+
+    def __init__(self, max_workers: int|None = None, journal_path: str|None = None) -> None:
+        # Relinking is mostly waiting on the disc, so threads suffice. Defaults to ThreadPoolExecutor's default
+        self.max_workers = max_workers
+        self.journal_path = journal_path or self.JOURNAL_PATH
+
+    def relink_folder(self, root: str, selector: MK8GhostRelinkSelector, target: MK8GhostRelinkTarget) -> MK8GhostRelinkReport:
+        """ Relinks all selected ghosts in the given folder (tree) """
+        report = MK8GhostRelinkReport()
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Finish an interrupted relink first
+            pending = self._read_pending_plans()
+            if pending:
+                logging.info(f"Resuming {len(pending)} ghosts from relink journal {self.journal_path}")
+                with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                    self._apply_plans(executor, pending, journal, report)
+
+            # Plan the changes to each ghost. Of ghosts that would be renamed to the same file, only the first is relinked
+            plans = []
+            new_paths = set()
+            paths = list(MK8GhostScanner().iter_ghostfiles(root))
+            for path, plan in zip(paths, executor.map(lambda path: self._plan(path, selector, target), paths)):
+                if isinstance(plan, str):
+                    report.failed.append((path, plan))
+                elif plan is None:
+                    report.num_skipped += 1
+                elif os.path.normcase(plan.new_path) in new_paths:
+                    logging.warning(f"Not relinking {path}: another ghost is renamed to {plan.new_path}")
+                    report.conflicts.append((path, plan.new_path))
+                    report.num_skipped += 1
+                else:
+                    new_paths.add(os.path.normcase(plan.new_path))
+                    plans.append(plan)
+
+            with open(self.journal_path, 'w', encoding='utf-8') as journal:
+                for plan in plans:
+                    self._write_journal(journal, "begin", plan)
+                journal.flush()
+                os.fsync(journal.fileno())
+                self._apply_plans(executor, plans, journal, report)
+
+        # Everything was either relinked or failed
+        os.remove(self.journal_path)
+        logging.info(f"Relinked {len(report.relinked)} ghosts in {root}, skipped {report.num_skipped}, failed {len(report.failed)}")
+        return report
+
+    def _plan(self, path: str, selector: MK8GhostRelinkSelector, target: MK8GhostRelinkTarget) -> _MK8GhostRelinkPlan|str|None:
+        """ Plans the changes to a ghost, or returns None if the ghost is not selected (or an error message) """
+        try:
+            raw = MK8GhostDataDecoder().read(path)
+            if not selector.matches(raw):
+                return None
+
+            course_id = target.course_id if target.course_id is not None else raw.course_id
+            if course_id not in COURSE_IDS:
+                raise ValueError(f"Found invalid track slot: {course_id}")
+
+            # Rename the file to match the new track slot
+            folder, filename = os.path.split(path)
+            filename_data = MK8GhostFilenameParser().parse(filename.rpartition(".")[0])
+            filename_data.track_id = course_id
+            if filename_data.ghost_type != MK8GhostType.DOWNLOADED_GHOST:
+                filename_data.ghost_number = course_id - 16
+            new_path = os.path.join(folder, MK8GhostFilenameSerializer().serialize(filename_data))
+            if new_path != path and os.path.exists(new_path):
+                raise ValueError(f"{os.path.basename(new_path)} already exists.")
+        except (ValueError, NotImplementedError, OSError) as e:
+            return str(e)
+
+        mod_version = target.mod_version
+        return _MK8GhostRelinkPlan(
+            path=path,
+            new_path=new_path,
+            course_id=course_id,
+            mod_site_id=target.mod_site_id if target.mod_site_id is not None else raw.mod_site_id,
+            mod_id=target.mod_id if target.mod_id is not None else raw.mod_id,
+            mod_version=(mod_version.major, mod_version.minor, mod_version.patch) if mod_version is not None else raw.mod_version,
+        )
+
+    def _apply_plans(self, executor: ThreadPoolExecutor, plans: list[_MK8GhostRelinkPlan], journal: TextIO, report: MK8GhostRelinkReport) -> None:
+        """ Applies the planned changes in parallel, and marks each ghost as finished in the journal """
+        futures = [(plan, executor.submit(self._apply, plan)) for plan in plans]
+        for plan, future in futures:
+            try:
+                future.result()
+            except (ValueError, OSError) as e:
+                logging.error(f"Could not relink {plan.path}: {e}")
+                report.failed.append((plan.path, str(e)))
+                self._write_journal(journal, "failed", plan)
+            else:
+                report.relinked.append((plan.path, plan.new_path))
+                self._write_journal(journal, "done", plan)
+            journal.flush()
+
+    def _apply(self, plan: _MK8GhostRelinkPlan) -> None:
+        """ Renames a single ghost file and updates its contents """
+        mod = None
+        mod_version = None
+        if plan.mod_id != 0:
+            if plan.mod_site_id < 0 or plan.mod_site_id >= len(API_MOD_SITES):
+                raise ValueError(f"Unknown mod site {plan.mod_site_id}")
+            mod = replace(UNKNOWN_CUSTOM_TRACK, mod_site=API_MOD_SITES[plan.mod_site_id], mod_id=plan.mod_id)
+            mod_version = MK8ModVersion(*plan.mod_version)
+
+        # The serializer checks for the header itself
+        data = MK8GhostData(False, COURSE_IDS[plan.course_id], mod, mod_version)
+
+        # Rename first, so a failed rename leaves the file untouched. If interrupted after renaming,
+        # the contents are (re)written under the new name when resuming
+        if plan.new_path != plan.path and (os.path.exists(plan.path) or not os.path.exists(plan.new_path)):
+            self._rename(plan.path, plan.new_path)
+        MK8GhostDataSerializer(incremental_crc=not plan.recalculate_crc).serialize(plan.new_path, data)
+
+    def _rename(self, path: str, new_path: str) -> None:
+        """
+            Renames a ghost file, without replacing a file that already exists at its new path
+            :raise: FileExistsError if there is one
+        """
+        if os.name == 'nt':
+            # Never replaces an existing file on Windows
+            os.rename(path, new_path)
+            return
+
+        try:
+            os.link(path, new_path)
+        except FileExistsError:
+            if not os.path.samefile(path, new_path):
+                raise FileExistsError(f"{os.path.basename(new_path)} already exists.") from None
+            # Interrupted after linking
+        except OSError:
+            # The file system does not support hard links (e.g. FAT32 on SD cards); claim the new path first
+            try:
+                os.close(os.open(new_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                raise FileExistsError(f"{os.path.basename(new_path)} already exists.") from None
+            os.replace(path, new_path)
+            return
+        os.unlink(path)
+
+    def _write_journal(self, journal: TextIO, event: str, plan: _MK8GhostRelinkPlan) -> None:
+        """ Adds an entry to the journal """
+        entry = {'event': event, 'path': plan.path}
+        if event == "begin":
+            entry.update(new_path=plan.new_path, course_id=plan.course_id, mod_site_id=plan.mod_site_id, mod_id=plan.mod_id, mod_version=plan.mod_version)
+        journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _read_pending_plans(self) -> list[_MK8GhostRelinkPlan]:
+        """ Reads the ghosts that were started but not finished by an interrupted relink """
+        if not os.path.exists(self.journal_path):
+            return []
+
+        pending: dict[str, _MK8GhostRelinkPlan] = {}
+        with open(self.journal_path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line may have been cut off
+                    continue
+                if entry['event'] == "begin":
+                    pending[entry['path']] = _MK8GhostRelinkPlan(entry['path'], entry['new_path'], entry['course_id'],
+                        entry['mod_site_id'], entry['mod_id'], tuple(entry['mod_version']), recalculate_crc=True)
+                else:
+                    pending.pop(entry['path'], None)
+        return list(pending.values())
@@ -1,9 +1,11 @@
 from abc import ABCMeta
 import os
 import sys
-from tkinter import *
-from tkinter import ttk
-from typing import Callable, Generic, TypeVar
+import threading
+from typing import TYPE_CHECKING, Callable, Generic, TypeVar
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 def get_resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -15,78 +17,35 @@ def get_resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-def bind_tree(widget: Widget, event, callback, add: str='', force_rebind=False):
+class LazyResourceImage:
     """
-        Binds an event to a widget and all its descendants.
-        Skips widgets already bound, unless `force_rebind=True`.
-        See: https://stackoverflow.com/a/11457766
+        Class attribute holding an image from the resources folder, optionally resized. The image is only
+        loaded when it is first used, so importing a module with such an attribute does not need PIL.
     """
-    if not widget.bind(event) or force_rebind:
-        widget.bind(event, callback, add)
-
-    for child in widget.children.values():
-        bind_tree(child, event, callback)
-
-class WrappingLabel(ttk.Label):
-    ''' A type of Label that automatically adjusts the wrap to the size '''
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.bind('<Configure>', lambda e: self.config(wraplength=self.winfo_width()))
-
-class PoltergustPopup(Toplevel):
-    """ General Popup class that places the window in the middle of the screen on creation """
-    window_title = None
-    window_width = None
-    window_height = None
-
-    def __init__(self, master: Toplevel, *args, **kwargs):
-        super().__init__(master, *args, **kwargs)
-
-        self.wm_title(self.window_title)
-
-        ws = master.winfo_screenwidth() # width of the screen
-        hs = master.winfo_screenheight() # height of the screen
-
-        # calculate x and y coordinates for the Tk root window
-        x = int((ws/2) - (275/2))
-        y = int(hs/7)
-
-        self.geometry(f"{self.window_width}x{self.window_height}+{x}+{y}")
-
-        # Close with <esc>
-        self.bind("<Escape>", lambda e: self.on_close())
-
-    def on_close(self):
-        """ On closing the popup """
-        self.destroy()
-
-class PoltergustBlockingPopup(PoltergustPopup):
-    """ General Popup class that takes control from the main window """
-    window_title = None
-    window_width = None
-    window_height = None
-
-    def __init__(self, master: Toplevel, *args, **kwargs):
-        super().__init__(master, *args, **kwargs)
-
-        # Disable bottom window
-        master.attributes('-disabled', 1)
-        self.transient(master)
-        self.focus_set()
-        self.protocol("WM_DELETE_WINDOW", self.on_close)
+    def __init__(self, relative_path: str, size: tuple[int, int]|None = None) -> None:
+        self.relative_path = relative_path
+        self.size = size
+        self._image: "Image.Image|None" = None
 
-    def on_close(self):
-        # Give back control to the bottom window
-        self.master.attributes('-disabled', 0)
+    def __get__(self, instance, owner) -> "Image.Image":
+        if self._image is None:
+            from PIL import Image
 
-        super().on_close()
+            # Loading it twice from different threads is harmless
+            image = Image.open(get_resource_path(self.relative_path))
+            self._image = image.resize(size=self.size) if self.size is not None else image
+        return self._image
 
 class Singleton(type):
-    """ Singleton pattern Metaclass """
+    """ Singleton pattern Metaclass. Safe to use from multiple threads """
     _instances = {}
+    # Reentrant, since creating one singleton may create another
+    _lock = threading.RLock()
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
+            with cls._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
 
 class SingletonABCMeta(ABCMeta, Singleton):
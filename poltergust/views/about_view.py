@@ -3,7 +3,8 @@ from tkinter import ttk
 
 from PIL import Image, ImageTk
 
-from poltergust.utils import PoltergustBlockingPopup, get_resource_path
+from poltergust.utils import get_resource_path
+from poltergust.widgets.misc import PoltergustBlockingPopup
 
 
 class PoltergustAboutView(PoltergustBlockingPopup):
@@ -1,7 +1,7 @@
 from tkinter import *
 from tkinter import ttk
 
-from poltergust.utils import PoltergustBlockingPopup, WrappingLabel
+from poltergust.widgets.misc import PoltergustBlockingPopup, WrappingLabel
 from poltergust.parsers.downloader import API_MOD_SITES
 
 
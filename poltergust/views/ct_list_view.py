@@ -2,13 +2,13 @@ import logging
 import math
 from tkinter import *
 from tkinter import ttk
-from typing import Iterable
+from typing import Callable, Iterable
 
 from PIL import Image, ImageTk, ImageDraw
 
-from poltergust.utils import PoltergustBlockingPopup, bind_tree, get_resource_path
+from poltergust.utils import get_resource_path
 from poltergust.widgets.lists import ScrollableTrackCanvas
-from poltergust.widgets.misc import IconButton
+from poltergust.widgets.misc import IconButton, PoltergustBlockingPopup, bind_tree
 from poltergust.widgets.trackframes import FramableTrack, MK8TrackFrameBig
 
 
@@ -20,7 +20,7 @@ class TrackListView(PoltergustBlockingPopup):
     window_width = 310
     window_height = 400
 
-    def __init__(self, master: Toplevel, track_list: Iterable[FramableTrack], *args, **kwargs):
+    def __init__(self, master: Toplevel, track_list: Iterable[FramableTrack], *args, search_provider: Callable[[str], Iterable[FramableTrack]]|None=None, **kwargs):
         super().__init__(master, *args, **kwargs)
 
         # Top frame
@@ -40,7 +40,7 @@ class TrackListView(PoltergustBlockingPopup):
         track_list_frame = Frame(self)
         track_list_frame.pack(fill=BOTH, expand=True)
 
-        self.track_canvas = ScrollableTrackCanvas(track_list_frame, track_list=track_list, search_widget=search_widget, scrollable_region=self)
+        self.track_canvas = ScrollableTrackCanvas(track_list_frame, track_list=track_list, search_widget=search_widget, scrollable_region=self, search_provider=search_provider)
         self.track_canvas.pack(side=RIGHT, fill=BOTH, expand=True)
 
 class TrackListManagerView(TrackListView):
@@ -82,28 +82,72 @@ class TrackListSelectorView(TrackListView):
         self._selected_rect_draw = None
         self._selected_check_draw = None
 
+        # Widgets that were made clickable and hoverable
+        self._selectable_widgets: set[MK8TrackFrameBig] = set()
+
         self._attach_selectors(selected_track)
 
     def attach_selectors_to_widget(self, track: FramableTrack, widget: MK8TrackFrameBig):
-        """ Makes sure a FramableTrack and its corresponding widget can be clicked and hovered """
+        """
+            Makes sure a FramableTrack and its corresponding widget can be clicked and hovered.
+            Widgets are reused for other tracks while scrolling, so the track is looked up when the event happens.
+        """
+        if widget in self._selectable_widgets:
+            return
+        self._selectable_widgets.add(widget)
+
         bind_tree(widget, "<Button-1>",
-            lambda e, track=track, widget=widget: self.on_track_select(e, track, widget)
+            lambda e, widget=widget: self.on_track_select(e, self.track_canvas.get_track(widget), widget)
         )
         # Binding to the frame itself is enough
         widget.bind("<Enter>",
-            lambda e, track=track, widget=widget: self.activate_hover(e, track, widget)
+            lambda e, widget=widget: self.activate_hover(e, self.track_canvas.get_track(widget), widget)
         )
         widget.bind("<Leave>",
-            lambda e, track=track, widget=widget: self.deactivate_hover(e, track, widget)
+            lambda e, widget=widget: self.deactivate_hover(e, self.track_canvas.get_track(widget), widget)
         )
 
     def _attach_selectors(self, selected_track: FramableTrack) -> None:
-        """ Attaches the selectors to all the tracks/widgets of the view """
+        """ Attaches the selectors to all the tracks/widgets of the view, and selects the given track """
+        self.track_canvas.add_frame_listener(self.on_track_framed)
         for framable, widget in self.track_canvas.track_widgets:
-            self.attach_selectors_to_widget(framable, widget)
+            self.on_track_framed(framable, widget)
+
+        if selected_track is not None and self.track_canvas.show_track(selected_track):
+            self.on_track_select(None, selected_track, self.track_canvas.get_frame(selected_track))
+
+    def on_track_framed(self, track: FramableTrack, widget: MK8TrackFrameBig) -> None:
+        """ Styles a widget that started showing a track, which may have shown another track before """
+        self.attach_selectors_to_widget(track, widget)
+        if track == self.selected_track:
+            if widget is not self.selected_widget:
+                self._set_selected_widget(widget)
+            return
+
+        if widget is self.selected_widget:
+            self._set_selected_widget(None)
+        widget.set_color(None)
+
+    def _set_selected_widget(self, widget: MK8TrackFrameBig|None) -> None:
+        """ Moves the selection highlight to another widget """
+        # Clear previous selection highlight
+        if self.selected_widget is not None:
+            self.selected_widget.set_color(None)
+            self.selected_widget.canvas.delete(self._selected_rect_draw)
+            self.selected_widget.canvas.delete(self._selected_check_draw)
+
+        self.selected_widget = widget
+        if widget is None:
+            return
 
-            if framable == selected_track:
-                self.on_track_select(None, selected_track, widget)
+        widget.set_color(self.SELECTION_COLOR)
+
+        # Highlight track preview
+        self._selected_rect_draw = widget.canvas.create_image(0, 0, image=self._selected_rect_img, anchor=NW)
+        self._selected_check_draw = widget.canvas.create_image(
+            widget.TRACK_PREVIEW_SIZE[0]/2, widget.TRACK_PREVIEW_SIZE[1]/2,
+            image=self._selected_check_img, anchor=CENTER
+        )
 
     def _get_polygon_as_image(self, size: tuple[int, int], points: list[int], fill="", outline="", alpha=255):
         """ Builds a polygon from a list of points and outputs it as an image. """
@@ -115,32 +159,18 @@ class TrackListSelectorView(TrackListView):
         ImageDraw.Draw(image).polygon(points, fill=fill or None, outline=outline or None)
         return ImageTk.PhotoImage(image)
 
-    def on_track_select(self, e: Event, track: FramableTrack, widget: MK8TrackFrameBig):
-        """ Update the view when a different track is selected. """
-        # Already selected
-        if self.selected_track == track:
+    def on_track_select(self, e: Event, track: FramableTrack|None, widget: MK8TrackFrameBig|None):
+        """ Update the view when a different track is selected. The widget is None if the track is not in view """
+        # Already selected, or the widget no longer shows a track
+        if track is None or self.selected_track == track:
             return
 
         # Selected a track
         self.select_button.config(state=NORMAL)
 
-        # Clear previous selection highlight
-        if self.selected_widget is not None:
-            self.selected_widget.set_color(None)
-            self.selected_widget.canvas.delete(self._selected_rect_draw)
-            self.selected_widget.canvas.delete(self._selected_check_draw)
-
         # Set and highlight selection
         self.selected_track = track
-        self.selected_widget = widget
-        widget.set_color(self.SELECTION_COLOR)
-
-        # Highlight track preview
-        self._selected_rect_draw = self.selected_widget.canvas.create_image(0, 0, image=self._selected_rect_img, anchor=NW)
-        self._selected_check_draw = self.selected_widget.canvas.create_image(
-            self.selected_widget.TRACK_PREVIEW_SIZE[0]/2, self.selected_widget.TRACK_PREVIEW_SIZE[1]/2,
-            image=self._selected_check_img, anchor=CENTER
-        )
+        self._set_selected_widget(widget)
 
         logging.info(f"Track selection changed to {track.sort_field}")
 
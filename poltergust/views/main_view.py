@@ -8,10 +8,9 @@ from PIL import ImageTk, Image
 
 from poltergust.models.gamedata import CHARACTERS, FLAGS, GLIDERS, KARTS, MII_WEIGHT_CLASSES, WHEELS
 from poltergust.models.game_models import MK8Course, MK8GhostType
-from poltergust.models.imagemapper import MK8CharacterImageMapper, MK8FlagImageMapper, MK8ImageAtlasMapper, MK8VehiclePartImageMapper
+from poltergust.models.imagemapper import MK8CharacterImageMapper, MK8FlagImageMapper, MK8IconCache, MK8ImageAtlasMapper, MK8VehiclePartImageMapper
 from poltergust.models.mod_models import MK8CustomTrack, MK8ModVersion
 from poltergust.utils import get_resource_path
-from poltergust.views.about_view import PoltergustAboutView
 
 
 class PoltergustMainView:
@@ -28,9 +27,12 @@ class PoltergustMainView:
     BTN_EXPORT_AS_STAFF_GHOST = "Convert to Staff Ghost"
     BTN_EXPORT_AS_DOWNLOADED_GHOST = "Convert to Downloaded Ghost"
     BTN_DOWNLOADED_GHOST_SLOT_PREFIX = "Slot "
+    BTN_BULK_EXPORT_AS_STAFF_GHOSTS = "Convert Folder to Staff Ghosts..."
+    BTN_BULK_EXPORT_AS_DOWNLOADED_GHOSTS = "Convert Folder to Downloaded Ghosts..."
     BTN_EXTRACT_MII = "Extract Mii"
     BTN_REPLACE_MII = "Replace Mii"
     BTN_CHANGE_TRACK = "Change Track"
+    BTN_RETRY_CT_DOWNLOAD = "Retry Custom Track Download"
     BTN_CT_MANAGER = "Custom Track Manager"
 
     # FONT = ("Agency FB", 14, FONT_NORMAL)
@@ -91,10 +93,14 @@ class PoltergustMainView:
         for slot in range(16):
             self.menu_export_download.add_command(label=self.BTN_DOWNLOADED_GHOST_SLOT_PREFIX+str(slot))
         self.menu_export.add_cascade(menu=self.menu_export_download, label=self.BTN_EXPORT_AS_DOWNLOADED_GHOST)
+        self.menu_export.add_separator()
+        self.menu_export.add_command(label=self.BTN_BULK_EXPORT_AS_STAFF_GHOSTS)
+        self.menu_export.add_command(label=self.BTN_BULK_EXPORT_AS_DOWNLOADED_GHOSTS)
 
         # Edit Options
         # self.menu_edit.add_command(label=self.BTN_REPLACE_MII)
         self.menu_edit.add_command(label=self.BTN_CHANGE_TRACK)
+        self.menu_edit.add_command(label=self.BTN_RETRY_CT_DOWNLOAD)
 
         # About options
         self.menu_help.add_command(label="About", command=self.popup_about)
@@ -188,6 +194,8 @@ class PoltergustMainView:
 
     def popup_about(self) -> None:
         """ Displays 'about' information """
+        from poltergust.views.about_view import PoltergustAboutView
+
         PoltergustAboutView(self.root)
 
     def select_ghost_file(self) -> str:
@@ -231,6 +239,13 @@ class PoltergustMainView:
             title="Output directory for MK8 Downloaded Ghost",
         )
 
+    def select_bulk_conversion_source_folder(self) -> str:
+        """ UI Popup for selecting a folder of ghosts to convert """
+        return filedialog.askdirectory(
+            parent=self.root,
+            title="Folder with MK8 Ghost Data to convert",
+        )
+
     def set_ghost_type(self, ghost_type: MK8GhostType, ghost_number: int, ghost_has_header: bool) -> None:
         """ Sets ghost type text """
         if ghost_type == MK8GhostType.STAFF_GHOST:
@@ -293,8 +308,8 @@ class PoltergustMainView:
         self.set_mapped_image(self.character_canvas, MK8CharacterImageMapper(), char[1], resize_to=self.CHARACTER_SIZE)
         self.character_tip.text = f"{char[0]} ({character_id})"
 
-    def set_track(self, track: MK8Course, mod: MK8CustomTrack|None, mod_version: MK8ModVersion|None) -> None:
-        """ Sets the track preview """
+    def set_track(self, track: MK8Course, mod: MK8CustomTrack|None, mod_version: MK8ModVersion|None, lookup_failure: str|None = None) -> None:
+        """ Sets the track preview. `lookup_failure` is the reason the custom track's info could not be downloaded, if any """
         # Destroy old track infos
         for widget in self.trackframe.winfo_children():
             widget.destroy()
@@ -310,6 +325,9 @@ class PoltergustMainView:
             big_frame = track.frame(self.trackframe)
 
         # Pack frames
+        if lookup_failure is not None:
+            failure_lb = ttk.Label(self.trackframe, text=f"Track info unavailable: {lookup_failure}\nRetry under 'Edit -> {self.BTN_RETRY_CT_DOWNLOAD}'.", wraplength=250)
+            failure_lb.pack(fill=X, side=BOTTOM)
         big_frame.pack(fill=X, side=BOTTOM)
         if small_frame is not None:
             small_frame.pack(fill=X, side=BOTTOM)
@@ -336,9 +354,12 @@ class PoltergustMainView:
 
     def set_mapped_image(self, canvas: Canvas, mapper: MK8ImageAtlasMapper, index: int | None, resize_to: tuple[int, int] | None = None) -> None:
         """ Extracts the icon at a specific index in an icon atlas, resizes it, and places it in a canvas element """
-        img = mapper.index_to_image(index, resize_to=resize_to)
+        img = MK8IconCache().get_photo_image(mapper, index, size=resize_to)
         self_img_name = str(canvas)
-        setattr(self, self_img_name, ImageTk.PhotoImage(img))
+        if getattr(self, self_img_name, None) is img:
+            # Already showing this icon
+            return
+        setattr(self, self_img_name, img)
         canvas.delete("all")
         canvas.create_image(0, 0, image=getattr(self, self_img_name), anchor=NW)
 
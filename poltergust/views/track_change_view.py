@@ -6,8 +6,7 @@ from poltergust.models.mod_models import MK8ModVersion
 
 from poltergust.parsers.downloader import API_MOD_SITES, MK8CustomTrack
 from poltergust.models.game_models import MK8Course
-from poltergust.utils import PoltergustBlockingPopup
-from poltergust.widgets.misc import IconButton, IntEntry
+from poltergust.widgets.misc import IconButton, IntEntry, PoltergustBlockingPopup
 
 
 class PoltergustChangeTrackView(PoltergustBlockingPopup):
@@ -1,14 +1,32 @@
 import bisect
 from tkinter import RIGHT, Y, Canvas, Event, Scrollbar, StringVar, Toplevel, Widget, ttk
-from typing import Iterable
+from typing import Callable, Iterable
 
 from poltergust.widgets.trackframes import FramableTrack, MK8TrackFrameBig
 
 
 class ScrollableTrackCanvas(Canvas):
-    """ A scrollable canvas that shows a list of FrameableTracks """
-    def __init__(self, master: Toplevel, track_list: Iterable[FramableTrack], *args, search_widget:ttk.Entry|None=None, scrollable_region: Widget|None=None, **kwargs):
+    """
+        A scrollable canvas that shows a list of FrameableTracks. By default, searching filters the list on
+        `sort_field`. A `search_provider` can be given to look up the tracks matching a search instead (e.g.
+        from a database).
+
+        Only the rows in view (and a few around them) are framed. Frames of rows that are scrolled out of view
+        are reused for the rows that come into view, so the number of frames does not grow with the list.
+        Use `add_frame_listener` to keep track of which track each frame shows.
+    """
+    # Distance between the tops of two rows. Frames are ROW_SPACING shorter
+    ROW_HEIGHT = 70
+    ROW_SPACING = 5
+    ROW_PADX = (2, 5)
+
+    # Rows above and below the view that are framed as well, so they don't appear empty while scrolling
+    OVERSCAN = 2
+
+    def __init__(self, master: Toplevel, track_list: Iterable[FramableTrack], *args, search_widget:ttk.Entry|None=None, scrollable_region: Widget|None=None,
+                 search_provider: Callable[[str], Iterable[FramableTrack]]|None=None, **kwargs):
         super().__init__(master, *args, bd=0, borderwidth=0, highlightthickness=0, **kwargs)
+        self.search_provider = search_provider
 
         # Link search box
         self.search_value = StringVar()
@@ -16,24 +34,28 @@ class ScrollableTrackCanvas(Canvas):
             self.search_value.trace_add("write", lambda var, index, mode: self.reload_list())
             search_widget.config(textvariable=self.search_value)
 
-        # Scrollbar (only Canvas elements are scrollable)
+        # Scrollbar (only Canvas elements are scrollable). Scrolling also frames the rows that come into view
         self.vsb = Scrollbar(master, command=self.yview)
-        self.configure(yscrollcommand=self.vsb.set)
+        self.configure(yscrollcommand=self._on_yview)
         self.vsb.pack(side=RIGHT, fill=Y)
 
-        # Track List
-        self.track_frame = ttk.Frame(self)
-        self.track_frame.pack()
+        # All tracks sorted on their sort_field, and the tracks matching the search in the order they are shown
+        self._tracks: list[FramableTrack] = sorted(track_list, key=lambda item: item.sort_field)
+        self._shown: list[FramableTrack] = []
 
-        self.track_widgets = self._build_track_list(track_list)
-        self.reload_list()
+        # Frames of the rows in view, the track each frame shows, and the canvas item of each frame
+        self._frames: dict[FramableTrack, MK8TrackFrameBig] = {}
+        self._frame_tracks: dict[MK8TrackFrameBig, FramableTrack] = {}
+        self._frame_items: dict[MK8TrackFrameBig, int] = {}
+        # Frames that are not in view, to be reused
+        self._free_frames: list[MK8TrackFrameBig] = []
+
+        self._frame_listeners: list[Callable[[FramableTrack, MK8TrackFrameBig], None]] = []
 
-        # Make sure Tkinter knows what's scrollable
-        self.create_window(0, 0, anchor="nw", window=self.track_frame, tags=("inner",))
+        self.reload_list()
 
-        # Recalculate bounding box if the frame or window changes size
-        self.bind("<Configure>", self._resize_inner_frame)
-        self.track_frame.bind("<Configure>", self._reset_scrollregion)
+        # Resize the rows and frame more of them if the window changes size
+        self.bind("<Configure>", self._on_resize)
 
         # Make the mouse wheel move the scrollbar
         scrollable_region = scrollable_region or master
@@ -41,6 +63,23 @@ class ScrollableTrackCanvas(Canvas):
         scrollable_region.bind("<Button-4>", self._set_scroll) # for Linux
         scrollable_region.bind("<Button-5>", self._set_scroll) # for Linux
 
+    @property
+    def track_widgets(self) -> list[tuple[FramableTrack, MK8TrackFrameBig]]:
+        """ The tracks that are currently framed and their frames, in the order they are shown """
+        return [(self._frame_tracks[frame], frame) for track in self._shown if (frame := self._frames.get(track)) is not None]
+
+    def add_frame_listener(self, listener: Callable[[FramableTrack, MK8TrackFrameBig], None]) -> None:
+        """ Adds a listener that is notified whenever a frame starts showing a track, including frames that are reused """
+        self._frame_listeners.append(listener)
+
+    def get_track(self, frame: MK8TrackFrameBig) -> FramableTrack|None:
+        """ Gets the track a frame currently shows, if any """
+        return self._frame_tracks.get(frame)
+
+    def get_frame(self, track: FramableTrack) -> MK8TrackFrameBig|None:
+        """ Gets the frame currently showing a track, or None if it is not in view """
+        return self._frames.get(track)
+
     def _set_scroll(self, event: Event):
         """ Moves the scrollbar when the user scrolls the mouse wheel """
         start, end = self.vsb.get()
@@ -54,44 +93,106 @@ class ScrollableTrackCanvas(Canvas):
             amount = 1
         self.yview_scroll(amount, "units")
 
-    def _reset_scrollregion(self, event: Event):
-        self.configure(scrollregion=self.bbox("all"))
-
-    def _resize_inner_frame(self, event: Event):
-        self.itemconfig("inner", width=event.width)
-
-    def _build_track_list(self, track_list: Iterable[FramableTrack]) -> list[tuple[FramableTrack, MK8TrackFrameBig]]:
-        """ Constructs the track list by framing the provided FramableTracks """
-        track_widgets = []
-        for track in sorted(track_list, key=lambda item: item.sort_field):
-            frame = track.frame(self.track_frame)
-            track_widgets.append((track, frame))
-
-        return track_widgets
+    def _on_yview(self, first: str, last: str) -> None:
+        """ Updates the scrollbar and frames the rows in view whenever the view changes """
+        self.vsb.set(first, last)
+        self._update_rows()
+
+    def _on_resize(self, event: Event) -> None:
+        self.itemconfigure("row", width=self._get_row_width())
+        self._reset_scrollregion()
+
+    def _get_row_width(self) -> int:
+        return max(1, self.winfo_width() - sum(self.ROW_PADX))
+
+    def _reset_scrollregion(self) -> None:
+        self.configure(scrollregion=(0, 0, self.winfo_width(), len(self._shown) * self.ROW_HEIGHT))
+        self._update_rows()
+
+    def _update_rows(self) -> None:
+        """ Frames the rows in view (and OVERSCAN around them), and releases the frames of the other rows """
+        top = self.canvasy(0)
+        first = max(0, int(top // self.ROW_HEIGHT) - self.OVERSCAN)
+        last = min(len(self._shown), int((top + self.winfo_height()) // self.ROW_HEIGHT) + 1 + self.OVERSCAN)
+        rows = self._shown[first:last]
+
+        in_view = set(rows)
+        for track in [track for track in self._frames if track not in in_view]:
+            self._release_frame(track)
+
+        for row, track in enumerate(rows, start=first):
+            frame = self._frames.get(track)
+            if frame is None:
+                frame = self._take_frame(track)
+            self.coords(self._frame_items[frame], self.ROW_PADX[0], row * self.ROW_HEIGHT)
+
+    def _take_frame(self, track: FramableTrack) -> MK8TrackFrameBig:
+        """ Frames a track, reusing a frame that is not in view if there is one """
+        if self._free_frames:
+            frame = self._free_frames.pop()
+            track.reframe(frame)
+        else:
+            frame = track.frame(self)
+
+        self._frames[track] = frame
+        self._frame_tracks[frame] = track
+        self._frame_items[frame] = self.create_window(self.ROW_PADX[0], 0, anchor="nw", window=frame, tags=("row",),
+                                                      width=self._get_row_width(), height=self.ROW_HEIGHT - self.ROW_SPACING)
+        for listener in self._frame_listeners:
+            listener(track, frame)
+        return frame
+
+    def _release_frame(self, track: FramableTrack) -> None:
+        """ Takes a track's frame out of view, so it can be reused """
+        frame = self._frames.pop(track)
+        del self._frame_tracks[frame]
+        self.delete(self._frame_items.pop(frame))
+        self._free_frames.append(frame)
 
     def reload_list(self) -> None:
         """ Reloads the FramableTrack list """
-        search_value = self.search_value.get().lower()
-        for track, widget in self.track_widgets:
-            widget.pack_forget()
-            if not search_value or search_value in track.sort_field.lower():
-                widget.pack(fill='both', padx=(2, 5), pady=(0, 5))
+        if self.search_provider is not None:
+            # Shows the tracks returned by the search provider, in the order it returns them
+            self._shown = list(self.search_provider(self.search_value.get()))
+        else:
+            search_value = self.search_value.get().lower()
+            self._shown = [track for track in self._tracks if not search_value or search_value in track.sort_field.lower()]
+
+        self.yview_moveto(0)
+        self._reset_scrollregion()
+
+    def show_track(self, track: FramableTrack) -> bool:
+        """ Scrolls a track into view, if it is in the list. Returns whether it is """
+        try:
+            row = self._shown.index(track)
+        except ValueError:
+            return False
+
+        top = self.canvasy(0)
+        if row * self.ROW_HEIGHT < top or (row + 1) * self.ROW_HEIGHT > top + self.winfo_height():
+            self.yview_moveto(row / len(self._shown))
+        self._update_rows()
+        return True
 
     def add_track(self, track: FramableTrack) -> MK8TrackFrameBig:
-        """ Adds a track to the view """
+        """ Adds a track to the view, scrolls to it and returns its frame """
         # Remove existing track from the list if the id field matches
-        indx = None
-        for i, (existing_track, widget) in enumerate(self.track_widgets):
-            if track == existing_track:
-                indx = i
-                widget.destroy()
-                break
-        if indx is not None:
-            del self.track_widgets[indx]
+        if track in self._frames:
+            self._release_frame(track)
+        if track in self._tracks:
+            self._tracks.remove(track)
 
         # Insert into sorted list
-        mod_widget = track.frame(self.track_frame)
-        bisect.insort(self.track_widgets, (track, mod_widget), key=lambda pair: pair[0].sort_field)
+        bisect.insort(self._tracks, track, key=lambda item: item.sort_field)
         self.reload_list()
-
-        return mod_widget
+        if track not in self._shown and self.search_value.get():
+            # Hidden by the search
+            self.search_value.set("")
+            self.reload_list()
+        if track not in self._shown:
+            # Not returned by the search provider; show it on top
+            self._shown.insert(0, track)
+            self._reset_scrollregion()
+
+        self.show_track(track)
+        return self._frames[track]
@@ -1,8 +1,75 @@
-from tkinter import LEFT, Button, PhotoImage, Toplevel, ttk
+from tkinter import LEFT, Button, PhotoImage, Toplevel, Widget, ttk
 
 from poltergust.utils import get_resource_path
 
 
+def bind_tree(widget: Widget, event, callback, add: str='', force_rebind=False):
+    """
+        Binds an event to a widget and all its descendants.
+        Skips widgets already bound, unless `force_rebind=True`.
+        See: https://stackoverflow.com/a/11457766
+    """
+    if not widget.bind(event) or force_rebind:
+        widget.bind(event, callback, add)
+
+    for child in widget.children.values():
+        bind_tree(child, event, callback)
+
+class WrappingLabel(ttk.Label):
+    ''' A type of Label that automatically adjusts the wrap to the size '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bind('<Configure>', lambda e: self.config(wraplength=self.winfo_width()))
+
+class PoltergustPopup(Toplevel):
+    """ General Popup class that places the window in the middle of the screen on creation """
+    window_title = None
+    window_width = None
+    window_height = None
+
+    def __init__(self, master: Toplevel, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+
+        self.wm_title(self.window_title)
+
+        ws = master.winfo_screenwidth() # width of the screen
+        hs = master.winfo_screenheight() # height of the screen
+
+        # calculate x and y coordinates for the Tk root window
+        x = int((ws/2) - (275/2))
+        y = int(hs/7)
+
+        self.geometry(f"{self.window_width}x{self.window_height}+{x}+{y}")
+
+        # Close with <esc>
+        self.bind("<Escape>", lambda e: self.on_close())
+
+    def on_close(self):
+        """ On closing the popup """
+        self.destroy()
+
+class PoltergustBlockingPopup(PoltergustPopup):
+    """ General Popup class that takes control from the main window """
+    window_title = None
+    window_width = None
+    window_height = None
+
+    def __init__(self, master: Toplevel, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+
+        # Disable bottom window
+        master.attributes('-disabled', 1)
+        self.transient(master)
+        self.focus_set()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        # Give back control to the bottom window
+        self.master.attributes('-disabled', 0)
+
+        super().on_close()
+
+
 class IntEntry(ttk.Entry):
     """ Tkinter entry that only accepts numbers as its input """
     def __init__(self, master: Toplevel, *args, **kwargs):
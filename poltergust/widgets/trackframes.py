@@ -1,4 +1,3 @@
-from abc import ABC, abstractmethod
 from idlelib.tooltip import Hovertip
 from tkinter import *
 from tkinter import ttk
@@ -7,7 +6,9 @@ import webbrowser
 
 from PIL import Image, ImageTk
 
-from poltergust.utils import WrappingLabel
+# Defined without tkinter so models can be imported without it
+from poltergust.models.framable import FramableTrack, MiniFramableTrack
+from poltergust.widgets.misc import WrappingLabel
 
 class MK8TrackFrameBase(LabelFrame):
     """ A frame containing information of a FramableTrack """
@@ -24,17 +25,26 @@ class MK8TrackFrameBase(LabelFrame):
         self.canvas = Canvas(self, width=self.TRACK_PREVIEW_SIZE[0], height=self.TRACK_PREVIEW_SIZE[1], borderwidth=0, highlightthickness=0)
         self.canvas.create_rectangle(0, 0, self.TRACK_PREVIEW_SIZE[0], self.TRACK_PREVIEW_SIZE[1], fill="#e8e8e3", outline="#e8e8e3")
 
-        # Cache image so it's not garbage collected
-        self._track_preview = ImageTk.PhotoImage(track_preview)
-
         # Write to canvas
-        self.canvas.create_image(self.TRACK_PREVIEW_SIZE[0]/2, self.TRACK_PREVIEW_SIZE[1]/2, image=self._track_preview, anchor=CENTER)
+        self._track_preview = None
+        self._preview_item = self.canvas.create_image(self.TRACK_PREVIEW_SIZE[0]/2, self.TRACK_PREVIEW_SIZE[1]/2, anchor=CENTER)
         self.canvas.pack(side=LEFT, padx=(0, 4), pady=(0, 1))
+        self.set_preview(track_preview)
 
         # Track Name
         self._title_lb = WrappingLabel(self, text=track_name)
         self._title_lb.pack(side=TOP, fill=X, padx=(0, 2), pady=0)
 
+    def set_title(self, track_name: str) -> None:
+        """ Sets the track name shown in the frame """
+        self._title_lb.config(text=track_name)
+
+    def set_preview(self, track_preview: Image.Image) -> None:
+        """ Sets the preview image shown in the frame """
+        # Cache image so it's not garbage collected
+        self._track_preview = ImageTk.PhotoImage(track_preview)
+        self.canvas.itemconfigure(self._preview_item, image=self._track_preview)
+
 
 class MK8TrackFrameSmall(MK8TrackFrameBase):
     """ A small variant of a framed track """
@@ -60,25 +70,43 @@ class MK8TrackFrameBig(MK8TrackFrameBase):
         self._sep.pack(fill=X, padx=4, pady=(2, 0))
 
         # Track author
-        author_text = track_author
-        author_lb = Label(self, text=author_text, font=self.ITALICS_FONT)
-        author_lb.pack(side=LEFT)
+        self._author_lb = Label(self, font=self.ITALICS_FONT)
+        self._author_lb.pack(side=LEFT)
 
         # URL
-        self._url_icon = ImageTk.PhotoImage(url_icon)
-        mod_id_lb = Label(self, text=f" {url_text}", image=self._url_icon, compound=LEFT, cursor="hand2", fg="blue")
-        mod_id_lb.place(relx=0.5, rely=0.5, anchor=CENTER)
-        mod_id_lb.pack(side=RIGHT)
+        self._url_icon = None
+        self._url_link = None
+        self._url_lb = Label(self, compound=LEFT, cursor="hand2", fg="blue")
+        self._url_lb.place(relx=0.5, rely=0.5, anchor=CENTER)
+        self._url_lb.pack(side=RIGHT)
 
         # Tooltip and URL
-        site_url = url_link
-        mod_id_lb.bind("<Button-1>",
-            lambda e, site_url=site_url: webbrowser.open(site_url)
-        )
-        Hovertip(mod_id_lb, url_tooltip, hover_delay=1000)
+        self._url_lb.bind("<Button-1>", lambda e: webbrowser.open(self._url_link))
+        self._url_tooltip = Hovertip(self._url_lb, url_tooltip, hover_delay=1000)
+
+        self.set_author(track_author)
+        self.set_url(url_text, url_icon, url_link, url_tooltip)
 
-        self._widgets: list[Widget] = [self, self._title_lb, author_lb, mod_id_lb]
-        self._default_color = author_lb.cget("background") # System background (SystemButtonFace on Windows/MacOS)
+        self._widgets: list[Widget] = [self, self._title_lb, self._author_lb, self._url_lb]
+        self._default_color = self._author_lb.cget("background") # System background (SystemButtonFace on Windows/MacOS)
+
+    def set_author(self, track_author: str) -> None:
+        """ Sets the track author shown in the frame """
+        self._author_lb.config(text=track_author)
+
+    def set_url(self, url_text: str, url_icon: Image.Image, url_link: str, url_tooltip: str) -> None:
+        """ Sets the link shown in the frame, and where it leads """
+        self._url_icon = ImageTk.PhotoImage(url_icon)
+        self._url_lb.config(text=f" {url_text}", image=self._url_icon)
+        self._url_link = url_link
+        self._url_tooltip.text = url_tooltip
+
+    def set_track(self, track_name: str, track_preview: Image.Image, track_author: str, url_text: str, url_icon: Image.Image, url_link: str, url_tooltip: str) -> None:
+        """ Shows another track in the frame. Takes the same arguments as creating a frame """
+        self.set_title(track_name)
+        self.set_preview(track_preview)
+        self.set_author(track_author)
+        self.set_url(url_text, url_icon, url_link, url_tooltip)
 
     def set_color(self, background: str|None):
         """ Sets the background colour of the frame. """
@@ -93,27 +121,3 @@ class MK8TrackFrameBig(MK8TrackFrameBase):
         # Color widgets
         for widget in self._widgets:
             widget.configure(background=background)
-
-
-
-class FramableTrack(ABC):
-    """ Abstract class to make a track a FramableTrack """
-    TRACK_PREVIEW_SIZE: tuple[int, int] = (96, 54)
-
-    _sort_field_name: str = None
-
-    @property
-    def sort_field(self) -> str:
-        """ The name of the class's field that should be used for sorting and searching purposes """
-        return getattr(self, self._sort_field_name)
-
-    @abstractmethod
-    def frame(self, master: Toplevel, *args, **kwargs) -> MK8TrackFrameBig:
-        """ Creates a big frame with information about this track. """
-
-class MiniFramableTrack(FramableTrack, ABC):
-    """ Abstract class to make a track a FramableTrack that also supports a small variant. """
-    @abstractmethod
-    def miniframe(self, master: Toplevel, *args, **kwargs) -> MK8TrackFrameSmall:
-        """ Creates a small frame with information about this track. """
-
@@ -0,0 +1,158 @@
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from poltergust.models.ct_storage import MK8CTStorage
+from poltergust.models.mod_sites import MK8APIModSite
+from poltergust.parsers.downloader import PoltergustDownloader
+
+
+class StubModSiteHandler(BaseHTTPRequestHandler):
+    """ Serves mods named after their id, slowly enough for requests to overlap """
+    protocol_version = "HTTP/1.1"
+    server: "StubModSiteServer"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+            self.server.connections.add(self.client_address)
+        try:
+            time.sleep(self.server.delay)
+            url = urlparse(self.path)
+            mod_ids = parse_qs(url.query)['ids'][0].split(",")
+            if url.path == "/mod":
+                body = {'name': f"Mod {mod_ids[0]}"}
+            else:
+                # Batch responses leave out mods the site does not know
+                body = {mod_id: {'name': f"Mod {mod_id}"} for mod_id in mod_ids if mod_id not in self.server.missing_from_batches}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+class StubModSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubModSiteHandler)
+        self.lock = threading.Lock()
+        self.delay = 0.05
+        self.active = 0
+        self.max_active = 0
+        self.connections = set()
+        self.missing_from_batches = set()
+
+class StubModSite(MK8APIModSite):
+    """ Mod site served by a `StubModSiteServer` """
+    id = 100
+    name = "Stub"
+    domain = "http://127.0.0.1/"
+    icon = None
+
+    def __init__(self, url: str, batch_size: int = 1):
+        self.url = url
+        self.batch_size = batch_size
+
+    def get_api_endpoint(self, identifier: str) -> str:
+        return f"{self.url}/mod?ids={identifier}"
+
+    def get_batch_api_endpoint(self, mod_ids: list[str]) -> str|None:
+        return f"{self.url}/batch?ids={','.join(mod_ids)}"
+
+    def split_batch_json(self, mod_ids: list[str], json_res: dict|list) -> dict[str, dict]:
+        return {mod_id: json_res[mod_id] for mod_id in mod_ids if mod_id in json_res}
+
+    def validate(self, clean_json: dict) -> None:
+        pass
+
+    def get_mod_id(self, identifier: str, clean_json: dict) -> int:
+        return int(identifier)
+
+    def get_mod_name(self, clean_json: dict) -> str:
+        return clean_json['name']
+
+    def get_mod_author(self, clean_json: dict) -> str:
+        return None
+
+    def get_mod_preview_image(self, clean_json: dict) -> str:
+        return None
+
+class PoltergustDownloaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The database (with the HTTP cache) is created in the working directory
+        cls._cwd = os.getcwd()
+        cls._cache_dir = tempfile.TemporaryDirectory()
+        os.chdir(cls._cache_dir.name)
+        MK8CTStorage()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls._cwd)
+        MK8CTStorage().connection.close()
+        cls._cache_dir.cleanup()
+
+    def setUp(self):
+        self.server = StubModSiteServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        # Never use previous downloads, so every mod is requested
+        self.downloader = PoltergustDownloader(cache_ttl=timedelta(0))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_download_many_keeps_order(self):
+        """ Results are returned in the given order, also for duplicates and mods downloaded in batches """
+        site = StubModSite(self.url)
+        batch_site = StubModSite(self.url, batch_size=3)
+        batch_site.id = 101
+        self.server.missing_from_batches.add("8")
+        mods = [(site, "5"), (batch_site, "7"), (site, "3"), (batch_site, "8"), (site, "5"), (batch_site, "1"), (batch_site, "4"), (site, "9")]
+
+        # Both sites are served from the same host, which the session keeps `MAX_REQUESTS_PER_SITE` connections to
+        results = self.downloader.download_many(mods, max_workers=PoltergustDownloader.MAX_REQUESTS_PER_SITE)
+
+        self.assertEqual([mod.name for mod in results], [f"Mod {identifier}" for _, identifier in mods])
+        self.assertEqual([mod.mod_site.id for mod in results], [site.id for site, _ in mods])
+
+    def test_requests_per_site_are_bounded(self):
+        """ No more than `MAX_REQUESTS_PER_SITE` requests to a single site run at once """
+        site = StubModSite(self.url)
+        self.server.delay = 0.1
+        mods = [(site, str(mod_id)) for mod_id in range(1, 3 * PoltergustDownloader.MAX_REQUESTS_PER_SITE + 1)]
+
+        results = self.downloader.download_many(mods, max_workers=len(mods))
+
+        self.assertEqual(len(results), len(mods))
+        self.assertLessEqual(self.server.max_active, PoltergustDownloader.MAX_REQUESTS_PER_SITE)
+        self.assertGreater(self.server.max_active, 1)
+
+    def test_session_is_reused(self):
+        """ All downloaders share a session, which keeps connections to a site open """
+        self.assertIs(PoltergustDownloader().get_session(), self.downloader.get_session())
+
+        site = StubModSite(self.url)
+        mods = [(site, str(mod_id)) for mod_id in range(1, 5 * PoltergustDownloader.MAX_REQUESTS_PER_SITE + 1)]
+        self.downloader.download_many(mods)
+
+        self.assertLessEqual(len(self.server.connections), PoltergustDownloader.MAX_REQUESTS_PER_SITE)
+
+if __name__ == "__main__":
+    unittest.main()